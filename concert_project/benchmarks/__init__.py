@@ -0,0 +1,16 @@
+"""
+Reproducible benchmarks for the public API.
+
+Use a throwaway SQLite database so the synthetic rows never mix with real ones:
+
+    export SQLITE_PATH=bench.sqlite3
+    python manage.py migrate
+    python manage.py benchmark_seed --venues 50000 --users 500
+    python manage.py benchmark --output before.json
+
+``benchmark`` drives the views in-process through Django's test client, with
+exact query counts. ``--url http://127.0.0.1:8000`` runs the same scenarios
+against a local server started on that database (``runserver`` or gunicorn);
+query counts then come from the Server-Timing header when PERF_SERVER_TIMING
+is on. ``--compare before.json`` prints the latency change per scenario.
+"""
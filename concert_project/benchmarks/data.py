@@ -0,0 +1,139 @@
+# data.py
+"""
+Synthetic data for the benchmarks: venues spread around Romanian cities the
+way real ones are (dense centres, a thin scatter in between), lookups,
+moods and users. The same seed always produces the same rows.
+"""
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from clubs.geo import cell_for
+from clubs.models import Activities, EventType, Genre, PinType, PointColor, PriceCategory
+from clubs.search import index_activities
+from users.models import Genre as UserGenre, Mood, UserProfile
+
+PASSWORD = 'bench-password'
+USERNAME_PREFIX = 'bench'
+
+# name, latitude, longitude, share of the venues
+CITIES = [
+    ('București', 44.4268, 26.1025, 0.40),
+    ('Cluj-Napoca', 46.7712, 23.6236, 0.12),
+    ('Timișoara', 45.7489, 21.2087, 0.09),
+    ('Iași', 47.1585, 27.6014, 0.09),
+    ('Constanța', 44.1598, 28.6348, 0.08),
+    ('Brașov', 45.6427, 25.5887, 0.08),
+    ('Sibiu', 45.7983, 24.1256, 0.05),
+    ('Oradea', 47.0465, 21.9189, 0.04),
+]
+# The rest fall anywhere in the country
+ROMANIA_BBOX = (20.3, 43.7, 29.6, 48.2)
+CITY_SPREAD_DEG = 0.035
+
+GENRES = ['Techno', 'House', 'Jazz', 'Rock', 'Manele', 'Hip-Hop', 'Folk', 'Pop', 'Drum & Bass', 'Clasică']
+EVENT_TYPES = ['Party', 'Concert', 'Stand-up', 'Karaoke', 'Quiz', 'DJ set']
+PRICE_CATEGORIES = ['$', '$$', '$$$', '$$$$']
+PIN_TYPES = [('Club', 'Roșu'), ('Bar', 'Albastru'), ('Pub', 'Verde'), ('Terasă', 'Galben'), ('Cafenea', 'Mov')]
+MOODS = ['Chill', 'Party', 'Romantic', 'Aventură', 'Relaxat']
+
+NAME_PREFIXES = ['Club', 'Bar', 'Pub', 'Grădina', 'Terasa', 'Bistro', 'Lounge', 'Cafeneaua', 'Berăria']
+NAME_WORDS = ['Luna', 'Ștefan', 'Centrală', 'Verde', 'Boema', 'Nordului', 'Dunărea', 'Tei', 'Fabrica', 'Jazz',
+              'Vinyl', 'Amurg', 'Pădurea', 'Orizont', 'Mahala', 'Carusel', 'Lumina', 'Clandestin']
+STREETS = ['Str. Lipscani', 'Bd. Unirii', 'Str. Memorandumului', 'Calea Victoriei', 'Str. Republicii',
+           'Piața Sfatului', 'Str. Mihai Viteazu', 'Bd. Tomis', 'Str. Ștefan cel Mare']
+DESCRIPTION_WORDS = ['muzică', 'live', 'cocktailuri', 'grădină', 'terasă', 'bere', 'artizanală', 'dans',
+                     'concert', 'atmosferă', 'relaxată', 'vinuri', 'seară', 'prieteni', 'noapte', 'DJ']
+
+
+def _lookups(model, names):
+    existing = {obj.name: obj for obj in model.objects.filter(name__in=names)}
+    missing = [model(name=name) for name in names if name not in existing]
+    for obj in model.objects.bulk_create(missing):
+        existing[obj.name] = obj
+    return [existing[name] for name in names]
+
+
+def _pin_types():
+    pin_types = []
+    for name, color_name in PIN_TYPES:
+        color = PointColor.objects.filter(name=color_name).first() or PointColor.objects.create(name=color_name)
+        pin_type = PinType.objects.filter(name=name).first() or PinType.objects.create(name=name, color=color)
+        pin_types.append(pin_type)
+    return pin_types
+
+
+def _position(rng):
+    shares = [share for *_, share in CITIES]
+    if rng.random() < 1 - sum(shares):
+        min_lng, min_lat, max_lng, max_lat = ROMANIA_BBOX
+        return None, rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)
+    name, lat, lng, _ = rng.choices(CITIES, weights=shares)[0]
+    # Gaussian around the centre, the way venues cluster in old towns
+    return name, rng.gauss(lat, CITY_SPREAD_DEG), rng.gauss(lng, CITY_SPREAD_DEG * 1.4)
+
+
+def _venue(rng, number, lookups):
+    city, lat, lng = _position(rng)
+    words = rng.sample(DESCRIPTION_WORDS, 8)
+    return Activities(
+        name=f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_WORDS)} {number}",
+        description=' '.join(words),
+        mood=rng.choice(MOODS),
+        event=rng.choice(EVENT_TYPES) if rng.random() < 0.3 else None,
+        address=f"{rng.choice(STREETS)} {rng.randint(1, 200)}",
+        city=city,
+        latitude=lat,
+        longitude=lng,
+        geocell=cell_for(lat, lng),
+        type=rng.choice(lookups['pin_types']),
+        genre=rng.choice(lookups['genres']),
+        event_type=rng.choice(lookups['event_types']),
+        price_category=rng.choice(lookups['price_categories']),
+        live=rng.random() < 0.2,
+        is_active=rng.random() < 0.95,
+    )
+
+
+def generate(venues=10000, users=200, seed=0, batch_size=2000):
+    """Create the venues and users; returns how many of each were added."""
+    rng = random.Random(seed)
+    with transaction.atomic():
+        lookups = {
+            'pin_types': _pin_types(),
+            'genres': _lookups(Genre, GENRES),
+            'event_types': _lookups(EventType, EVENT_TYPES),
+            'price_categories': _lookups(PriceCategory, PRICE_CATEGORIES),
+        }
+        moods = _lookups(Mood, MOODS)
+        user_genres = _lookups(UserGenre, GENRES)
+
+    # Bulk writes skip save(): geocell is set above, the search index below
+    start = Activities.objects.count()
+    for offset in range(0, venues, batch_size):
+        with transaction.atomic():
+            batch = [_venue(rng, start + offset + i, lookups) for i in range(min(batch_size, venues - offset))]
+            created = Activities.objects.bulk_create(batch)
+            index_activities([venue.pk for venue in created])
+
+    # Hash once: PBKDF2 per user would take longer than everything else
+    password = make_password(PASSWORD)
+    taken = set(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('username', flat=True))
+    new_users = [
+        User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password)
+        for i in range(users) if f'{USERNAME_PREFIX}{i}' not in taken
+    ]
+    with transaction.atomic():
+        created_users = User.objects.bulk_create(new_users, batch_size=batch_size)
+        profiles = UserProfile.objects.bulk_create([
+            UserProfile(user=user, nickname=user.username, mood_for_tonight=rng.choice(moods))
+            for user in created_users
+        ], batch_size=batch_size)
+        through = UserProfile.favorite_genres.through
+        through.objects.bulk_create([
+            through(userprofile_id=profile.pk, genre_id=genre.pk)
+            for profile in profiles for genre in rng.sample(user_genres, 3)
+        ], batch_size=batch_size)
+    return {'venues': venues, 'users': len(created_users)}
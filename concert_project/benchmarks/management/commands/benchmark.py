@@ -0,0 +1,82 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from benchmarks.runner import SCENARIOS, HttpClient, InProcessClient, compare, load_fixture, run_scenario
+from clubs.models import Activities
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Time the public API scenarios and report throughput, latency percentiles and query counts as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Benchmark a running server instead of calling the views in-process.")
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help="Only these scenarios (repeatable). Default: all.")
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--users', type=int, default=200, help="How many seeded users log in.")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+        parser.add_argument('--compare', help="A previous report to print latency changes against.")
+
+    def handle(self, *args, **options):
+        known = {scenario.name: scenario for scenario in SCENARIOS}
+        names = options['scenarios'] or list(known)
+        unknown = set(names) - set(known)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Known: {', '.join(known)}")
+
+        url = options['url']
+        make_client = (lambda: HttpClient(url)) if url else InProcessClient
+        # The test client talks to the 'testserver' host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            fixture = load_fixture(make_client(), options['users'])
+            results = {}
+            for name in names:
+                self.stderr.write(f"{name}...")
+                results[name] = run_scenario(
+                    known[name], make_client, fixture, options['iterations'],
+                    concurrency=options['concurrency'], warmup=options['warmup'],
+                )
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'target': url or 'in-process',
+                'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+                'venues': None if url else Activities.objects.count(),
+                'iterations': options['iterations'],
+                'concurrency': options['concurrency'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'scenarios': results,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                for line in compare(json.load(baseline), report):
+                    self.stderr.write(line)
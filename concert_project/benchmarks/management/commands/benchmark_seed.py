@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks.data import generate
+
+
+class Command(BaseCommand):
+    help = "Add synthetic venues and users for the benchmarks (use a throwaway SQLITE_PATH)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venues', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        created = generate(venues=options['venues'], users=options['users'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(f"Added {created['venues']} venues and {created['users']} users."))
@@ -0,0 +1,248 @@
+# runner.py
+"""
+Scenarios and the loop that times them.
+
+A scenario is one kind of request; its path and body may depend on the
+iteration number and on the lookup ids fetched once through the API, so
+every run against the same data issues the same requests. Each worker
+thread has its own client (and its own session when authenticated) and
+runs its share of the iterations; latencies are collected per request and
+summarised as throughput and p50/p95/p99.
+"""
+import re
+import statistics
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .data import PASSWORD, USERNAME_PREFIX
+
+SEARCH_TERMS = ['gradina', 'club luna', 'terasa', 'bere', 'jazz', 'stefan']
+# (min_lng, min_lat, max_lng, max_lat) of central Bucharest and Cluj
+BBOXES = ['26.05,44.40,26.15,44.46', '23.55,46.74,23.68,46.80']
+SERVER_TIMING_QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: object  # str, or callable(fixture, i) -> str
+    data: object = None  # dict, or callable(fixture, i) -> dict
+    authenticated: bool = False
+    form: bool = False  # send data as a form instead of JSON
+
+    def request(self, fixture, i):
+        path = self.path(fixture, i) if callable(self.path) else self.path
+        data = self.data(fixture, i) if callable(self.data) else self.data
+        return self.method, path, data, self.form
+
+
+def _pick(fixture, key, i):
+    values = fixture[key]
+    return values[i % len(values)]
+
+
+def _registration(fixture, i):
+    name = f"reg-{uuid.uuid4().hex[:12]}"
+    return {
+        'email': f'{name}@example.com',
+        'username': name,
+        'password': 'Secret123!',
+        'nickname': name,
+        'birth_date': '1995-05-05',
+        'mood_for_tonight': _pick(fixture, 'moods', i),
+        'favorite_genres': fixture['user_genres'][:3],
+    }
+
+
+SCENARIOS = [
+    Scenario('activities-list', 'get', '/api/activities/'),
+    Scenario('activities-filter', 'get', lambda f, i: (
+        f"/api/activities/?genre={_pick(f, 'genres', i)}&event_type={_pick(f, 'event_types', i // 3)}"
+    )),
+    Scenario('activities-nearby', 'get', lambda f, i: (
+        f"/api/activities/?lat={44.43 + (i % 10) * 0.01}&lng=26.10&radius_km=3"
+    )),
+    Scenario('activities-bbox', 'get', lambda f, i: f"/api/activities/?bbox={BBOXES[i % len(BBOXES)]}"),
+    Scenario('activities-search', 'get', lambda f, i: f"/api/activities/?q={SEARCH_TERMS[i % len(SEARCH_TERMS)]}"),
+    # map_pins always returns every live venue; viewport queries go to the clusters endpoint
+    Scenario('activities-pins', 'get', '/api/activities/pins/'),
+    Scenario('activities-clusters', 'get', lambda f, i: (
+        f"/api/activities/clusters/?zoom={12 + i % 4}&bbox={BBOXES[i % len(BBOXES)]}"
+    )),
+    Scenario('genres', 'get', '/api/genres/'),
+    Scenario('event-types', 'get', '/api/event-types/'),
+    Scenario('price-categories', 'get', '/api/price-categories/'),
+    Scenario('moods', 'get', '/api/moods/'),
+    Scenario('login', 'post', '/api/auth/login/', lambda f, i: {
+        'username': _pick(f, 'usernames', i), 'password': PASSWORD,
+    }),
+    Scenario('profile-me', 'get', '/api/auth/profile-me/', authenticated=True),
+    Scenario('register', 'post', '/api/auth/register/', _registration, form=True),
+]
+
+
+class InProcessClient:
+    """Django's test client: no network, exact query counts."""
+    target = 'in-process'
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None, form=False):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if method == 'post' and form:
+                response = self.client.post(path, data)
+            elif method == 'post':
+                response = self.client.post(path, data, content_type='application/json')
+            else:
+                response = self.client.get(path)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(queries), response
+
+    def json(self, response):
+        return response.json()
+
+    def close(self):
+        # Worker threads open their own connections; leave the caller's alone
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+class HttpClient:
+    """A running server; query counts come from its Server-Timing header, if sent."""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.target = base_url
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None, form=False):
+        body = {'data': data} if form else {'json': data}
+        start = time.perf_counter()
+        response = self.session.request(method, self.base_url + path, timeout=30, **body)
+        elapsed = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+        return response.status_code, elapsed, int(match.group(1)) if match else None, response
+
+    def json(self, response):
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+def _ids(client, path):
+    _, _, _, response = client.request('get', path)
+    body = client.json(response)
+    items = body['results'] if isinstance(body, dict) else body
+    return [item['id'] for item in items]
+
+
+def load_fixture(client, users):
+    """Ids as the API serves them, so the scenarios work in both modes."""
+    # /api/genres/ lists the profile genres; venue filters need the venue ones
+    _, _, _, response = client.request('get', '/api/activities/?page_size=100')
+    venues = client.json(response)['results']
+
+    def venue_ids(key):
+        return sorted({venue[key]['id'] for venue in venues if venue[key]}) or [0]
+
+    return {
+        'genres': venue_ids('genre'),
+        'event_types': venue_ids('event_type'),
+        'moods': _ids(client, '/api/moods/'),
+        'user_genres': _ids(client, '/api/genres/'),
+        'usernames': [f'{USERNAME_PREFIX}{i}' for i in range(max(users, 1))],
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def summarise(latencies, queries, errors, wall):
+    latencies = sorted(latencies)
+    counted = [q for q in queries if q is not None]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'latency_ms': {
+            'mean': _ms(statistics.fmean(latencies)) if latencies else None,
+            'p50': _ms(percentile(latencies, 0.50)),
+            'p95': _ms(percentile(latencies, 0.95)),
+            'p99': _ms(percentile(latencies, 0.99)),
+            'max': _ms(latencies[-1] if latencies else None),
+        },
+        'queries': {
+            'mean': round(statistics.fmean(counted), 2) if counted else None,
+            'max': max(counted) if counted else None,
+        },
+    }
+
+
+def run_scenario(scenario, make_client, fixture, iterations, concurrency=1, warmup=3):
+    latencies, queries, errors = [], [], [0]
+    lock = threading.Lock()
+
+    def worker(offset):
+        client = make_client()
+        try:
+            if scenario.authenticated:
+                credentials = {'username': _pick(fixture, 'usernames', offset), 'password': PASSWORD}
+                client.request('post', '/api/auth/login/', credentials)
+            for i in range(warmup):
+                client.request(*scenario.request(fixture, i))
+            for i in range(offset, iterations, concurrency):
+                status, elapsed, count, _ = client.request(*scenario.request(fixture, i))
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(count)
+                    if status >= 400:
+                        errors[0] += 1
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker(0)
+    else:
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarise(latencies, queries, errors[0], time.perf_counter() - start)
+
+
+def compare(baseline, current):
+    """Lines describing how each scenario's p50/p95 moved against a baseline report."""
+    lines = []
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50', 'p95'):
+            old, new = before['latency_ms'][key], result['latency_ms'][key]
+            if old and new:
+                changes.append(f"{key} {old:.1f} -> {new:.1f} ms ({(new - old) / old:+.0%})")
+        lines.append(f"{name}: {', '.join(changes)}")
+    return lines
@@ -0,0 +1,28 @@
+from django.test import TestCase
+
+from clubs.models import Activities
+from users.models import UserProfile
+from .data import generate
+from .runner import SCENARIOS, InProcessClient, load_fixture, run_scenario
+
+
+class BenchmarkSmokeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(venues=300, users=3, seed=1)
+
+    def test_generated_venues_are_located(self):
+        self.assertEqual(Activities.objects.count(), 300)
+        self.assertFalse(Activities.objects.filter(geocell__isnull=True).exists())
+        self.assertEqual(UserProfile.objects.filter(user__username__startswith='bench').count(), 3)
+
+    def test_every_scenario_runs_without_errors(self):
+        fixture = load_fixture(InProcessClient(), users=3)
+        for scenario in SCENARIOS:
+            if scenario.name in ('login', 'register'):
+                continue  # dominated by password hashing; covered by the users tests
+            with self.subTest(scenario=scenario.name):
+                result = run_scenario(scenario, InProcessClient, fixture, iterations=3, warmup=0)
+                self.assertEqual((result['requests'], result['errors']), (3, 0))
+                self.assertIsNotNone(result['latency_ms']['p95'])
+                self.assertIsNotNone(result['queries']['max'])
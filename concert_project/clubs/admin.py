@@ -1,19 +1,55 @@
+from copy import copy
+
 from django.contrib import admin
 from import_export import resources, fields
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from import_export.widgets import ForeignKeyWidget
 from import_export.admin import ImportExportModelAdmin
+from import_export.instance_loaders import CachedInstanceLoader
 from .models import (
     PointColor,
     PinType,
     Activities,
     Genre,
     EventType,
-    PriceCategory
+    PriceCategory,
+    ShortLinkCache
 )
-from .utils import get_google_maps_data
+from .utils import is_short_link, parse_google_maps_url, apply_google_maps_data
+from .enrichment import needs_enrichment, queue_enrichment
+from .geo import cell_for
+from .search import index_activities
+from .clusters import venues_changed
+from .tiles import venues_moved
+from .push import publish_venue_states, venue_state
 
 # ✅ Resources for import-export
 
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """ForeignKeyWidget that loads the whole lookup table once per import instead of once per row."""
+
+    def __init__(self, model, field='pk', **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.instances = None
+
+    def reset(self):
+        self.instances = None
+
+    def clean(self, value, row=None, **kwargs):
+        if not value:
+            return None
+        if self.instances is None:
+            self.instances = {}
+            for instance in self.get_queryset(value, row, **kwargs).order_by('pk'):
+                self.instances.setdefault(str(getattr(instance, self.field)), instance)
+        try:
+            return self.instances[str(value)]
+        except KeyError:
+            raise self.model.DoesNotExist(f"{self.model.__name__} with {self.field}={value!r} does not exist")
+
 class PointColorResource(resources.ModelResource):
     class Meta:
         model = PointColor
@@ -22,22 +58,22 @@ class ActivitiesResource(resources.ModelResource):
     type = fields.Field(
         attribute='type',
         column_name='Type',
-        widget=ForeignKeyWidget(PinType, 'name')
+        widget=CachedForeignKeyWidget(PinType, 'name')
     )
     genre = fields.Field(
         attribute='genre',
         column_name='Genre',
-        widget=ForeignKeyWidget(Genre, 'name')
+        widget=CachedForeignKeyWidget(Genre, 'name')
     )
     event_type = fields.Field(
         attribute='event_type',
         column_name='Event Type',
-        widget=ForeignKeyWidget(EventType, 'name')
+        widget=CachedForeignKeyWidget(EventType, 'name')
     )
     price_category = fields.Field(
         attribute='price_category',
         column_name='Price Category',
-        widget=ForeignKeyWidget(PriceCategory, 'name')
+        widget=CachedForeignKeyWidget(PriceCategory, 'name')
     )
 
     class Meta:
@@ -69,22 +105,132 @@ class ActivitiesResource(resources.ModelResource):
         )
         export_order = fields
 
-    def before_import_row(self, row, row_number=None, **kwargs):
-        instance = kwargs.get('instance')
-
-        if instance and instance.url_address and (not instance.latitude or not instance.longitude):
-            data = get_google_maps_data(instance.url_address)
-            if data:
-                if not instance.name and data.get('name'):
-                    instance.name = data['name']
-                if not instance.address and data.get('address'):
-                    instance.address = data['address']
-                if not instance.city and data.get('city'):
-                    instance.city = data['city']
-                if not instance.latitude and data.get('latitude'):
-                    instance.latitude = data['latitude']
-                if not instance.longitude and data.get('longitude'):
-                    instance.longitude = data['longitude']
+    def before_save_instance(self, instance, row, **kwargs):
+        # Full Google Maps URLs carry their data: parse inline, no network
+        if instance.url_address and not is_short_link(instance.url_address):
+            apply_google_maps_data(instance, parse_google_maps_url(instance.url_address))
+
+    def before_import(self, dataset, **kwargs):
+        self.pending_enrichment = []
+        for field in self.fields.values():
+            if isinstance(field.widget, CachedForeignKeyWidget):
+                field.widget.reset()
+
+    def after_save_instance(self, instance, row, **kwargs):
+        if not kwargs.get('dry_run') and needs_enrichment(instance):
+            self.pending_enrichment.append(instance)
+
+    def after_import(self, dataset, result, **kwargs):
+        # Short links are resolved in the background after the import commits
+        queue_enrichment(instance.pk for instance in self.pending_enrichment if instance.pk)
+
+class ActivitiesBulkResource(ActivitiesResource):
+    """
+    High-throughput import: existing rows are loaded in one query, rows are
+    validated in memory and written with bulk_create/bulk_update in batches.
+    Set ``collect_diff`` to record per-row field changes in ``diff_report``.
+    Pass ``batch_size`` to override Meta.batch_size for this instance only.
+    """
+    collect_diff = False
+
+    def __init__(self, batch_size=None, **kwargs):
+        super().__init__(**kwargs)
+        if batch_size is not None:
+            # _meta is shared by every instance of the class: give this one its own copy
+            self._meta = copy(self._meta)
+            self._meta.batch_size = batch_size
+
+    class Meta(ActivitiesResource.Meta):
+        name = "Activities (bulk)"
+        use_bulk = True
+        batch_size = settings.ACTIVITIES_IMPORT_BATCH_SIZE
+        skip_diff = True
+        instance_loader_class = CachedInstanceLoader
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self.diff_report = []
+        self.saved = []
+        self.now = timezone.now()
+        self.columns = set(dataset.headers or [])
+
+    def import_instance(self, instance, row, **kwargs):
+        if not self.collect_diff:
+            return super().import_instance(instance, row, **kwargs)
+        # Compare attnames (type_id, not type) so diffing never touches the database
+        attnames = {
+            name: Activities._meta.get_field(field.attribute).attname
+            for name, field in self.fields.items()
+            if field.attribute and name != 'id'
+        }
+        before = {name: getattr(instance, attname) for name, attname in attnames.items()}
+        super().import_instance(instance, row, **kwargs)
+        changes = {}
+        for name, attname in attnames.items():
+            new = getattr(instance, attname)
+            if new != before[name]:
+                changes[name] = (before[name], new)
+        self.diff_report.append({
+            'row': kwargs.get('row_number'),
+            'id': instance.pk,
+            'new': instance._state.adding,
+            'changes': changes,
+        })
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        # bulk writes bypass Activities.save(): keep the derived columns in step by hand
+        instance.geocell = cell_for(instance.latitude, instance.longitude)
+        if instance._state.adding:
+            instance.version += 1
+        else:
+            instance.updated_at = self.now
+
+    def after_save_instance(self, instance, row, **kwargs):
+        super().after_save_instance(instance, row, **kwargs)
+        if not kwargs.get('dry_run'):
+            self.saved.append(instance)
+
+    def after_import(self, dataset, result, **kwargs):
+        # bulk writes send no post_save: index the batch for search in one pass
+        saved = [instance for instance in self.saved if instance.pk]
+        index_activities(instance.pk for instance in saved)
+        venues_changed(instance.pk for instance in saved)
+        venues_moved(saved)
+        publish_venue_states(venue_state(instance) for instance in saved)
+        super().after_import(dataset, result, **kwargs)
+
+    def get_bulk_update_fields(self):
+        # Only the columns this file carries: the rest of a loaded row may be stale by now
+        # (e.g. live flipped by a status write), and version is bumped in SQL below
+        names = [
+            name for name in super().get_bulk_update_fields()
+            if self.fields[name].column_name in self.columns or name == 'updated_at'
+        ]
+        if {'latitude', 'longitude'} <= self.columns:
+            names.append('geocell')
+        return names
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        if self.update_instances and (using_transactions or not dry_run):
+            try:
+                with transaction.atomic():
+                    Activities.objects.bulk_update(
+                        self.update_instances, self.get_bulk_update_fields(), batch_size=batch_size,
+                    )
+                    self.bump_versions(self.update_instances)
+            except Exception as e:
+                self.handle_import_error(result, e, raise_errors)
+            finally:
+                self.update_instances.clear()
+
+    @staticmethod
+    def bump_versions(instances):
+        rows = Activities.objects.filter(pk__in=[instance.pk for instance in instances])
+        rows.update(version=F('version') + 1)
+        versions = dict(rows.values_list('id', 'version'))
+        for instance in instances:
+            instance.version = versions.get(instance.pk, instance.version)
 
 # ✅ PointColor Admin (Import-Export enabled)
 @admin.register(PointColor)
@@ -104,7 +250,7 @@ class PinTypeAdmin(admin.ModelAdmin):
 # ✅ Activities Admin (Import-Export enabled, autocomplete PinType)
 @admin.register(Activities)
 class ActivitiesAdmin(ImportExportModelAdmin):
-    resource_class = ActivitiesResource
+    resource_classes = [ActivitiesResource, ActivitiesBulkResource]
     autocomplete_fields = ('type', 'genre', 'event_type', 'price_category')
     list_display = ('name', 'type', 'genre', 'event_type', 'price_category', 'address', 'city', 'phone', 'live', 'is_active', 'created_at')
     list_filter = ('is_active', 'live', 'type', 'genre', 'event_type', 'price_category')
@@ -128,20 +274,12 @@ class ActivitiesAdmin(ImportExportModelAdmin):
 
     # Auto-fill from Google Maps url_address
     def save_model(self, request, obj, form, change):
-        if obj.url_address:
-            data = get_google_maps_data(obj.url_address)
-            if data:
-                if not obj.name and data.get('name'):
-                    obj.name = data['name']
-                if not obj.address and data.get('address'):
-                    obj.address = data['address']
-                if not obj.city and data.get('city'):
-                    obj.city = data['city']
-                if not obj.latitude and data.get('latitude'):
-                    obj.latitude = data['latitude']
-                if not obj.longitude and data.get('longitude'):
-                    obj.longitude = data['longitude']
+        if obj.url_address and not is_short_link(obj.url_address):
+            apply_google_maps_data(obj, parse_google_maps_url(obj.url_address))
         super().save_model(request, obj, form, change)
+        # Short links need a network round trip: resolve them in the background
+        if needs_enrichment(obj):
+            queue_enrichment([obj.pk])
 
 # ✅ Genre Admin
 @admin.register(Genre)
@@ -160,3 +298,11 @@ class EventTypeAdmin(admin.ModelAdmin):
 class PriceCategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
+
+# ✅ Short-link cache (read-only, for monitoring hit counts and failures)
+@admin.register(ShortLinkCache)
+class ShortLinkCacheAdmin(admin.ModelAdmin):
+    list_display = ('url', 'ok', 'name', 'latitude', 'longitude', 'hits', 'fetched_at', 'expires_at')
+    list_filter = ('ok',)
+    search_fields = ('url', 'resolved_url', 'name')
+    readonly_fields = [field.name for field in ShortLinkCache._meta.fields]
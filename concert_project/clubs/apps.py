@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ClubsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clubs'
+
+    def ready(self):
+        import clubs.signals  # import signals
+        from concert_project.metrics import register_stats
+        from .utils import SHORT_LINK_CACHE_STATS
+
+        register_stats(
+            'shortlink_cache_events_total', 'Google Maps short-link cache lookups by outcome.',
+            SHORT_LINK_CACHE_STATS, 'event',
+        )
@@ -0,0 +1,394 @@
+# clusters.py
+"""
+Server-side clustering of the map pins.
+
+Each process keeps an in-memory hierarchical grid over the venues that
+map_pins serves (active and live). Zoom level z is cut into Web Mercator
+tiles, each split into CELLS_PER_TILE x CELLS_PER_TILE cells (~64 px on a
+256 px tile). A cell keeps a running aggregate: count, coordinate sums for
+the centroid, id sum (the id itself when count == 1) and pin type counts.
+Zooms past MAX_CLUSTER_ZOOM return individual pins from the finest level.
+A pan or zoom request only reads the cells inside the box: no SQL.
+
+Changes reach every process through the default cache. Each writing
+process appends the changed ids to a log of its own once the write commits:
+entry n under CHANGE_KEY(writer, n), then n itself under WRITER_KEY(writer).
+Only that process writes those keys, so no backend needs an atomic
+increment (FileBasedCache has none). The writers list their ids in
+WRITERS_KEY. A process that is behind any writer replays the ids, re-reading
+just those venues.
+
+When a log has gaps or is too long, the process rebuilds from scratch in
+the background and keeps serving its current index until the new one is
+ready. It also does this every CLUSTER_INDEX_MAX_AGE seconds, to pick up
+writes that skipped the logs. Only a process with no index at all builds
+one in the request, and concurrent requests wait for that single build.
+"""
+import math
+import os
+import time
+import uuid
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from concert_project.background import submit
+
+MAX_CLUSTER_ZOOM = 15
+MAX_ZOOM = 22
+# Cells per tile side; a power of two, so a cell's parent is one bit shift away
+CELLS_PER_TILE = 4
+
+WRITERS_KEY = 'clusters:writers'
+WRITER_KEY = 'clusters:writer:{}'
+CHANGE_KEY = 'clusters:change:{}:{}'
+REBUILD = '*'
+# Replaying more changes than this costs more than a rebuild
+MAX_REPLAY = 500
+
+
+def _project(lat, lng):
+    """Web Mercator (x, y) in [0, 1), y growing southwards."""
+    lat = min(max(lat, -85.05112878), 85.05112878)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lng + 180) / 360
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+def _finest_key(lat, lng):
+    x, y = _project(lat, lng)
+    scale = (1 << MAX_CLUSTER_ZOOM) * CELLS_PER_TILE
+    return (int(x * scale) << 32) | int(y * scale)
+
+
+def _parent(key, levels=1):
+    return ((key >> 32) >> levels << 32) | ((key & 0xFFFFFFFF) >> levels)
+
+
+def _merge(cell, count, sum_lat, sum_lng, sum_ids, types):
+    """Add an aggregate into a cell. A cell of one pin type stores just the type id."""
+    current = cell[4]
+    if isinstance(current, dict) or isinstance(types, dict) or current != types:
+        if not isinstance(current, dict):
+            current = cell[4] = {current: cell[0]}
+        for type_id, n in (types.items() if isinstance(types, dict) else [(types, count)]):
+            current[type_id] = current.get(type_id, 0) + n
+    cell[0] += count
+    cell[1] += sum_lat
+    cell[2] += sum_lng
+    cell[3] += sum_ids
+
+
+def _unmerge(cell, lat, lng, pk, type_id):
+    types = cell[4]
+    if isinstance(types, dict):
+        types[type_id] -= 1
+        if not types[type_id]:
+            del types[type_id]
+        if len(types) == 1:
+            cell[4] = next(iter(types))
+    cell[0] -= 1
+    cell[1] -= lat
+    cell[2] -= lng
+    cell[3] -= pk
+
+
+class ClusterIndex:
+    def __init__(self, pin_types, colors, positions=None):
+        self.pin_types = pin_types  # {type id: {'name', 'color'}}
+        self.colors = colors  # {color id: name}
+        self.positions = positions or {}  # writer id -> last change applied
+        self.stale = False  # behind a log it cannot replay; a rebuild is on its way
+        self.built_at = time.monotonic()
+        self.points = {}  # venue id -> (lat, lng, type id)
+        # Per level: cell key -> [count, Σlat, Σlng, Σid, type id | {type id: count}]
+        self.levels = [{} for _ in range(MAX_CLUSTER_ZOOM + 1)]
+        # Finest cells holding more than one venue -> their ids (a lone venue is its Σid)
+        self.members = {}
+
+    def load(self, rows):
+        """Bulk build: fill the finest level, then fold each level into its parent."""
+        finest = self.levels[MAX_CLUSTER_ZOOM]
+        for pk, lat, lng, type_id in rows:
+            self.points[pk] = (lat, lng, type_id)
+            key = _finest_key(lat, lng)
+            cell = finest.get(key)
+            if cell is None:
+                finest[key] = [1, lat, lng, pk, type_id]
+                continue
+            self.members.setdefault(key, {cell[3]} if cell[0] == 1 else set()).add(pk)
+            _merge(cell, 1, lat, lng, pk, type_id)
+
+        for level in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            parents = self.levels[level]
+            for key, child in self.levels[level + 1].items():
+                parent_key = _parent(key)
+                cell = parents.get(parent_key)
+                if cell is None:
+                    types = dict(child[4]) if isinstance(child[4], dict) else child[4]
+                    parents[parent_key] = [*child[:4], types]
+                else:
+                    _merge(cell, *child)
+
+    def add(self, pk, lat, lng, type_id):
+        self.points[pk] = (lat, lng, type_id)
+        key = _finest_key(lat, lng)
+        for level in range(MAX_CLUSTER_ZOOM, -1, -1):
+            cells = self.levels[level]
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, lat, lng, pk, type_id]
+            else:
+                if level == MAX_CLUSTER_ZOOM:
+                    self.members.setdefault(key, {cell[3]} if cell[0] == 1 else set()).add(pk)
+                _merge(cell, 1, lat, lng, pk, type_id)
+            key = _parent(key)
+
+    def remove(self, pk):
+        point = self.points.pop(pk, None)
+        if point is None:
+            return
+        lat, lng, type_id = point
+        key = _finest_key(lat, lng)
+        members = self.members.get(key)
+        if members is not None:
+            members.discard(pk)
+            if len(members) == 1:
+                del self.members[key]
+        for level in range(MAX_CLUSTER_ZOOM, -1, -1):
+            cells = self.levels[level]
+            if cells[key][0] == 1:
+                del cells[key]
+            else:
+                _unmerge(cells[key], lat, lng, pk, type_id)
+            key = _parent(key)
+
+    def _pin(self, pk):
+        lat, lng, type_id = self.points[pk]
+        color = self.pin_types.get(type_id, {}).get('color')
+        return {'id': pk, 'lat': round(lat, 6), 'lng': round(lng, 6), 'pin_type': type_id, 'color': color}
+
+    def _cluster(self, cell):
+        count, sum_lat, sum_lng, _, types = cell
+        if not isinstance(types, dict):
+            types = {types: count}
+        colors = Counter()
+        for type_id, n in types.items():
+            colors[self.pin_types.get(type_id, {}).get('color')] += n
+        # Ties go to the lowest id, with "no type" last
+        return {
+            'lat': round(sum_lat / count, 6),
+            'lng': round(sum_lng / count, 6),
+            'count': count,
+            'pin_type': min(types, key=lambda t: (-types[t], t is None, t or 0)),
+            'color': min(colors, key=lambda c: (-colors[c], c is None, c or 0)),
+        }
+
+    def _cells_in(self, level, min_lng, min_lat, max_lng, max_lat):
+        cells = self.levels[level]
+        shift = MAX_CLUSTER_ZOOM - level
+        corner, opposite = _finest_key(max_lat, min_lng), _finest_key(min_lat, max_lng)
+        x0, y0 = (corner >> 32) >> shift, (corner & 0xFFFFFFFF) >> shift
+        x1, y1 = (opposite >> 32) >> shift, (opposite & 0xFFFFFFFF) >> shift
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(cells):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cell = cells.get((cx << 32) | cy)
+                    if cell is not None:
+                        yield (cx << 32) | cy, cell
+        else:
+            # A box much larger than the populated area: walk the cells instead
+            for key, cell in cells.items():
+                if x0 <= key >> 32 <= x1 and y0 <= key & 0xFFFFFFFF <= y1:
+                    yield key, cell
+
+    def query(self, zoom, min_lng, min_lat, max_lng, max_lat):
+        """(clusters, pins) inside the box at this zoom."""
+        clusters, pins = [], []
+        if zoom > MAX_CLUSTER_ZOOM:
+            for key, cell in self._cells_in(MAX_CLUSTER_ZOOM, min_lng, min_lat, max_lng, max_lat):
+                for pk in self.members.get(key, (cell[3],)):
+                    lat, lng, _ = self.points[pk]
+                    if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                        pins.append(self._pin(pk))
+        else:
+            for _, cell in self._cells_in(zoom, min_lng, min_lat, max_lng, max_lat):
+                if cell[0] == 1:
+                    pins.append(self._pin(cell[3]))
+                else:
+                    clusters.append(self._cluster(cell))
+        clusters.sort(key=lambda cluster: (cluster['lat'], cluster['lng']))
+        pins.sort(key=lambda pin: pin['id'])
+        return clusters, pins
+
+
+def _venue_rows(queryset):
+    return queryset.values_list('id', 'latitude', 'longitude', 'type_id')
+
+
+def build_index(positions=None):
+    from .views import map_pins_queryset, pin_lookups
+
+    pin_types, colors = pin_lookups()
+    index = ClusterIndex({int(k): v for k, v in pin_types.items()}, {int(k): v for k, v in colors.items()}, positions)
+    index.load(_venue_rows(map_pins_queryset()).iterator(chunk_size=5000))
+    return index
+
+
+_index = None
+_index_lock = Lock()
+# Held only while a process without an index builds its first one
+_build_lock = Lock()
+_rebuilding = False
+
+
+def _log_positions():
+    """Writer id -> number of its latest logged change."""
+    writers = cache.get(WRITERS_KEY) or {}
+    found = cache.get_many([WRITER_KEY.format(writer) for writer in writers])
+    return {writer: found[WRITER_KEY.format(writer)] for writer in writers if WRITER_KEY.format(writer) in found}
+
+
+def _pending_changes(applied, positions):
+    keys = []
+    for writer, position in positions.items():
+        since = applied.get(writer, 0)
+        if position < since:  # the cache was cleared
+            return None
+        keys += [CHANGE_KEY.format(writer, n) for n in range(since + 1, position + 1)]
+    if len(keys) > MAX_REPLAY:
+        return None
+    found = cache.get_many(keys)
+    if len(found) != len(keys) or any(change == REBUILD for change in found.values()):
+        return None
+    return {pk for change in found.values() for pk in change}
+
+
+def _rebuild_in_background():
+    global _index, _rebuilding
+    try:
+        fresh = build_index(_log_positions())
+        with _index_lock:
+            _index = fresh
+    finally:
+        _rebuilding = False
+
+
+def _schedule_rebuild():
+    global _rebuilding
+    with _index_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    submit(_rebuild_in_background)
+
+
+def cluster_index():
+    """This process's index, brought up to date with the changes logged in the cache."""
+    global _index
+    positions = _log_positions()
+    index = _index
+    if index is None:
+        with _build_lock:
+            if _index is None:
+                fresh = build_index(positions)
+                with _index_lock:
+                    _index = fresh
+            index = _index
+
+    applied = index.positions
+    if any(applied.get(writer, 0) != position for writer, position in positions.items()):
+        changed = _pending_changes(applied, positions)
+        if changed is None:
+            index.stale = True
+            _schedule_rebuild()
+        else:
+            from .views import map_pins_queryset
+
+            rows = list(_venue_rows(map_pins_queryset().filter(pk__in=changed)))
+            with _index_lock:
+                # Another request may have applied the same changes meanwhile
+                if index.positions is applied:
+                    for pk in changed:
+                        index.remove(pk)
+                    for row in rows:
+                        index.add(*row)
+                    index.positions = {**applied, **positions}
+    if time.monotonic() - index.built_at > settings.CLUSTER_INDEX_MAX_AGE:
+        _schedule_rebuild()
+    return index
+
+
+def query_clusters(zoom, bbox, index=None):
+    index = index or cluster_index()
+    with _index_lock:
+        clusters, pins = index.query(zoom, *bbox)
+    return {
+        'zoom': zoom,
+        'clusters': clusters,
+        'pins': pins,
+        'pin_types': {str(k): v for k, v in index.pin_types.items()},
+        'colors': {str(k): v for k, v in index.colors.items()},
+    }
+
+
+_writer = None
+_writer_lock = Lock()
+_sequences = {}  # writer id -> number of its latest change
+
+
+def _writer_id():
+    """This process's log; a forked worker gets its own."""
+    global _writer
+    if _writer is None or _writer[0] != os.getpid():
+        _writer = (os.getpid(), uuid.uuid4().hex)
+    return _writer[1]
+
+
+def _register(writer, timeout):
+    # WRITERS_KEY is read-modify-write. If two writers race and one is lost, it
+    # re-registers on its next change, and readers then replay its log from the start.
+    writers = cache.get(WRITERS_KEY) or {}
+    now = time.time()
+    if writers.get(writer, 0) > now - timeout / 2:
+        return
+    writers = {other: seen for other, seen in writers.items() if seen > now - timeout}
+    writers[writer] = now
+    cache.set(WRITERS_KEY, writers, None)
+
+
+def _log_change(change):
+    timeout = settings.CLUSTER_CHANGE_LOG_TIMEOUT
+    with _writer_lock:
+        writer = _writer_id()
+        position = _sequences[writer] = _sequences.get(writer, 0) + 1
+        # The entry first, so a reader that sees the new position can fetch it
+        cache.set(CHANGE_KEY.format(writer, position), change, timeout)
+        cache.set(WRITER_KEY.format(writer), position, timeout)
+        _register(writer, timeout)
+
+
+def venues_changed(ids):
+    """Re-cluster these venues in every process once the current transaction commits."""
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: _log_change(ids))
+
+
+def pins_changed():
+    """Pin types or colours changed: every process rebuilds."""
+    transaction.on_commit(lambda: _log_change(REBUILD))
+
+
+def reset_index():
+    """Forget this process's index and change log, e.g. after the cache was cleared."""
+    global _index, _writer
+    with _index_lock:
+        _index = None
+    with _writer_lock:
+        _writer = None
+        _sequences.clear()
@@ -0,0 +1,94 @@
+# enrichment.py
+"""
+Fill venue name/address/coordinates from their Google Maps url_address.
+
+Short links need an HTTP round trip each, so they are resolved concurrently on
+a bounded pool and the results are written back with bulk_update, off the
+request path (see queue_enrichment) or from the backfill_coordinates command.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from concert_project.background import submit_on_commit
+from .clusters import venues_changed
+from .geo import cell_for
+from .models import Activities
+from .search import index_activities
+from .tiles import venues_moved
+from .utils import get_google_maps_data_many, apply_google_maps_data
+
+ENRICHED_FIELDS = ['name', 'address', 'city', 'latitude', 'longitude']
+
+
+def missing_coordinates():
+    return Activities.objects.filter(Q(latitude=None) | Q(longitude=None)).exclude(
+        Q(url_address=None) | Q(url_address='')
+    )
+
+
+def needs_enrichment(activity):
+    return bool(activity.url_address) and (not activity.latitude or not activity.longitude)
+
+
+def fetch_many(links, workers=None, timeout=None, retries=None):
+    """Resolve and parse links concurrently, via the short-link cache; returns {link: data or None}."""
+    links = list(dict.fromkeys(links))
+    workers = workers or settings.GOOGLE_MAPS_WORKERS
+    if not links:
+        return {}
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=min(workers, len(links))) as pool:
+            return get_google_maps_data_many(
+                links, session=session, timeout=timeout, retries=retries, mapper=pool.map
+            )
+
+
+def enrich_activities(activities, batch_size=None, **fetch_options):
+    """Enrich the given venues and bulk-write the changes; returns how many changed."""
+    activities = [a for a in activities if needs_enrichment(a)]
+    data = fetch_many([a.url_address for a in activities], **fetch_options)
+
+    now = timezone.now()
+    changed = []
+    with transaction.atomic():
+        # The fetch took network time: apply the results to the rows as they are now,
+        # locked until commit, so edits and status writes made meanwhile are kept
+        current = Activities.objects.select_for_update().in_bulk([a.pk for a in activities])
+        for activity in current.values():
+            if needs_enrichment(activity) and apply_google_maps_data(activity, data.get(activity.url_address)):
+                # bulk_update bypasses save(): keep the derived columns in step by hand
+                activity.geocell = cell_for(activity.latitude, activity.longitude)
+                activity.updated_at = now
+                activity.version += 1
+                changed.append(activity)
+
+        Activities.objects.bulk_update(
+            changed,
+            ENRICHED_FIELDS + ['geocell', 'updated_at', 'version'],
+            batch_size=batch_size or settings.GOOGLE_MAPS_BATCH_SIZE,
+        )
+    # Names and addresses are searchable; bulk_update sends no post_save
+    index_activities(activity.pk for activity in changed)
+    venues_changed(activity.pk for activity in changed)
+    venues_moved(changed)
+    return len(changed)
+
+
+def enrich_activity_ids(ids, **options):
+    return enrich_activities(Activities.objects.filter(pk__in=ids), **options)
+
+
+def queue_enrichment(ids):
+    """Enrich these venues in the background once the current transaction commits."""
+    ids = list(ids)
+    if ids:
+        submit_on_commit(enrich_activity_ids, ids)
@@ -0,0 +1,180 @@
+# export.py
+"""
+Streaming export of Activities as CSV, JSONL or Parquet.
+
+Rows are read with .iterator(chunk_size) over a single joined query and
+written out chunk by chunk, so memory stays flat whatever the table size
+and the first bytes go out as soon as the first chunk is read. Columns match
+ActivitiesResource, so an export can be fed back to the importer.
+
+Under ASGI Django would drain a sync iterator into a list before sending it,
+so astream_export hands the same chunks to an async generator one at a time.
+"""
+import csv
+import io
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Activities
+
+# (column name, queryset lookup) in ActivitiesResource export order
+COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('Type', 'type__name'),
+    ('Genre', 'genre__name'),
+    ('Event Type', 'event_type__name'),
+    ('Price Category', 'price_category__name'),
+    ('website', 'website'),
+    ('address', 'address'),
+    ('url_address', 'url_address'),
+    ('city', 'city'),
+    ('phone', 'phone'),
+    ('email', 'email'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+    ('live', 'live'),
+    ('broadcasted_live', 'broadcasted_live'),
+    ('event', 'event'),
+    ('mood', 'mood'),
+    ('music', 'music'),
+    ('is_active', 'is_active'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+HEADERS = [name for name, _ in COLUMNS]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def export_queryset():
+    return Activities.objects.order_by('id')
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Lists of row tuples; the FK names come from LEFT JOINs in the same query."""
+    chunk = []
+    for row in queryset.values_list(*(lookup for _, lookup in COLUMNS)).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Buffer:
+    """Write target that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def drain(self):
+        data = ''.join(self.parts) if self.parts and isinstance(self.parts[0], str) else b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _csv_value(value):
+    # Same datetime rendering as import-export's DateTimeWidget, so the importer reads it back
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def stream_csv(chunks):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    yield buffer.drain()
+    for chunk in chunks:
+        writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        yield buffer.drain()
+
+
+def stream_jsonl(chunks):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for chunk in chunks:
+        yield ''.join(encoder.encode(dict(zip(HEADERS, row))) + '\n' for row in chunk)
+
+
+def stream_parquet(chunks):
+    """One Parquet row group per chunk. Needs pyarrow (optional dependency)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (name, pa.int64() if name == 'id' else
+               pa.float64() if name in ('latitude', 'longitude') else
+               pa.bool_() if name in ('live', 'is_active') else
+               pa.timestamp('us', tz='UTC') if name in ('created_at', 'updated_at') else
+               pa.string())
+        for name in HEADERS
+    ])
+
+    class Sink(_Buffer, io.RawIOBase):
+        def writable(self):
+            return True
+
+        def tell(self):
+            return self.position
+
+    sink = Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+    'parquet': stream_parquet,
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_export(file_format, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    queryset = export_queryset() if queryset is None else queryset
+    return STREAMERS[file_format](iter_chunks(queryset, chunk_size))
+
+
+async def astream_export(file_format, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """stream_export for ASGI: each chunk is read and encoded on the request's sync thread."""
+    chunks = stream_export(file_format, queryset, chunk_size)
+    read = sync_to_async(next)
+    try:
+        while (data := await read(chunks, None)) is not None:
+            yield data
+    finally:
+        # Closes the row cursor too when the client goes away mid-download
+        await sync_to_async(chunks.close)()
@@ -1,12 +1,83 @@
 # filters.py
 import django_filters
+from django import forms
+
+from .geo import nearby, within_bbox, annotate_distance
 from .models import Activities
+from .search import search
+
+DEFAULT_RADIUS_KM = 10
+GEO_PARAMS = ('lat', 'lng', 'radius_km', 'bbox')
+
+
+class NumberCSVFilter(django_filters.BaseCSVFilter, django_filters.NumberFilter):
+    pass
+
+
+class ActivitiesFilterForm(forms.Form):
+    def clean(self):
+        cleaned_data = super().clean()
+        lat, lng = cleaned_data.get('lat'), cleaned_data.get('lng')
+        if (lat is None) != (lng is None):
+            raise forms.ValidationError("lat and lng must be given together.")
+        if lat is not None and not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise forms.ValidationError("lat/lng out of range.")
+        radius_km = cleaned_data.get('radius_km')
+        if radius_km is not None and radius_km <= 0:
+            raise forms.ValidationError("radius_km must be positive.")
+        bbox = cleaned_data.get('bbox')
+        if bbox:
+            if len(bbox) != 4:
+                raise forms.ValidationError("bbox must be min_lng,min_lat,max_lng,max_lat.")
+            min_lng, min_lat, max_lng, max_lat = bbox
+            if min_lat > max_lat or min_lng > max_lng:
+                raise forms.ValidationError("bbox min values must not exceed max values.")
+        return cleaned_data
+
 
 class ActivitiesFilter(django_filters.FilterSet):
     city = django_filters.CharFilter(field_name='city', lookup_expr='icontains')
     genre = django_filters.NumberFilter(field_name='genre_id')
     event_type = django_filters.NumberFilter(field_name='event_type_id')
+    # 🎯 Spatial filters, answered from the geocell index (see clubs.geo)
+    lat = django_filters.NumberFilter()
+    lng = django_filters.NumberFilter()
+    radius_km = django_filters.NumberFilter()
+    bbox = NumberCSVFilter(help_text='min_lng,min_lat,max_lng,max_lat')
+    # 🔎 Full-text search over name, description, mood, event, address and city
+    q = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Activities
-        fields = ['city', 'genre', 'event_type']
+        fields = ['city', 'genre', 'event_type', 'lat', 'lng', 'radius_km', 'bbox', 'q']
+        form = ActivitiesFilterForm
+
+    def filter_queryset(self, queryset):
+        for name, value in self.form.cleaned_data.items():
+            if name in GEO_PARAMS:
+                continue
+            queryset = self.filters[name].filter(queryset, value)
+        return self.filter_geo(queryset)
+
+    def filter_geo(self, queryset):
+        data = self.form.cleaned_data
+        lat, lng = data.get('lat'), data.get('lng')
+        bbox = data.get('bbox')
+
+        if bbox:
+            min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox)
+            queryset = within_bbox(queryset, min_lng, min_lat, max_lng, max_lat)
+            if lat is None:
+                lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+            queryset = annotate_distance(queryset, float(lat), float(lng))
+            return queryset.order_by('distance_sq', 'id')
+
+        if lat is not None:
+            radius_km = float(data.get('radius_km') or DEFAULT_RADIUS_KM)
+            return nearby(queryset, float(lat), float(lng), radius_km)
+
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Best match first; combined with lat/lng or bbox the results go by distance instead
+        return search(queryset, value) if value.strip() else queryset
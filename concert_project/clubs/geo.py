@@ -0,0 +1,162 @@
+# geo.py
+import math
+from functools import lru_cache
+
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# 🎯 Grid-cell spatial index
+# Every venue is assigned to a fixed 0.01° x 0.01° cell (~1.1 km at our latitudes).
+# Cells are numbered row-major, so all cells of one latitude row form a contiguous
+# integer range and a bounding box becomes a handful of indexed range scans.
+CELL_SIZE_DEG = 0.01
+GRID_COLUMNS = int(round(360 / CELL_SIZE_DEG))
+GRID_ROWS = int(round(180 / CELL_SIZE_DEG))
+
+# Above this many rows a single range over the whole latitude band is cheaper
+# than OR-ing one range per row.
+MAX_ROW_RANGES = 64
+
+KM_PER_DEGREE = 111.195
+
+# 🎯 PostGIS: on PostgreSQL with the extension available, migration 0007 adds a
+# generated geography column kept in step with latitude/longitude, with a GiST
+# index, and the bbox/radius filters below use it instead of the grid cells.
+LOCATION_COLUMN = 'location'
+LOCATION_INDEX = 'activities_location_gist'
+
+
+def _row(lat):
+    return min(max(int(math.floor((lat + 90) / CELL_SIZE_DEG)), 0), GRID_ROWS - 1)
+
+
+def _column(lng):
+    return min(max(int(math.floor((lng + 180) / CELL_SIZE_DEG)), 0), GRID_COLUMNS - 1)
+
+
+def cell_for(lat, lng):
+    """Grid cell key for a coordinate, or None when the venue has no position."""
+    if lat is None or lng is None:
+        return None
+    return _row(lat) * GRID_COLUMNS + _column(lng)
+
+
+def bbox_around(lat, lng, radius_km):
+    """(min_lng, min_lat, max_lng, max_lat) enclosing a circle of radius_km."""
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    dlng = min(radius_km / (KM_PER_DEGREE * cos_lat), 180)
+    return (lng - dlng, max(lat - dlat, -90), lng + dlng, min(lat + dlat, 90))
+
+
+def _column_spans(min_lng, max_lng):
+    # Boxes crossing the antimeridian are split in two.
+    if max_lng - min_lng >= 360:
+        return [(0, GRID_COLUMNS - 1)]
+    if min_lng < -180:
+        return [(_column(min_lng + 360), GRID_COLUMNS - 1), (0, _column(max_lng))]
+    if max_lng > 180:
+        return [(_column(min_lng), GRID_COLUMNS - 1), (0, _column(max_lng - 360))]
+    return [(_column(min_lng), _column(max_lng))]
+
+
+def cell_ranges(min_lng, min_lat, max_lng, max_lat):
+    """Inclusive (start, end) geocell ranges covering a bounding box."""
+    first_row, last_row = _row(min_lat), _row(max_lat)
+    if last_row - first_row + 1 > MAX_ROW_RANGES:
+        return [(first_row * GRID_COLUMNS, last_row * GRID_COLUMNS + GRID_COLUMNS - 1)]
+    spans = _column_spans(min_lng, max_lng)
+    return [
+        (row * GRID_COLUMNS + start, row * GRID_COLUMNS + end)
+        for row in range(first_row, last_row + 1)
+        for start, end in spans
+    ]
+
+
+def create_location_column(schema_editor, table):
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    schema_editor.execute(
+        f"ALTER TABLE {table} ADD COLUMN {LOCATION_COLUMN} geography(Point, 4326) GENERATED ALWAYS AS ("
+        f"CASE WHEN latitude IS NOT NULL AND longitude IS NOT NULL "
+        f"THEN ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography END) STORED"
+    )
+    schema_editor.execute(f"CREATE INDEX {LOCATION_INDEX} ON {table} USING GIST ({LOCATION_COLUMN})")
+
+
+def drop_location_column(schema_editor, table):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {LOCATION_INDEX}")
+    schema_editor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {LOCATION_COLUMN}")
+
+
+@lru_cache(maxsize=None)
+def _has_location_column(alias, table):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(cursor, table)
+    return any(column.name == LOCATION_COLUMN for column in columns)
+
+
+def postgis_enabled(queryset):
+    connection = connections[queryset.db]
+    return connection.vendor == 'postgresql' and _has_location_column(connection.alias, queryset.model._meta.db_table)
+
+
+def _location_condition(queryset, sql, params):
+    column = f'{connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)}.{LOCATION_COLUMN}'
+    return RawSQL(sql.format(location=column), params, output_field=BooleanField())
+
+
+def within_bbox(queryset, min_lng, min_lat, max_lng, max_lat):
+    """Restrict to venues inside the box, using the geocell (or PostGIS) index first."""
+    if postgis_enabled(queryset) and min_lng >= -180 and max_lng <= 180:
+        envelope = _location_condition(
+            queryset, "{location} && ST_MakeEnvelope(%s, %s, %s, %s, 4326)::geography",
+            [min_lng, min_lat, max_lng, max_lat],
+        )
+        # The geography box is a little wider than the lat/lng one; the ranges make it exact
+        return queryset.filter(envelope, latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+
+    cells = Q()
+    for start, end in cell_ranges(min_lng, min_lat, max_lng, max_lat):
+        cells |= Q(geocell__range=(start, end))
+    queryset = queryset.filter(cells, latitude__range=(min_lat, max_lat))
+    if min_lng >= -180 and max_lng <= 180:
+        queryset = queryset.filter(longitude__range=(min_lng, max_lng))
+    return queryset
+
+
+def annotate_distance(queryset, lat, lng):
+    """
+    Annotate `distance_sq` (squared degrees, equirectangular projection) from a point.
+
+    Plain arithmetic keeps the expression cheap on every backend; it is accurate to well
+    under 1% for the city-scale radii the map asks for. Use `distance_km()` to convert.
+    """
+    cos_lat = math.cos(math.radians(lat))
+    dlat = F('latitude') - Value(lat)
+    dlng = (F('longitude') - Value(lng)) * Value(cos_lat)
+    return queryset.annotate(
+        distance_sq=ExpressionWrapper(dlat * dlat + dlng * dlng, output_field=FloatField())
+    )
+
+
+def distance_km(distance_sq):
+    if distance_sq is None:
+        return None
+    return math.sqrt(distance_sq) * KM_PER_DEGREE
+
+
+def nearby(queryset, lat, lng, radius_km):
+    """Venues within radius_km of (lat, lng), closest first."""
+    if postgis_enabled(queryset):
+        within = _location_condition(
+            queryset, "ST_DWithin({location}, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)",
+            [lng, lat, radius_km * 1000],
+        )
+        return annotate_distance(queryset.filter(within), lat, lng).order_by('distance_sq', 'id')
+
+    queryset = within_bbox(queryset, *bbox_around(lat, lng, radius_km))
+    queryset = annotate_distance(queryset, lat, lng)
+    max_sq = (radius_km / KM_PER_DEGREE) ** 2
+    return queryset.filter(distance_sq__lte=max_sq).order_by('distance_sq', 'id')
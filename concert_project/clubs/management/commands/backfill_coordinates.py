@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from clubs.enrichment import missing_coordinates, enrich_activities
+
+
+class Command(BaseCommand):
+    help = "Resolve Google Maps links for venues that are missing latitude/longitude."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.GOOGLE_MAPS_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=settings.GOOGLE_MAPS_WORKERS)
+        parser.add_argument('--timeout', type=float, default=settings.GOOGLE_MAPS_TIMEOUT)
+        parser.add_argument('--retries', type=int, default=settings.GOOGLE_MAPS_RETRIES)
+        parser.add_argument('--limit', type=int, help="Stop after this many venues.")
+
+    def handle(self, *args, **options):
+        queryset = missing_coordinates().order_by('id')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        batch_size = options['batch_size']
+        fetch_options = {key: options[key] for key in ('workers', 'timeout', 'retries')}
+        seen = enriched = 0
+        batch = []
+        for activity in queryset.iterator(chunk_size=batch_size):
+            batch.append(activity)
+            if len(batch) == batch_size:
+                enriched += enrich_activities(batch, batch_size=batch_size, **fetch_options)
+                seen += len(batch)
+                batch = []
+                self.stdout.write(f"{seen} venues processed, {enriched} enriched")
+        if batch:
+            enriched += enrich_activities(batch, batch_size=batch_size, **fetch_options)
+            seen += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {seen} venues processed, {enriched} enriched."))
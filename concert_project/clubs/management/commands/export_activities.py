@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clubs.export import DEFAULT_CHUNK_SIZE, STREAMERS, parquet_available, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream all venues to a CSV, JSONL or Parquet file without loading the table into memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(STREAMERS), default='csv')
+        parser.add_argument('--output', '-o', help="File to write (default: stdout).")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['format']
+        if file_format == 'parquet' and not parquet_available():
+            raise CommandError("Parquet export needs pyarrow installed.")
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for part in stream_export(file_format, chunk_size=options['chunk_size']):
+                output.write(part.encode() if isinstance(part, str) else part)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from clubs.models import Activities
+from concert_project.images import generate_variants, variants_stale
+from users.models import UserProfile
+
+IMAGE_FIELDS = [
+    (Activities, 'image'),
+    (UserProfile, 'profile_picture'),
+]
+
+
+class Command(BaseCommand):
+    help = "Build the resized image variants of venue images and profile pictures that lack them."
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_FIELDS:
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{field_name: None})
+            built = failed = 0
+            for instance in queryset.only('pk', field_name, f'{field_name}_variants').iterator(chunk_size=500):
+                if not variants_stale(instance, field_name):
+                    continue
+                try:
+                    generate_variants(model, instance.pk, field_name)
+                    built += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {instance.pk}: {e}")
+            self.stdout.write(f"{model.__name__}.{field_name}: {built} built, {failed} failed")
+        self.stdout.write(self.style.SUCCESS("Done."))
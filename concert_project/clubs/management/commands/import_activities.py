@@ -0,0 +1,59 @@
+import os
+
+import tablib
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from clubs.admin import ActivitiesBulkResource
+
+
+class Command(BaseCommand):
+    help = "Import venues from a CSV/XLSX/JSON file through the bulk import path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', help="csv, xlsx or json (default: from the file extension)")
+        parser.add_argument('--batch-size', type=int, default=settings.ACTIVITIES_IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and report, then roll back.")
+        parser.add_argument('--diff', action='store_true', help="Report the fields each row changes.")
+        parser.add_argument('--diff-limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        mode = 'rb' if file_format == 'xlsx' else 'r'
+        try:
+            with open(path, mode) as source:
+                dataset = tablib.Dataset().load(source.read(), format=file_format)
+        except (OSError, tablib.UnsupportedFormat) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        resource = ActivitiesBulkResource(batch_size=options['batch_size'])
+        resource.collect_diff = options['diff'] or options['dry_run']
+        result = resource.import_data(dataset, dry_run=options['dry_run'], use_transactions=True)
+
+        totals = result.totals
+        self.stdout.write(
+            f"{'Dry run: ' if options['dry_run'] else ''}{len(dataset)} rows - "
+            f"new {totals['new']}, update {totals['update']}, skip {totals['skip']}, "
+            f"invalid {totals['invalid']}, error {totals['error']}"
+        )
+
+        for number, errors in result.row_errors()[:options['diff_limit']]:
+            for error in errors:
+                self.stderr.write(f"row {number}: {error.error}")
+        for invalid in result.invalid_rows[:options['diff_limit']]:
+            self.stderr.write(f"row {invalid.number}: {invalid.error_dict}")
+        for base_error in result.base_errors:
+            self.stderr.write(f"batch error: {base_error.error}")
+
+        if resource.collect_diff:
+            for entry in resource.diff_report[:options['diff_limit']]:
+                if entry['new']:
+                    self.stdout.write(f"row {entry['row']}: new venue")
+                elif entry['changes']:
+                    changes = ', '.join(f"{name}: {old!r} -> {new!r}" for name, (old, new) in entry['changes'].items())
+                    self.stdout.write(f"row {entry['row']} (id {entry['id']}): {changes}")
+
+        if result.has_errors() or result.has_validation_errors():
+            raise CommandError("Import finished with errors.")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from clubs.sync import prune_tombstones
+
+
+# Schedule it against the web service's database (same DATABASE_BACKEND and
+# DATABASE_URL). Until it runs, tombstones are only kept longer than needed.
+class Command(BaseCommand):
+    help = "Delete venue tombstones older than SYNC_TOMBSTONE_RETENTION."
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Deleted {prune_tombstones()} tombstones."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from clubs.models import Activities
+from clubs.search import FTS_TABLE, fts_enabled, rebuild_index, vector_enabled
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text venue search index from the venues table."
+
+    def handle(self, *args, **options):
+        if vector_enabled():
+            raise CommandError("The PostgreSQL search vector is a generated column: there is nothing to rebuild.")
+        if not fts_enabled():
+            raise CommandError("This database has no full-text index to rebuild.")
+        with transaction.atomic():
+            rebuild_index(connection, Activities._meta.db_table)
+        with connection.cursor() as cursor:
+            # Merge the index segments so queries read as few b-trees as possible
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+            indexed = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} venues."))
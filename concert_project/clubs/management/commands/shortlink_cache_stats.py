@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from clubs.models import ShortLinkCache
+
+
+class Command(BaseCommand):
+    help = "Summarize the Google Maps short-link cache; --purge-expired drops stale entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge-expired', action='store_true')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['purge_expired']:
+            deleted, _ = ShortLinkCache.objects.filter(expires_at__lte=now).delete()
+            self.stdout.write(f"Purged {deleted} expired entries.")
+
+        stats = ShortLinkCache.objects.aggregate(
+            entries=Count('id'),
+            resolved=Count('id', filter=Q(ok=True)),
+            failed=Count('id', filter=Q(ok=False)),
+            expired=Count('id', filter=Q(expires_at__lte=now)),
+            hits=Sum('hits'),
+        )
+        stats['hits'] = stats['hits'] or 0
+        for key, value in stats.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+from clubs.geo import cell_for
+
+
+def populate_geocell(apps, schema_editor):
+    Activities = apps.get_model('clubs', 'Activities')
+    batch = []
+    for activity in Activities.objects.exclude(latitude=None).exclude(longitude=None).only('latitude', 'longitude').iterator(chunk_size=2000):
+        activity.geocell = cell_for(activity.latitude, activity.longitude)
+        batch.append(activity)
+        if len(batch) >= 2000:
+            Activities.objects.bulk_update(batch, ['geocell'])
+            batch = []
+    if batch:
+        Activities.objects.bulk_update(batch, ['geocell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activities',
+            name='geocell',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='activities',
+            index=models.Index(fields=['geocell'], name='activities_geocell_idx'),
+        ),
+        migrations.RunPython(populate_geocell, migrations.RunPython.noop),
+    ]
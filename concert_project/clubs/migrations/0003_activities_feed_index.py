@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0002_activities_geocell'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activities',
+            index=models.Index(condition=models.Q(('is_active', True), ('live', True)), fields=['-created_at', '-id'], name='activities_feed_idx'),
+        ),
+    ]
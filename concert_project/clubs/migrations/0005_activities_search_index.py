@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from clubs.search import create_index, drop_index, rebuild_index
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends search without a dedicated index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    create_index(schema_editor)
+    rebuild_index(schema_editor.connection, apps.get_model('clubs', 'Activities')._meta.db_table)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0004_shortlinkcache'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from clubs.geo import create_location_column, drop_location_column
+
+
+def postgis_available(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")
+        return cursor.fetchone() is not None
+
+
+def add_location(apps, schema_editor):
+    # Only PostgreSQL servers with PostGIS get the geography column; elsewhere the
+    # geocell grid serves the map queries (see clubs.geo)
+    if postgis_available(schema_editor.connection):
+        create_location_column(schema_editor, apps.get_model('clubs', 'Activities')._meta.db_table)
+
+
+def remove_location(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        drop_location_column(schema_editor, apps.get_model('clubs', 'Activities')._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0006_activities_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_location, remove_location),
+    ]
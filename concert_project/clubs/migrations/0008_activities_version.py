@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0007_activities_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activities',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0008_activities_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activity_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='activities',
+            index=models.Index(fields=['updated_at', 'id'], name='activities_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitytombstone',
+            index=models.Index(fields=['deleted_at', 'activity_id'], name='tombstone_sync_idx'),
+        ),
+    ]
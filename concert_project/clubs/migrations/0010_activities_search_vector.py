@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from clubs.search import create_vector_column, drop_vector_column
+
+
+def add_search_vector(apps, schema_editor):
+    # PostgreSQL only; SQLite searches the FTS5 table from 0005
+    if schema_editor.connection.vendor == 'postgresql':
+        create_vector_column(schema_editor, apps.get_model('clubs', 'Activities')._meta.db_table)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        drop_vector_column(schema_editor, apps.get_model('clubs', 'Activities')._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0009_activity_tombstone_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clubs', '0010_activities_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivitySearchEntry',
+            fields=[
+                ('activity', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='clubs.activities')),
+                ('document', models.TextField(db_column='clubs_activities_fts')),
+            ],
+            options={
+                'db_table': 'clubs_activities_fts',
+                'managed': False,
+            },
+        ),
+    ]
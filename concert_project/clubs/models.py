@@ -1,4 +1,9 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .geo import cell_for
+from .search import FTS_TABLE, Match
 
 class PointColor(models.Model):
     name = models.CharField(max_length=100)
@@ -51,8 +56,12 @@ class Activities(models.Model):
     phone = models.CharField(max_length=20,blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
     image = models.ImageField(upload_to='activities/',blank=True, null=True)
+    # 🖼️ Resized WebP copies of image (see concert_project.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    # 🎯 Spatial grid cell derived from latitude/longitude (see clubs.geo)
+    geocell = models.IntegerField(blank=True, null=True, editable=False)
     # 🎯 Linked to dynamic models
     genre = models.ForeignKey(Genre, on_delete=models.SET_NULL, null=True, blank=True)
     event_type = models.ForeignKey(EventType, on_delete=models.SET_NULL, null=True, blank=True)
@@ -63,8 +72,108 @@ class Activities(models.Model):
     mood = models.TextField(blank=True, null=True)
     music = models.URLField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    # 📡 Bumped on every save; pushed with state changes so clients can drop stale ones
+    version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['geocell'], name='activities_geocell_idx'),
+            # Keyset pagination of the live feed. Partial, because the ORM renders
+            # is_active=True as a bare column test that a composite index can't serve.
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True, live=True),
+                name='activities_feed_idx',
+            ),
+            # Delta sync walks the table in (updated_at, id) order (see clubs.sync)
+            models.Index(fields=['updated_at', 'id'], name='activities_sync_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 🗺️ Where the venue was loaded, so moving it can invalidate its old map tiles (see clubs.tiles)
+        instance._saved_location = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.geocell = cell_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            derived = {'version', 'geocell'} if {'latitude', 'longitude'} & set(update_fields) else {'version'}
+            kwargs['update_fields'] = {*update_fields, *derived}
+        if self._state.adding:
+            self.version += 1
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            # Take the next version in SQL, holding the row until commit: the copy in
+            # memory may be older than a status write (clubs.status) that bumped it since
+            rows = type(self)._base_manager.using(using).filter(pk=self.pk)
+            if rows.update(version=F('version') + 1):
+                self.version = rows.values_list('version', flat=True).get()
+            else:
+                self.version += 1
+            super().save(*args, **kwargs)
+
+# 🎯 Rows of the SQLite FTS5 search index (see clubs.search); read-only, the table is not Django's
+class ActivitySearchEntry(models.Model):
+    activity = models.OneToOneField(
+        Activities, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', db_constraint=False, related_name='search_entry',
+    )
+    # FTS5's hidden column named after the table: MATCH on it searches every column
+    document = models.TextField(db_column=FTS_TABLE)
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+ActivitySearchEntry._meta.get_field('document').register_lookup(Match)
+
+# 🎯 Deleted venues, so offline clients can sync deletions (see clubs.sync)
+class ActivityTombstone(models.Model):
+    activity_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'activity_id'], name='tombstone_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Activity {self.activity_id} deleted at {self.deleted_at}"
+
+# 🎯 Persistent cache of resolved Google Maps short links (see clubs.utils)
+class ShortLinkCache(models.Model):
+    url = models.CharField(max_length=500, unique=True)
+    resolved_url = models.TextField(blank=True, null=True)
+    name = models.CharField(max_length=255, blank=True, null=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    # False for negative entries: the link could not be resolved
+    ok = models.BooleanField(default=True)
+    error = models.TextField(blank=True, null=True)
+    hits = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.url
+
+    def as_data(self):
+        if not self.ok:
+            return None
+        return {
+            'name': self.name,
+            'address': None,
+            'city': None,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+        }
@@ -0,0 +1,27 @@
+# push.py
+"""
+Venue state deltas for the live map (served by concert_project.events).
+
+Each delta is {id, live, is_active, version}; clients apply it only if the
+version is newer than the one they hold.
+"""
+from django.conf import settings
+
+from concert_project.events import RESET, publish_on_commit
+
+VENUE_EVENT = 'venue'
+STATUS_FIELDS = ('live', 'is_active')
+
+
+def venue_state(activity):
+    return {'id': activity.pk, 'live': activity.live, 'is_active': activity.is_active, 'version': activity.version}
+
+
+def publish_venue_states(states):
+    """Push these deltas once the current transaction commits; one reset for a large batch."""
+    states = list(states)
+    if len(states) > settings.EVENTS_BULK_LIMIT:
+        publish_on_commit(RESET, {})
+        return
+    for state in states:
+        publish_on_commit(VENUE_EVENT, state)
@@ -0,0 +1,230 @@
+# search.py
+"""
+Full-text venue search.
+
+On SQLite the index is an FTS5 table (clubs_activities_fts, rowid = venue id)
+using the unicode61 tokenizer with remove_diacritics, so "gradina" matches
+"Grădina" and "stefan" matches "Ștefan"/"Ştefan". Every match is ranked
+with BM25 (name weighted highest) in the query itself, and the last query
+word is treated as a prefix, so the same parameter serves autocomplete. The
+index is kept in sync by the Activities signals and by the bulk write paths
+through index_activities(); the rebuild_search_index command rebuilds it.
+
+On PostgreSQL migration 0010 adds a generated tsvector column
+(search_vector) with a GIN index. It is built from the same columns, folded
+to plain lower-case letters by an immutable SQL function, and weighted
+name > address/city > mood/event > description. Matches are ranked with
+ts_rank in the query, again with the last word as a prefix, and no trigger
+or signal is needed to keep it current.
+
+Other database backends fall back to an unranked icontains search in id order.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Lookup, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'clubs_activities_fts'
+FTS_COLUMNS = ('name', 'description', 'mood', 'event', 'address', 'city')
+# bm25() weights, in FTS_COLUMNS order
+FTS_WEIGHTS = (10.0, 1.0, 2.0, 2.0, 3.0, 3.0)
+
+SEARCH_VECTOR_COLUMN = 'search_vector'
+SEARCH_VECTOR_INDEX = 'activities_search_vector_gin'
+FOLD_FUNCTION = 'clubs_search_fold'
+# tsvector weight classes, as FTS_WEIGHTS ranks the columns
+VECTOR_WEIGHTS = (('A', ('name',)), ('B', ('address', 'city')), ('C', ('mood', 'event')), ('D', ('description',)))
+# ts_rank() weights, in {D, C, B, A} order
+TS_RANK_WEIGHTS = '{0.1, 0.2, 0.3, 1.0}'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class Match(Lookup):
+    """``document__match``: FTS5 MATCH against the index (see ActivitySearchEntry)."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+def fts_enabled(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def vector_enabled(using=connection):
+    return using.vendor == 'postgresql'
+
+
+def query_words(text):
+    """Lower-cased words of a search string, diacritics stripped."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    plain = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return WORD_RE.findall(plain.lower())
+
+
+def fold_characters():
+    """(accented, plain) strings for translate(): every Latin letter that folds to one ASCII letter."""
+    accented, plain = [], []
+    for ch in map(chr, [*range(0xC0, 0x250), *range(0x1E00, 0x1F00)]):
+        base = ''.join(c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c))
+        if len(base) == 1 and base.isascii() and base.isalpha():
+            accented.append(ch)
+            plain.append(base)
+    return ''.join(accented), ''.join(plain)
+
+
+def match_expression(text):
+    """FTS5 MATCH expression: every word must match, the last one as a prefix."""
+    words = query_words(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def tsquery_expression(text):
+    """to_tsquery() input: every word must match, the last one as a prefix."""
+    words = query_words(text)
+    if not words:
+        return None
+    return ' & '.join(f"'{word}'" for word in words) + ':*'
+
+
+# ---- index maintenance -------------------------------------------------------
+
+def create_index(schema_editor):
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+    )
+
+
+def drop_index(schema_editor):
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def create_vector_column(schema_editor, table):
+    accented, plain = fold_characters()
+    schema_editor.execute(
+        f"CREATE OR REPLACE FUNCTION {FOLD_FUNCTION}(text) RETURNS text "
+        f"LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT lower(translate($1, '{accented}', '{plain}')) $$"
+    )
+    vectors = ' || '.join(
+        f"setweight(to_tsvector('simple', {FOLD_FUNCTION}("
+        + " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+        + f")), '{weight}')"
+        for weight, columns in VECTOR_WEIGHTS
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {table} ADD COLUMN {SEARCH_VECTOR_COLUMN} tsvector GENERATED ALWAYS AS ({vectors}) STORED"
+    )
+    schema_editor.execute(f"CREATE INDEX {SEARCH_VECTOR_INDEX} ON {table} USING GIN ({SEARCH_VECTOR_COLUMN})")
+
+
+def drop_vector_column(schema_editor, table):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX}")
+    schema_editor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {SEARCH_VECTOR_COLUMN}")
+    schema_editor.execute(f"DROP FUNCTION IF EXISTS {FOLD_FUNCTION}(text)")
+
+
+def rebuild_index(using=connection, table='clubs_activities'):
+    """Repopulate the whole index from the venues table in one statement."""
+    columns = ', '.join(FTS_COLUMNS)
+    with using.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {columns}) SELECT id, {columns} FROM {table}"
+        )
+
+
+def _index_rows(cursor, rows):
+    placeholders = ', '.join(['%s'] * (len(FTS_COLUMNS) + 1))
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES ({placeholders})",
+        rows,
+    )
+
+
+def index_activities(ids, batch_size=2000):
+    """(Re)index these venues, e.g. after a bulk write that bypassed the signals."""
+    if not fts_enabled():
+        return
+    from .models import Activities
+
+    ids = list(ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), batch_size):
+            rows = Activities.objects.filter(pk__in=ids[start:start + batch_size]).values_list('id', *FTS_COLUMNS)
+            _index_rows(cursor, list(rows))
+
+
+def index_activity(activity):
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            _index_rows(cursor, [(activity.pk, *(getattr(activity, column) for column in FTS_COLUMNS))])
+
+
+def unindex_activities(ids):
+    if not fts_enabled():
+        return
+    ids = list(ids)
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in ids])
+
+
+# ---- querying ----------------------------------------------------------------
+
+def search(queryset, text):
+    """
+    Venues of queryset matching text, best first (annotated as `search_rank`,
+    the BM25 score or the negated ts_rank: lower is better). Every match is
+    ranked, so pages past the first keep the same order.
+    """
+    if vector_enabled():
+        return vector_search(queryset, text)
+    if not fts_enabled():
+        return contains_search(queryset, text)
+
+    expression = match_expression(text)
+    if expression is None:
+        return queryset.none()
+    # A join, so SQLite walks the MATCH doclist once and scores each match as it
+    # goes; bm25() names the joined index, which Django aliases by its table name
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    return queryset.filter(search_entry__document__match=expression).annotate(
+        search_rank=RawSQL(f'bm25({FTS_TABLE}, {weights})', [], output_field=FloatField()),
+    ).order_by('search_rank', 'id')
+
+
+def vector_search(queryset, text):
+    """PostgreSQL: match and rank against the generated search_vector column."""
+    expression = tsquery_expression(text)
+    if expression is None:
+        return queryset.none()
+    column = f'{connection.ops.quote_name(queryset.model._meta.db_table)}.{SEARCH_VECTOR_COLUMN}'
+    matches = RawSQL(f"{column} @@ to_tsquery('simple', %s)", [expression], output_field=BooleanField())
+    # float8, so a cursor position round-trips exactly
+    rank = RawSQL(
+        f"-ts_rank('{TS_RANK_WEIGHTS}', {column}, to_tsquery('simple', %s))::float8",
+        [expression], output_field=FloatField(),
+    )
+    return queryset.filter(matches).annotate(search_rank=rank).order_by('search_rank', 'id')
+
+
+def contains_search(queryset, text):
+    """Unranked fallback for databases without an FTS index."""
+    words = WORD_RE.findall(text or '')
+    if not words:
+        return queryset.none()
+    for word in words:
+        condition = Q()
+        for column in FTS_COLUMNS:
+            condition |= Q(**{f'{column}__icontains': word})
+        queryset = queryset.filter(condition)
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).order_by('id')
@@ -1,6 +1,10 @@
 # serializers.py
+from django.conf import settings
 from rest_framework import serializers
 from .models import Activities, Genre, EventType, PriceCategory, PinType, PointColor
+from .geo import distance_km
+from .push import STATUS_FIELDS
+from concert_project.images import srcset
 
 class PointColorSerializer(serializers.ModelSerializer):
     class Meta:
@@ -34,7 +38,37 @@ class ActivitiesSerializer(serializers.ModelSerializer):
     genre = GenreSerializer()
     event_type = EventTypeSerializer()
     price_category = PriceCategorySerializer()
+    distance_km = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Activities
-        fields = '__all__'
+        exclude = ['geocell', 'image_variants']
+
+    def get_distance_km(self, obj):
+        # Only present when the request filtered by lat/lng or bbox
+        distance = distance_km(getattr(obj, 'distance_sq', None))
+        return round(distance, 3) if distance is not None else None
+
+    def get_image_srcset(self, obj):
+        request = self.context.get('request')
+        return srcset(obj, 'image', request.build_absolute_uri if request else str)
+
+# ✅ Explicit live/is_active values for PATCH activities/<pk>/status/
+class ActivityStatusSerializer(serializers.Serializer):
+    live = serializers.BooleanField(required=False)
+    is_active = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Send live and/or is_active.")
+        return attrs
+
+# ✅ Many venues flipped in one statement
+class BulkToggleSerializer(serializers.Serializer):
+    field = serializers.ChoiceField(choices=STATUS_FIELDS)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_TOGGLE_MAX_IDS,
+    )
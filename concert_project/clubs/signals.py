@@ -0,0 +1,99 @@
+from django.db.models.signals import post_save, post_delete
+from concert_project.images import queue_variants
+from concert_project.lookup_cache import invalidate_lookup_model
+from .clusters import pins_changed, venues_changed
+from .push import STATUS_FIELDS, publish_venue_states, venue_state
+from .models import Activities, ActivityTombstone, Genre, EventType, PriceCategory, PinType, PointColor
+from .search import FTS_COLUMNS, index_activity, unindex_activities
+from .tiles import invalidate_tiles, venues_moved
+
+# Bump the cached lookup versions served by the dropdown endpoints
+for model in (Genre, EventType, PriceCategory):
+    post_save.connect(invalidate_lookup_model, sender=model, dispatch_uid=f'lookup-save-{model._meta.label}')
+    post_delete.connect(invalidate_lookup_model, sender=model, dispatch_uid=f'lookup-delete-{model._meta.label}')
+
+
+# 🔎 Keep the full-text search index in step with the venues
+def index_saved_activity(sender, instance, update_fields=None, **kwargs):
+    # Status toggles save only is_active/live: nothing searchable changed
+    if update_fields is None or set(update_fields) & set(FTS_COLUMNS):
+        index_activity(instance)
+
+
+def unindex_deleted_activity(sender, instance, **kwargs):
+    unindex_activities([instance.pk])
+
+
+post_save.connect(index_saved_activity, sender=Activities, dispatch_uid='search-index-activity')
+post_delete.connect(unindex_deleted_activity, sender=Activities, dispatch_uid='search-unindex-activity')
+
+
+# 🖼️ Resized copies of a newly uploaded venue image
+def build_image_variants(sender, instance, **kwargs):
+    queue_variants(instance, 'image')
+
+
+post_save.connect(build_image_variants, sender=Activities, dispatch_uid='image-variants-activity')
+
+
+# 🎯 Re-cluster the map pins whose position, type or visibility changed
+CLUSTER_FIELDS = {'latitude', 'longitude', 'type', 'type_id', 'is_active', 'live'}
+
+
+def recluster_saved_activity(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & CLUSTER_FIELDS:
+        venues_changed([instance.pk])
+
+
+def recluster_deleted_activity(sender, instance, **kwargs):
+    venues_changed([instance.pk])
+
+
+def recluster_all(sender, **kwargs):
+    pins_changed()
+
+
+post_save.connect(recluster_saved_activity, sender=Activities, dispatch_uid='clusters-save-activity')
+post_delete.connect(recluster_deleted_activity, sender=Activities, dispatch_uid='clusters-delete-activity')
+for model in (PinType, PointColor):
+    post_save.connect(recluster_all, sender=model, dispatch_uid=f'clusters-save-{model._meta.label}')
+    post_delete.connect(recluster_all, sender=model, dispatch_uid=f'clusters-delete-{model._meta.label}')
+
+
+# 🗺️ Drop the cached vector tiles under a changed venue (after the clusters above)
+def drop_saved_activity_tiles(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & CLUSTER_FIELDS:
+        venues_moved([instance])
+
+
+def drop_all_tiles(sender, **kwargs):
+    invalidate_tiles()
+
+
+post_save.connect(drop_saved_activity_tiles, sender=Activities, dispatch_uid='tiles-save-activity')
+post_delete.connect(drop_saved_activity_tiles, sender=Activities, dispatch_uid='tiles-delete-activity')
+for model in (PinType, PointColor):
+    post_save.connect(drop_all_tiles, sender=model, dispatch_uid=f'tiles-save-{model._meta.label}')
+    post_delete.connect(drop_all_tiles, sender=model, dispatch_uid=f'tiles-delete-{model._meta.label}')
+
+
+# 📡 Push live/active changes to the connected map clients (see clubs.push)
+def push_saved_activity_state(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(STATUS_FIELDS):
+        publish_venue_states([venue_state(instance)])
+
+
+def push_deleted_activity_state(sender, instance, **kwargs):
+    publish_venue_states([{**venue_state(instance), 'live': False, 'is_active': False, 'version': instance.version + 1}])
+
+
+post_save.connect(push_saved_activity_state, sender=Activities, dispatch_uid='push-save-activity')
+post_delete.connect(push_deleted_activity_state, sender=Activities, dispatch_uid='push-delete-activity')
+
+
+# 🎯 Remember deletions for the delta sync endpoint (see clubs.sync)
+def record_deleted_activity(sender, instance, **kwargs):
+    ActivityTombstone.objects.create(activity_id=instance.pk)
+
+
+post_delete.connect(record_deleted_activity, sender=Activities, dispatch_uid='sync-tombstone-activity')
@@ -0,0 +1,98 @@
+# status.py
+"""
+Single-statement writes of a venue's live/is_active flags.
+
+Each write is one UPDATE ... RETURNING that flips (or sets) the flag,
+bumps version and updated_at, and reads the new state back. Concurrent
+toggles queue on the row lock instead of overwriting each other, and a
+toggle costs one round trip. Setting a value can be made conditional on
+the version the client last saw (If-Match).
+
+UPDATE skips post_save, so the map clusters, tiles and pushed deltas are
+notified here, once per statement.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .clusters import venues_changed
+from .models import Activities
+from .push import STATUS_FIELDS, publish_venue_states
+from .tiles import locations_changed
+
+RETURNED_COLUMNS = ('id', 'live', 'is_active', 'version', 'latitude', 'longitude')
+
+
+def _quoted(*names):
+    return [connection.ops.quote_name(name) for name in names]
+
+
+def _can_return():
+    # UPDATE ... RETURNING arrived in SQLite together with INSERT ... RETURNING (3.35)
+    return connection.features.can_return_columns_from_insert
+
+
+def _update(assignment, params, ids, expected_version=None):
+    """Run one UPDATE over these ids and return the new states of the rows it changed."""
+    table, pk, version, updated_at = _quoted(Activities._meta.db_table, 'id', 'version', 'updated_at')
+    now = Activities._meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+    placeholders = ', '.join(['%s'] * len(ids))
+    where = f"{pk} IN ({placeholders})"
+    where_params = list(ids)
+    if expected_version is not None:
+        where += f" AND {version} = %s"
+        where_params.append(expected_version)
+    sql = f"UPDATE {table} SET {assignment}, {version} = {version} + 1, {updated_at} = %s WHERE {where}"
+    params = [*params, now, *where_params]
+    columns = ', '.join(_quoted(*RETURNED_COLUMNS))
+
+    with connection.cursor() as cursor:
+        if _can_return():
+            cursor.execute(f"{sql} RETURNING {columns}", params)
+            rows = cursor.fetchall()
+        else:
+            with transaction.atomic():
+                cursor.execute(sql, params)
+                rows = []
+                if cursor.rowcount:
+                    # Same transaction, so these are the rows just written
+                    cursor.execute(f"SELECT {columns} FROM {table} WHERE {pk} IN ({placeholders})", ids)
+                    rows = cursor.fetchall()
+    states = [_state(row) for row in rows]
+    _notify(states, rows)
+    return states
+
+
+def _state(row):
+    state = dict(zip(RETURNED_COLUMNS, row))
+    del state['latitude'], state['longitude']
+    state['live'], state['is_active'] = bool(state['live']), bool(state['is_active'])
+    return state
+
+
+def _notify(states, rows):
+    venues_changed(state['id'] for state in states)
+    locations_changed(row[4:6] for row in rows)
+    publish_venue_states(states)
+
+
+def toggle(field, ids):
+    """Flip the flag on these venues; returns their new states (missing ids are left out)."""
+    if field not in STATUS_FIELDS:
+        raise ValueError(f"Unknown status field {field!r}")
+    ids = list(ids)
+    if not ids:
+        return []
+    column, = _quoted(field)
+    return _update(f"{column} = NOT {column}", [], ids)
+
+
+def set_status(pk, values, expected_version=None):
+    """
+    Set live and/or is_active on one venue. With expected_version, only if the
+    row is still at that version. Returns the new state, or None if nothing matched.
+    """
+    if not values or set(values) - set(STATUS_FIELDS):
+        raise ValueError(f"Status values must be some of {STATUS_FIELDS}")
+    assignment = ', '.join(f"{column} = %s" for column in _quoted(*values))
+    states = _update(assignment, [bool(v) for v in values.values()], [pk], expected_version)
+    return states[0] if states else None
@@ -0,0 +1,130 @@
+# sync.py
+"""
+Delta sync for offline-first clients: GET activities/changes/?since=<token>.
+
+A token is a position in the stream of venue changes, ordered by
+(updated_at, id). Deleting a venue leaves an ActivityTombstone whose
+deleted_at places the deletion in the same stream. A request returns up to
+SYNC_PAGE_SIZE changes after its token:
+
+- ``updated``: venues the list endpoint serves (active and live), in full;
+- ``removed``: ids of venues deleted or no longer served since the token;
+
+plus the token for the next request and whether more changes are waiting.
+Without a token the client gets every served venue (paged the same way).
+
+updated_at is set before the writing transaction commits, so a row can
+appear with a timestamp older than a token already handed out. A final
+page's token therefore sits at now - SYNC_SAFETY_WINDOW: changes inside the
+window are sent again next time, and clients apply them by version, so
+repeats are harmless.
+
+A token also carries the moment from which the client needs to hear about
+deletions: when it started its first sync, or the position it last caught
+up to, whichever is later. Only when tombstones from after that moment may
+have been pruned (older than SYNC_TOMBSTONE_RETENTION) is the token expired,
+so paging through rows last changed long ago never expires a token.
+"""
+import base64
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Activities, ActivityTombstone
+
+EPOCH = (datetime(1970, 1, 1, tzinfo=dt_timezone.utc), 0)
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    """Older than the kept tombstones: deletions may have been missed, resync from scratch."""
+
+
+def _micros(moment):
+    return int(moment.timestamp()) * 10**6 + moment.microsecond
+
+
+def _moment(micros):
+    return datetime.fromtimestamp(micros // 10**6, tz=dt_timezone.utc).replace(microsecond=micros % 10**6)
+
+
+def encode_token(position, deletions_from=None):
+    """Token for a stream position; deletions_from defaults to the position itself."""
+    moment, pk = position
+    deletions_from = max(moment, deletions_from or moment)
+    raw = f'{_micros(moment)}:{pk}:{_micros(deletions_from)}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """((moment, id), deletions_from) of a token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        parts = [int(part) for part in raw.split(':')]
+        if len(parts) == 2:  # issued before tokens carried deletions_from
+            parts.append(parts[0])
+        micros, pk, deletions_micros = parts
+        moment, deletions_from = _moment(micros), _moment(deletions_micros)
+    except (ValueError, UnicodeDecodeError, OverflowError, OSError):
+        raise InvalidToken("Unknown sync token.")
+    if deletions_from < timezone.now() - timedelta(seconds=settings.SYNC_TOMBSTONE_RETENTION):
+        raise ExpiredToken("Sync token expired; fetch everything again.")
+    return (moment, pk), deletions_from
+
+
+def _after(queryset, moment_field, id_field, position):
+    moment, pk = position
+    # The leading >= lets the (moment, id) index bound the scan; the OR alone would not
+    return queryset.filter(
+        Q(**{f'{moment_field}__gte': moment}),
+        Q(**{f'{moment_field}__gt': moment}) | Q(**{f'{id_field}__gt': pk}),
+    ).order_by(moment_field, id_field)
+
+
+def changes_since(token=None, limit=None):
+    """
+    {'updated': [Activities], 'removed': [ids], 'token': str, 'has_more': bool}.
+    Raises InvalidToken (or ExpiredToken) for a token this server cannot resume from.
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    horizon = (timezone.now() - timedelta(seconds=settings.SYNC_SAFETY_WINDOW), 0)
+    # Without a token the client knows nothing yet: it needs the deletions from now on
+    since, deletions_from = decode_token(token) if token else (EPOCH, horizon[0])
+    venues = _after(
+        Activities.objects.select_related('type__color', 'genre', 'event_type', 'price_category'),
+        'updated_at', 'id', since,
+    )
+    entries = [((venue.updated_at, venue.pk), venue) for venue in venues[:limit + 1]]
+    if token:
+        tombstones = _after(ActivityTombstone.objects.all(), 'deleted_at', 'activity_id', since)
+        entries += [(position, None) for position in tombstones.values_list('deleted_at', 'activity_id')[:limit + 1]]
+    entries.sort(key=lambda entry: entry[0])
+    page, has_more = entries[:limit], len(entries) > limit
+
+    updated, removed = [], []
+    for (_, pk), venue in page:
+        if venue is not None and venue.is_active and venue.live:
+            updated.append(venue)
+        elif token:
+            removed.append(pk)
+
+    # With nothing more to send, everything up to the safety window has been seen
+    position = page[-1][0] if has_more else max(since, horizon)
+    return {
+        'updated': updated,
+        'removed': removed,
+        'token': encode_token(position, deletions_from),
+        'has_more': has_more,
+    }
+
+
+def prune_tombstones(now=None):
+    """Delete the tombstones no valid token can reach any more; returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.SYNC_TOMBSTONE_RETENTION)
+    deleted, _ = ActivityTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
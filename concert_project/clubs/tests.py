@@ -1,3 +1,1001 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from operator import attrgetter
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import tablib
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from concert_project import metrics
+from concert_project.events import LocalBroker, get_broker, reset_broker
+from concert_project.db_router import ReadReplicaRouter
+from concert_project.query_budget import QueryBudgetMixin
+from .admin import ActivitiesResource, ActivitiesBulkResource
+from .clusters import reset_index
+from .geo import GRID_COLUMNS, GRID_ROWS, LOCATION_COLUMN, bbox_around, cell_for, cell_ranges, nearby, postgis_enabled, within_bbox
+from .tiles import _tile_key, _version, tile_for
+from .enrichment import enrich_activities, fetch_many, queue_enrichment
+from .export import astream_export
+from .search import search
+from .status import toggle
+from .sync import encode_token
+from .models import ActivityTombstone, PointColor, PinType, Activities, Genre, EventType, PriceCategory, ShortLinkCache
+from .utils import get_google_maps_data, SHORT_LINK_CACHE_STATS
+
+
+def create_venues(count, **extra):
+    color = PointColor.objects.create(name='Red')
+    pin_type = PinType.objects.create(name='Club', color=color)
+    genre = Genre.objects.create(name='Techno')
+    event_type = EventType.objects.create(name='Party')
+    price_category = PriceCategory.objects.create(name='$$')
+    return [
+        Activities.objects.create(
+            name=f'Venue {i}',
+            type=pin_type,
+            genre=genre,
+            event_type=event_type,
+            price_category=price_category,
+            latitude=44.43 + i * 0.001,
+            longitude=26.10 + i * 0.001,
+            live=True,
+            **extra,
+        )
+        for i in range(count)
+    ]
+
+
+# The events stream would otherwise stay open for the budget check
+@override_settings(EVENTS_STREAM_MAX_AGE=0)
+class ClubsQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    budget_urlconf = 'clubs.urls'
+    budget_user_factory = attrgetter('user')
+    query_budgets = {
+        'activities-list': {'budget': 2},
+        'activities-changes': {'budget': 2},
+        'activities-pins': {'budget': 4},
+        'activities-clusters': {'budget': 2},
+        'venue-tile': {'kwargs': {'z': 0, 'x': 0, 'y': 0}, 'budget': 2},
+        'activities-events': {'budget': 0},
+        'activities-export': {'kwargs': {'file_format': 'csv'}, 'authenticated': True, 'budget': 2},
+        'toggle-activity-status': {'method': 'patch', 'kwargs': lambda t: {'pk': t.venues[0].pk}, 'budget': 1},
+        'toggle-activity-live': {'method': 'patch', 'kwargs': lambda t: {'pk': t.venues[1].pk}, 'budget': 1},
+        'set-activity-status': {
+            'method': 'patch', 'kwargs': lambda t: {'pk': t.venues[2].pk},
+            'data': {'live': False}, 'format': 'json', 'authenticated': True, 'budget': 2,
+        },
+        'bulk-toggle-activities': {
+            'method': 'patch', 'data': lambda t: {'field': 'live', 'ids': [v.pk for v in t.venues]},
+            'format': 'json', 'authenticated': True, 'budget': 2,
+        },
+        'event-type-list': {'budget': 2},
+        'price-category-list': {'budget': 2},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(30)
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'Secret123!', is_staff=True)
+
+    def test_activities_list_queries_do_not_grow_with_page_size(self):
+        spec = self.query_budgets['activities-list']
+        small, _ = self.count_queries('activities-list', spec, page_size=1)
+        large, response = self.count_queries('activities-list', spec, page_size=30)
+        self.assertEqual(len(response.json()['results']), 30)
+        self.assertEqual(small, large)
+
+
+class MapPinsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(3)
+
+    def test_columnar_payload(self):
+        data = self.client.get('/api/activities/pins/').json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['id'], [v.pk for v in self.venues])
+        self.assertEqual(data['lat'][0], 44.43)
+        pin_type = self.venues[0].type
+        self.assertEqual(data['pin_types'][str(pin_type.pk)], {'name': 'Club', 'color': pin_type.color_id})
+        self.assertEqual(data['colors'][str(pin_type.color_id)], 'Red')
+
+    def test_etag_revalidation(self):
+        response = self.client.get('/api/activities/pins/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/activities/pins/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.venues[0].live = False
+        self.venues[0].save()
+        response = self.client.get('/api/activities/pins/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_etag_depends_on_the_representation(self):
+        plain = self.client.get('/api/activities/pins/')
+        packed = self.client.get('/api/activities/pins/?encoding=packed')
+        self.assertNotEqual(plain['ETag'], packed['ETag'])
+        response = self.client.get('/api/activities/pins/?encoding=packed', HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response['Vary'])
+        html = self.client.get('/api/activities/pins/', HTTP_ACCEPT='text/html')
+        self.assertNotEqual(html['ETag'], plain['ETag'])
+        self.assertIn('Accept', html['Vary'])
+
+
+class MapClusterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(12)
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.addCleanup(reset_index)
+
+    def clusters(self, **params):
+        response = self.client.get('/api/activities/clusters/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_low_zoom_merges_nearby_venues(self):
+        data = self.clusters(zoom=3)
+        self.assertEqual(data['pins'], [])
+        [cluster] = data['clusters']
+        self.assertEqual(cluster['count'], 12)
+        self.assertAlmostEqual(cluster['lat'], 44.4355, places=4)
+        pin_type = self.venues[0].type
+        self.assertEqual((cluster['pin_type'], cluster['color']), (pin_type.pk, pin_type.color_id))
+
+    def test_high_zoom_returns_individual_pins_in_the_box(self):
+        data = self.clusters(zoom=19, bbox='26.0995,44.4295,26.1035,44.4335')
+        self.assertEqual(data['clusters'], [])
+        self.assertEqual([pin['id'] for pin in data['pins']], [v.pk for v in self.venues[:4]])
+
+    def test_toggle_updates_the_index_without_a_rebuild(self):
+        self.assertEqual(self.clusters(zoom=3)['clusters'][0]['count'], 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/activities/{self.venues[0].pk}/toggle-live/')
+        # Only the changed venue is re-read
+        with self.assertNumQueries(1):
+            data = self.clusters(zoom=3)
+        self.assertEqual(data['clusters'][0]['count'], 11)
+
+    def test_changes_from_several_writers_are_replayed(self):
+        self.clusters(zoom=3)
+        for writer, venue in (('worker-1', self.venues[0]), ('worker-2', self.venues[1])):
+            with mock.patch('clubs.clusters._writer_id', return_value=writer):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.patch(f'/api/activities/{venue.pk}/toggle-live/')
+        with self.assertNumQueries(1):
+            data = self.clusters(zoom=3)
+        self.assertEqual(data['clusters'][0]['count'], 10)
+
+    def test_stale_index_is_served_while_it_rebuilds(self):
+        self.clusters(zoom=3)
+        pin_type = self.venues[0].type
+        pin_type.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            pin_type.save()
+        with mock.patch('clubs.clusters.submit') as submit:
+            with self.assertNumQueries(0):
+                data = self.clusters(zoom=3)
+            self.assertNotEqual(data['pin_types'][str(pin_type.pk)]['name'], 'Renamed')
+            self.clusters(zoom=3)
+        # One rebuild, however many requests see the stale index
+        [(rebuild, *_), _] = submit.call_args
+        self.assertEqual(submit.call_count, 1)
+        rebuild()
+        self.assertEqual(self.clusters(zoom=3)['pin_types'][str(pin_type.pk)]['name'], 'Renamed')
+
+    def test_rejects_bad_parameters(self):
+        for params in ({'zoom': 'x'}, {'zoom': 30}, {'zoom': 5, 'bbox': '1,2,3'}, {'zoom': 5, 'bbox': '5,5,1,1'}):
+            response = self.client.get('/api/activities/clusters/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class VectorTileTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(3)
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.addCleanup(reset_index)
+
+    def tile_url(self, z, lat=44.43, lng=26.10):
+        x, y = tile_for(lat, lng, z)
+        return f'/api/tiles/{z}/{x}/{y}.mvt'
+
+    def test_tile_is_cached_with_an_etag(self):
+        response = self.client.get(self.tile_url(18))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'venues', response.content)
+        self.assertIn('public', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            again = self.client.get(self.tile_url(18), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_empty_and_out_of_range_tiles(self):
+        self.assertEqual(self.client.get(self.tile_url(12, lat=46.77, lng=23.62)).content, b'')
+        self.assertEqual(self.client.get('/api/tiles/2/4/0.mvt').status_code, 404)
+
+    def test_saving_a_venue_drops_only_its_tiles(self):
+        here, elsewhere = self.tile_url(10), self.tile_url(10, lat=46.77, lng=23.62)
+        self.client.get(here)
+        self.client.get(elsewhere)
+        venue = Activities.objects.get(pk=self.venues[0].pk)
+        venue.latitude = 45.0
+        with self.captureOnCommitCallbacks(execute=True):
+            venue.save()
+        version = _version()
+        # Old and new positions both drop their tile; unrelated tiles stay cached
+        self.assertIsNone(cache.get(_tile_key(version, 10, *tile_for(44.43, 26.10, 10))))
+        self.assertIsNotNone(cache.get(_tile_key(version, 10, *tile_for(46.77, 23.62, 10))))
+        new_x, new_y = tile_for(45.0, 26.10, 10)
+        self.assertIn(b'venues', self.client.get(f'/api/tiles/10/{new_x}/{new_y}.mvt').content)
+
+
+    def test_tiles_cut_from_a_stale_index_are_not_cached(self):
+        url = self.tile_url(18)
+        before = self.client.get(url).content
+        pin_type = self.venues[0].type
+        pin_type.color = PointColor.objects.create(name='Blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            pin_type.save()
+        with mock.patch('clubs.clusters.submit') as submit:
+            self.assertEqual(self.client.get(url).content, before)
+        self.assertIsNone(cache.get(_tile_key(_version(), 18, *tile_for(44.43, 26.10, 18))))
+        submit.call_args[0][0]()  # the background rebuild finishes
+        self.assertNotEqual(self.client.get(url).content, before)
+
+@override_settings(EVENTS_STREAM_MAX_AGE=0.3, EVENTS_HEARTBEAT=0.1)
+class LiveEventsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(2)
+
+    def setUp(self):
+        reset_broker()
+        self.addCleanup(reset_broker)
+
+    def test_broker_replays_after_an_id_and_reports_gaps(self):
+        broker = LocalBroker(history=2)
+        for n in range(3):
+            broker.publish('venue', {'n': n})
+        self.assertEqual(broker.read('2', 0), ([('3', 'venue', {'n': 2})], False))
+        self.assertEqual(broker.read('0', 0), ([], True))
+        self.assertEqual(broker.read('not-an-id', 0), ([], True))
+
+    def test_toggle_pushes_a_versioned_delta(self):
+        venue = self.venues[0]
+        start = get_broker().last_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/activities/{venue.pk}/toggle-live/')
+        events, gap = get_broker().read(start, 0)
+        self.assertFalse(gap)
+        self.assertEqual(events, [(
+            str(int(start) + 1), 'venue',
+            {'id': venue.pk, 'live': False, 'is_active': True, 'version': response.json()['version']},
+        )])
+        self.assertEqual(response.json()['version'], venue.version + 1)
+
+    def test_saves_that_leave_the_status_alone_push_nothing(self):
+        venue = self.venues[0]
+        venue.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            venue.save(update_fields=['name'])
+        self.assertEqual(get_broker().last_id(), '0')
+
+    def test_stream_resumes_from_last_event_id(self):
+        get_broker().publish('venue', {'id': 1, 'live': True, 'is_active': True, 'version': 2})
+        response = self.client.get('/api/activities/events/', HTTP_LAST_EVENT_ID='0')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('id: 1\nevent: venue\ndata: {"id":1,"live":true,"is_active":true,"version":2}\n\n', body)
+        self.assertIn(': ping', body)
+
+    async def test_asgi_stream_wakes_on_publish(self):
+        response = await self.async_client.get('/api/activities/events/')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+        get_broker().publish('venue', {'id': 7})
+        self.assertEqual(await anext(chunks), b'id: 1\nevent: venue\ndata: {"id":7}\n\n')
+
+
+class StatusWriteTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(3)
+        cls.admin = User.objects.create_user('staff', 'staff@example.com', 'Secret123!', is_staff=True)
+
+    def setUp(self):
+        reset_broker()
+        self.addCleanup(reset_broker)
+        self.client.force_authenticate(self.admin)
+
+    def test_status_writes_are_staff_only(self):
+        url = f'/api/activities/{self.venues[0].pk}/status/'
+        bulk = {'field': 'live', 'ids': [self.venues[0].pk]}
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.patch(url, {'live': False}, format='json').status_code, 401)
+        self.assertEqual(self.client.patch('/api/activities/bulk-toggle/', bulk, format='json').status_code, 401)
+        self.client.force_authenticate(User.objects.create_user('fan', 'fan@example.com', 'Secret123!'))
+        self.assertEqual(self.client.patch(url, {'live': False}, format='json').status_code, 403)
+        self.assertEqual(self.client.patch('/api/activities/bulk-toggle/', bulk, format='json').status_code, 403)
+        self.assertTrue(Activities.objects.get(pk=self.venues[0].pk).live)
+
+    def test_toggle_is_one_statement(self):
+        venue = self.venues[0]
+        version = venue.version
+        with self.assertNumQueries(1):
+            response = self.client.patch(f'/api/activities/{venue.pk}/toggle-status/')
+        self.assertEqual(response.json(), {'status': 'updated', 'is_active': False, 'version': version + 1})
+        self.client.patch(f'/api/activities/{venue.pk}/toggle-status/')
+        venue.refresh_from_db()
+        self.assertEqual((venue.is_active, venue.version), (True, version + 2))
+        self.assertEqual(self.client.patch('/api/activities/999999/toggle-live/').status_code, 404)
+
+    def test_set_status_checks_if_match(self):
+        venue = self.venues[0]
+        url = f'/api/activities/{venue.pk}/status/'
+        response = self.client.patch(url, {'live': False}, format='json', HTTP_IF_MATCH=f'"{venue.version}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{venue.version + 1}"')
+        self.assertEqual(response.json()['live'], False)
+
+        # A second writer still holding the old version loses
+        stale = self.client.patch(url, {'live': True}, format='json', HTTP_IF_MATCH=f'"{venue.version}"')
+        self.assertEqual(stale.status_code, 412)
+        self.assertEqual(stale.json()['version'], venue.version + 1)
+        self.assertFalse(Activities.objects.get(pk=venue.pk).live)
+
+        self.assertEqual(self.client.patch(url, {'live': True}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(url, {}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'live': True}, format='json', HTTP_IF_MATCH='"x"').status_code, 400)
+        self.assertEqual(self.client.patch('/api/activities/999999/status/', {'live': True}, format='json').status_code, 404)
+
+    def test_bulk_toggle_flips_many_and_pushes_each(self):
+        ids = [v.pk for v in self.venues[:2]]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                '/api/activities/bulk-toggle/', {'field': 'live', 'ids': [*ids, 999999]}, format='json',
+            )
+        data = response.json()
+        self.assertEqual([state['id'] for state in data['updated']], ids)
+        self.assertEqual(data['missing'], [999999])
+        self.assertFalse(Activities.objects.filter(pk__in=ids, live=True).exists())
+        self.assertTrue(Activities.objects.get(pk=self.venues[2].pk).live)
+        events, _ = get_broker().read('0', 0)
+        self.assertEqual(sorted(data['id'] for _, _, data in events), ids)
+
+    def test_save_after_a_status_write_takes_the_next_version(self):
+        loaded = Activities.objects.get(pk=self.venues[0].pk)
+        [toggled] = toggle('live', [loaded.pk])
+        loaded.name = 'Renamed'
+        loaded.save()
+        # Never the number the toggle already handed out
+        self.assertEqual(loaded.version, toggled['version'] + 1)
+        self.assertEqual(Activities.objects.get(pk=loaded.pk).version, loaded.version)
+
+    def test_bulk_toggle_validates_input(self):
+        for body in ({'field': 'name', 'ids': [1]}, {'field': 'live', 'ids': []}, {'field': 'live'}):
+            response = self.client.patch('/api/activities/bulk-toggle/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+@override_settings(SYNC_SAFETY_WINDOW=0)
+class DeltaSyncTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(4)
+        Activities.objects.filter(pk=cls.venues[3].pk).update(live=False)
+
+    def sync(self, token=None, expected_status=200):
+        response = self.client.get('/api/activities/changes/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.json()
+
+    def test_first_sync_returns_the_served_venues(self):
+        data = self.sync()
+        self.assertEqual([v['id'] for v in data['updated']], [v.pk for v in self.venues[:3]])
+        self.assertEqual((data['removed'], data['has_more']), ([], False))
+
+    def test_changes_since_a_token(self):
+        token = self.sync()['token']
+        renamed, hidden, deleted = self.venues[:3]
+        renamed.name = 'Renamed'
+        renamed.save()
+        self.client.patch(f'/api/activities/{hidden.pk}/toggle-live/')
+        Activities.objects.get(pk=deleted.pk).delete()
+
+        data = self.sync(token)
+        self.assertEqual([(v['id'], v['name']) for v in data['updated']], [(renamed.pk, 'Renamed')])
+        self.assertEqual(data['removed'], [hidden.pk, deleted.pk])
+        self.assertEqual(self.sync(data['token'])['updated'], [])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_pages_follow_the_token(self):
+        first = self.sync()
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['token'])
+        self.assertFalse(second['has_more'])
+        ids = [v['id'] for v in first['updated'] + second['updated']]
+        self.assertEqual(ids, [v.pk for v in self.venues[:3]])
+        self.assertEqual(second['removed'], [self.venues[3].pk])
+
+    def test_bad_and_expired_tokens(self):
+        self.assertIn('error', self.sync('not-a-token', expected_status=400))
+        old = encode_token((timezone.now() - timedelta(days=365), 0))
+        self.assertIn('error', self.sync(old, expected_status=410))
+        # An old position is fine while the deletions since the client's last catch-up are kept
+        self.sync(encode_token((timezone.now() - timedelta(days=365), 0), timezone.now()))
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_first_sync_pages_through_old_rows(self):
+        old_venues = create_venues(5)
+        Activities.objects.filter(pk__in=[v.pk for v in old_venues]).update(
+            updated_at=timezone.now() - timedelta(days=60)
+        )
+        data, ids = {'has_more': True, 'token': None}, []
+        for _ in range(6):
+            if not data['has_more']:
+                break
+            data = self.sync(data['token'])
+            ids += [v['id'] for v in data['updated']]
+        self.assertFalse(data['has_more'])
+        self.assertEqual(sorted(ids), sorted(v.pk for v in old_venues + self.venues[:3]))
+        self.assertEqual(self.sync(data['token'])['updated'], [])
+
+    def test_prune_keeps_recent_tombstones(self):
+        ActivityTombstone.objects.create(activity_id=1, deleted_at=timezone.now() - timedelta(days=90))
+        ActivityTombstone.objects.create(activity_id=2)
+        call_command('prune_tombstones', stdout=StringIO())
+        self.assertEqual(list(ActivityTombstone.objects.values_list('activity_id', flat=True)), [2])
+
+
+class LookupCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        EventType.objects.create(name='Concert')
+
+    def test_warm_requests_skip_the_database(self):
+        first = self.client.get('/api/event-types/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/event-types/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('max-age', second['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/event-types/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_saving_a_row_invalidates(self):
+        etag = self.client.get('/api/event-types/')['ETag']
+        EventType.objects.create(name='Festival')
+        response = self.client.get('/api/event-types/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['count'], 2)
+
+
+class ActivitiesCursorPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(25)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        return seen
+
+    def test_walks_every_venue_newest_first_without_counting(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/activities/?pagination=cursor').json()
+        self.assertNotIn('count', data)
+        seen = self.walk('/api/activities/?pagination=cursor')
+        self.assertEqual(seen, [v.pk for v in reversed(self.venues)])
+
+    def test_count_on_request(self):
+        data = self.client.get('/api/activities/?pagination=cursor&with_count=1').json()
+        self.assertEqual(data['count'], 25)
+
+    def test_nearby_pages_in_distance_order(self):
+        seen = self.walk('/api/activities/?pagination=cursor&lat=44.43&lng=26.10&radius_km=50&page_size=4')
+        self.assertEqual(seen, [v.pk for v in self.venues])
+
+
+class GeoCellTests(SimpleTestCase):
+    def covered(self, cell, ranges):
+        return any(start <= cell <= end for start, end in ranges)
+
+    def test_box_on_cell_boundaries_covers_its_corners(self):
+        ranges = cell_ranges(26.10, 44.43, 26.11, 44.44)
+        self.assertEqual(len(ranges), 2)  # one range per row
+        for lat in (44.43, 44.44):
+            for lng in (26.10, 26.11):
+                self.assertTrue(self.covered(cell_for(lat, lng), ranges))
+        self.assertFalse(self.covered(cell_for(44.43, 26.12), ranges))
+
+    def test_boxes_across_the_antimeridian_are_split(self):
+        row = cell_for(0, 0) // GRID_COLUMNS * GRID_COLUMNS
+        expected = [(row + GRID_COLUMNS - 1, row + GRID_COLUMNS - 1), (row, row)]
+        self.assertEqual(cell_ranges(179.995, 0, 180.005, 0), expected)
+        self.assertEqual(cell_ranges(-180.005, 0, -179.995, 0), expected)
+        ranges = cell_ranges(*bbox_around(0, 179.99, 5))
+        self.assertTrue(self.covered(cell_for(0, -179.99), ranges))
+        self.assertFalse(self.covered(cell_for(0, 0), ranges))
+
+    def test_poles_are_clamped_to_the_edge_rows(self):
+        self.assertEqual(cell_for(-90, -180), 0)
+        self.assertEqual(cell_for(90, 180), GRID_ROWS * GRID_COLUMNS - 1)
+        min_lng, min_lat, max_lng, max_lat = bbox_around(89.99, 0, 50)
+        self.assertEqual(max_lat, 90)
+        ranges = cell_ranges(min_lng, min_lat, max_lng, max_lat)
+        self.assertEqual(ranges[-1][0] // GRID_COLUMNS, GRID_ROWS - 1)
+        self.assertTrue(self.covered(cell_for(90, 0), ranges))
+
+    def test_tall_boxes_use_one_band(self):
+        ranges = cell_ranges(-10, -80, 10, 80)
+        self.assertEqual(ranges, [(cell_for(-80, -180), cell_for(80, 180))])
+
+
+class NearbyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Either side of the corner where four cells meet (44.44, 26.11)
+        cls.here, cls.across, cls.far = create_venues(3)
+        positions = [(44.4399, 26.1099), (44.4401, 26.1101), (44.4425, 26.1101)]
+        for venue, (lat, lng) in zip([cls.here, cls.across, cls.far], positions):
+            venue.latitude, venue.longitude = lat, lng
+            venue.save()
+
+    def test_radius_reaches_across_a_cell_edge(self):
+        self.assertNotEqual(self.here.geocell, self.across.geocell)
+        found = nearby(Activities.objects.all(), 44.4399, 26.1099, 0.1)
+        self.assertEqual(list(found.values_list('id', flat=True)), [self.here.pk, self.across.pk])
+
+    def test_closest_first(self):
+        found = nearby(Activities.objects.all(), 44.4426, 26.1101, 1)
+        self.assertEqual(list(found.values_list('id', flat=True)), [self.far.pk, self.across.pk, self.here.pk])
+
+
+class PostgisQueryTests(SimpleTestCase):
+    def sql(self, restrict, *args):
+        with mock.patch('clubs.geo.postgis_enabled', return_value=True):
+            sql = str(restrict(Activities.objects.all(), *args).query)
+        return sql.split(' WHERE ', 1)[1]
+
+    def test_bbox_uses_the_location_envelope(self):
+        sql = self.sql(within_bbox, 26.0, 44.3, 26.2, 44.5)
+        self.assertIn(f'.{LOCATION_COLUMN} && ST_MakeEnvelope(26.0, 44.3, 26.2, 44.5, 4326)::geography', sql)
+        self.assertNotIn('geocell', sql)
+
+    def test_boxes_across_the_antimeridian_keep_the_geocells(self):
+        sql = self.sql(within_bbox, 179.9, 0, 180.1, 1)
+        self.assertIn('geocell', sql)
+        self.assertNotIn('ST_MakeEnvelope', sql)
+
+    def test_radius_uses_st_dwithin(self):
+        sql = self.sql(nearby, 44.43, 26.10, 2)
+        self.assertIn(f'.{LOCATION_COLUMN}, ST_SetSRID(ST_MakePoint(26.1, 44.43), 4326)::geography, 2000', sql)
+        self.assertNotIn('geocell', sql)
+
+
+@skipUnless(connection.vendor == 'postgresql', "PostgreSQL only")
+class PostgresSchemaTests(TestCase):
+    def indexes(self, table):
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, table)
+
+    def test_partial_and_raw_indexes_exist(self):
+        self.assertIn('activities_feed_idx', self.indexes(Activities._meta.db_table))
+        self.assertIn('profile_active_expiry_idx', self.indexes('users_userprofile'))
+        auth_user = self.indexes('auth_user')
+        self.assertTrue(auth_user['users_auth_user_email_uniq']['unique'])
+        self.assertIn('users_auth_user_email_idx', auth_user)
+
+    def test_geo_queries_match_the_available_extension(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+            has_postgis = cursor.fetchone() is not None
+        self.assertEqual(postgis_enabled(Activities.objects.all()), has_postgis)
+
+
+class SearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(4)
+        names = ['Grădina Ștefan', 'Casa Veche', 'Jazz Club', 'Terasa Verde']
+        for venue, name in zip(cls.venues, names):
+            venue.name = name
+            venue.save()
+        cls.venues[1].description = 'Concerte de jazz în grădina din spate'
+        cls.venues[1].save()
+
+    def search(self, q, **params):
+        data = self.client.get('/api/activities/', {'q': q, **params}).json()
+        return [row['name'] for row in data['results']]
+
+    def test_diacritic_insensitive_prefix_match(self):
+        self.assertEqual(self.search('gradina stef'), ['Grădina Ștefan'])
+        self.assertEqual(self.search('ŞTEFAN'), ['Grădina Ștefan'])
+        self.assertEqual(self.search('verd'), ['Terasa Verde'])
+        self.assertEqual(self.search('zzz'), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('jazz'), ['Jazz Club', 'Casa Veche'])
+        self.assertEqual(self.search('gradina'), ['Grădina Ștefan', 'Casa Veche'])
+
+    def test_index_follows_saves_and_deletes(self):
+        venue = self.venues[3]
+        venue.name = 'Berăria Nouă'
+        venue.save()
+        self.assertEqual(self.search('terasa'), [])
+        self.assertEqual(self.search('beraria'), ['Berăria Nouă'])
+        venue.delete()
+        self.assertEqual(self.search('beraria'), [])
+
+    def test_combines_with_filters_and_cursor_pages(self):
+        self.assertEqual(self.search('jazz', city='nowhere'), [])
+        data = self.client.get('/api/activities/', {'q': 'jazz', 'pagination': 'cursor', 'page_size': 1}).json()
+        self.assertEqual([row['name'] for row in data['results']], ['Jazz Club'])
+        self.assertEqual([row['name'] for row in self.client.get(data['next']).json()['results']], ['Casa Veche'])
+
+    def test_every_match_is_ranked(self):
+        extra = create_venues(150, description='Terasa cu bere')
+        best = extra[-1]
+        best.name = 'Terasa Mare'
+        best.save()
+        data = self.client.get('/api/activities/', {'q': 'terasa', 'page_size': 5}).json()
+        self.assertEqual(data['count'], 151)
+        # The newest match would have been past the old 100-result cap
+        self.assertCountEqual([row['name'] for row in data['results'][:2]], ['Terasa Mare', 'Terasa Verde'])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class VenueImageVariantTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.cleanup()
+
+    def test_list_exposes_srcset_once_variants_exist(self):
+        venue = create_venues(1)[0]
+        self.assertEqual(self.client.get('/api/activities/').json()['results'][0]['image_srcset'], {})
+
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000)).save(buffer, 'JPEG')
+        venue.image = SimpleUploadedFile('hall.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            venue.save()
+
+        row = self.client.get('/api/activities/').json()['results'][0]
+        srcset = row['image_srcset']['image/webp'].split(', ')
+        self.assertEqual([entry.rsplit(' ', 1)[1] for entry in srcset], ['64w', '256w', '1024w'])
+        self.assertTrue(srcset[0].startswith('http://testserver/media/variants/activities/hall.'))
+        self.assertNotIn('image_variants', row)
+
+    @override_settings(SYNC_SAFETY_WINDOW=0)
+    def test_new_variants_reach_the_delta_sync(self):
+        venue = create_venues(1)[0]
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200)).save(buffer, 'JPEG')
+        venue.image = SimpleUploadedFile('bar.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks() as callbacks:
+            venue.save()
+        token = self.client.get('/api/activities/changes/').json()['token']
+        for callback in callbacks:
+            callback()  # the variants are built after the client synced
+        updated = self.client.get('/api/activities/changes/', {'since': token}).json()['updated']
+        self.assertEqual([row['id'] for row in updated], [venue.pk])
+        self.assertTrue(updated[0]['image_srcset'])
+
+
+class StubMapsHandler(BaseHTTPRequestHandler):
+    """goo.gl/<n> redirects to a full Maps URL for place n; anything else is a 500."""
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path.startswith('/goo.gl/'):
+            n = int(self.path.rsplit('/', 1)[1])
+            self.send_response(302)
+            self.send_header('Location', f'/maps/place/Club+{n}/@44.{n:04d},26.{n:04d},17z')
+            self.end_headers()
+        elif self.path.startswith('/maps/'):
+            self.send_response(200)
+            self.end_headers()
+        else:
+            self.send_response(500)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(GOOGLE_MAPS_RETRIES=0, GOOGLE_MAPS_TIMEOUT=2, BACKGROUND_TASKS_EAGER=True)
+class EnrichmentTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubMapsHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubMapsHandler.hits.clear()
+
+    def test_backfill_command_resolves_short_links_in_bulk(self):
+        venues = [Activities.objects.create(url_address=f'{self.base_url}/goo.gl/{n}') for n in range(1, 21)]
+        broken = Activities.objects.create(url_address=f'{self.base_url}/broken/goo.gl/x')
+
+        out = StringIO()
+        call_command('backfill_coordinates', batch_size=8, workers=4, stdout=out)
+
+        self.assertIn('21 venues processed, 20 enriched', out.getvalue())
+        venue = Activities.objects.get(pk=venues[4].pk)
+        self.assertEqual((venue.name, venue.latitude, venue.longitude), ('Club 5', 44.0005, 26.0005))
+        self.assertIsNotNone(venue.geocell)
+        self.assertIsNone(Activities.objects.get(pk=broken.pk).latitude)
+
+    def test_queue_runs_after_commit(self):
+        venue = Activities.objects.create(url_address=f'{self.base_url}/goo.gl/7')
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_enrichment([venue.pk])
+            self.assertEqual(StubMapsHandler.hits, [])
+        venue.refresh_from_db()
+        self.assertEqual(venue.latitude, 44.0007)
+
+    def test_edits_made_during_the_fetch_are_kept(self):
+        venue = Activities.objects.create(url_address=f'{self.base_url}/goo.gl/4', live=True)
+        states = []
+
+        def fetch_then_edit(links, **options):
+            data = fetch_many(links, **options)
+            Activities.objects.filter(pk=venue.pk).update(name='Named by an admin')
+            states.extend(toggle('live', [venue.pk]))
+            return data
+
+        with mock.patch('clubs.enrichment.fetch_many', fetch_then_edit):
+            self.assertEqual(enrich_activities([venue]), 1)
+        venue.refresh_from_db()
+        self.assertEqual((venue.name, venue.live, venue.latitude), ('Named by an admin', False, 44.0004))
+        self.assertEqual(venue.version, states[0]['version'] + 1)
+
+    def test_import_parses_full_links_inline_and_queues_short_links(self):
+        dataset = tablib.Dataset(headers=['id', 'url_address', 'live'])
+        dataset.append(['', 'https://www.google.com/maps/place/Control+Club/@44.4372,26.0971,17z', '1'])
+        dataset.append(['', f'{self.base_url}/goo.gl/3', '1'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = ActivitiesResource().import_data(dataset)
+        self.assertFalse(result.has_errors())
+
+        full, short = Activities.objects.order_by('id')
+        self.assertEqual((full.name, full.latitude), ('Control Club', 44.4372))
+        self.assertEqual((short.name, short.latitude), ('Club 3', 44.0003))
+        self.assertEqual(len(StubMapsHandler.hits), 2)
+
+    def test_repeat_lookups_come_from_the_short_link_cache(self):
+        good, bad = f'{self.base_url}/goo.gl/9', f'{self.base_url}/broken/goo.gl/9'
+        self.assertEqual(get_google_maps_data(good)['latitude'], 44.0009)
+        self.assertIsNone(get_google_maps_data(bad))
+        network_calls = len(StubMapsHandler.hits)
+
+        before = SHORT_LINK_CACHE_STATS.copy()
+        self.assertEqual(get_google_maps_data(good)['name'], 'Club 9')
+        self.assertIsNone(get_google_maps_data(bad))
+        self.assertEqual(len(StubMapsHandler.hits), network_calls)
+        self.assertEqual(SHORT_LINK_CACHE_STATS['hits'] - before['hits'], 1)
+        self.assertEqual(SHORT_LINK_CACHE_STATS['negative_hits'] - before['negative_hits'], 1)
+        self.assertEqual(ShortLinkCache.objects.get(url=good).hits, 1)
+
+        ShortLinkCache.objects.filter(url=bad).update(expires_at=timezone.now())
+        get_google_maps_data(bad)
+        self.assertEqual(len(StubMapsHandler.hits), network_calls + 1)
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(2)
+
+    def dataset(self, rows):
+        dataset = tablib.Dataset(headers=['id', 'name', 'Type', 'Genre', 'Event Type', 'Price Category', 'latitude', 'longitude', 'live'])
+        for row in rows:
+            dataset.append(row)
+        return dataset
+
+    def test_queries_do_not_grow_with_row_count(self):
+        def run(count):
+            rows = [['', f'New {i}', 'Club', 'Techno', 'Party', '$$', 44.5, 26.2, '1'] for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                result = ActivitiesBulkResource().import_data(self.dataset(rows))
+            self.assertFalse(result.has_errors() or result.has_validation_errors())
+            return len(ctx.captured_queries)
+
+        # Only the batch count grows (SQLite caps the parameters per INSERT)
+        self.assertLess(run(200), run(10) + 10)
+        venue = Activities.objects.get(name='New 199')
+        self.assertEqual((venue.type.name, venue.genre.name), ('Club', 'Techno'))
+        self.assertIsNotNone(venue.geocell)
+        self.assertQuerySetEqual(search(Activities.objects.all(), 'new 199'), [venue])
+
+    def test_update_keeps_columns_the_file_does_not_carry(self):
+        venue = self.venues[0]
+        states = []
+        before_save = ActivitiesBulkResource.before_save_instance
+
+        def toggled_meanwhile(resource, instance, row, **kwargs):
+            # A status write lands after the importer loaded the row
+            states.extend(toggle('live', [instance.pk]))
+            before_save(resource, instance, row, **kwargs)
+
+        dataset = tablib.Dataset([venue.pk, 'Renamed'], headers=['id', 'name'])
+        with mock.patch.object(ActivitiesBulkResource, 'before_save_instance', toggled_meanwhile):
+            result = ActivitiesBulkResource().import_data(dataset)
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        venue = Activities.objects.get(pk=venue.pk)
+        self.assertEqual((venue.name, venue.live), ('Renamed', False))
+        self.assertEqual(venue.version, states[0]['version'] + 1)
+
+    def test_batch_size_override_stays_on_the_instance(self):
+        default = ActivitiesBulkResource._meta.batch_size
+        self.assertEqual(ActivitiesBulkResource(batch_size=7)._meta.batch_size, 7)
+        self.assertEqual(ActivitiesBulkResource._meta.batch_size, default)
+        self.assertEqual(ActivitiesBulkResource()._meta.batch_size, default)
+
+    def test_dry_run_reports_changes_without_writing(self):
+        venue = self.venues[0]
+        rows = [
+            [venue.pk, 'Renamed', 'Club', 'Techno', 'Party', '$$', venue.latitude, venue.longitude, '1'],
+            ['', 'Brand new', 'Club', '', '', '', 45.0, 25.0, '0'],
+        ]
+        out = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as source:
+            source.write(self.dataset(rows).export('csv'))
+            source.flush()
+            call_command('import_activities', source.name, dry_run=True, stdout=out)
+
+        report = out.getvalue()
+        self.assertIn('new 1, update 1', report)
+        self.assertIn(f"row 1 (id {venue.pk}): name: 'Venue 0' -> 'Renamed'", report)
+        self.assertIn('row 2: new venue', report)
+        self.assertEqual(Activities.objects.count(), 2)
+        self.assertEqual(Activities.objects.get(pk=venue.pk).name, 'Venue 0')
+
+    def test_unknown_lookup_name_is_reported(self):
+        rows = [['', 'Bad', 'No such type', '', '', '', '', '', '1']]
+        result = ActivitiesBulkResource().import_data(self.dataset(rows))
+        self.assertTrue(result.has_errors())
+        self.assertIn('No such type', str(result.row_errors()[0][1][0].error))
+
+
+class StreamingExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venues = create_venues(5)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'Secret123!')
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/api/activities/export/csv/').status_code, 401)
+
+    def test_csv_round_trips_through_the_importer(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/activities/export/csv/')
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        dataset = tablib.Dataset().load(content, format='csv')
+        self.assertEqual(len(dataset), 5)
+        self.assertEqual(dataset.dict[0]['Type'], 'Club')
+
+        result = ActivitiesBulkResource().import_data(dataset, dry_run=True)
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        self.assertEqual(result.totals['update'], 5)
+
+    def test_jsonl_is_one_object_per_line(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/activities/export/jsonl/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[-1])['name'], 'Venue 4')
+
+    async def test_asgi_export_streams_chunk_by_chunk(self):
+        self.async_client.cookies['access'] = str(AccessToken.for_user(self.admin))
+        with mock.patch('clubs.views.astream_export', partial(astream_export, chunk_size=2)):
+            response = await self.async_client.get('/api/activities/export/jsonl/')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+
+
+@override_settings(PERF_SAMPLE_RATE=1.0, PERF_SERVER_TIMING=True, METRICS_TOKEN='scrape')
+class PerformanceMetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_venues(3)
+
+    def setUp(self):
+        metrics.reset()
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_request_breakdown_is_sent_as_server_timing(self):
+        response = self.client.get('/api/activities/')
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'app', 'total'})
+        self.assertRegex(timing['db'], r'dur=[\d.]+;desc="\d+ queries"')
+
+    def test_routes_are_aggregated_by_url_name(self):
+        for _ in range(2):
+            self.client.get('/api/activities/')
+        body = self.scrape()
+        self.assertIn('http_request_duration_seconds_count{route="activities-list",method="GET"} 2', body)
+        self.assertIn('http_requests_total{route="activities-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_serialize_duration_seconds_count{route="activities-list",method="GET"} 2', body)
+        self.assertIn('shortlink_cache_events_total', body)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_only_counted(self):
+        response = self.client.get('/api/activities/')
+        self.assertNotIn('Server-Timing', response)
+        body = self.scrape()
+        self.assertIn('http_requests_total{route="activities-list",method="GET",status="200"} 1', body)
+        self.assertNotIn('http_request_duration_seconds_count{route="activities-list"', body)
+
+    def test_metrics_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+
+class ReadReplicaRouterTests(SimpleTestCase):
+    router = ReadReplicaRouter()
+
+    def test_public_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Activities), 'replica')
+        self.assertEqual(self.router.db_for_read(Genre), 'replica')
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_writes_and_transactions_stay_on_default(self):
+        self.assertEqual(self.router.db_for_write(Activities), 'default')
+        connection.in_atomic_block = True
+        try:
+            self.assertEqual(self.router.db_for_read(Activities), 'default')
+        finally:
+            connection.in_atomic_block = False
+        self.assertFalse(self.router.allow_migrate('replica', 'clubs'))
@@ -0,0 +1,194 @@
+# tiles.py
+"""
+The venue layer as Mapbox Vector Tiles (/api/tiles/{z}/{x}/{y}.mvt).
+
+Tiles are cut from the in-memory cluster index (clubs.clusters), so a tile
+holds at most CELLS_PER_TILE² clusters below MAX_CLUSTER_ZOOM and the cost
+of rendering one does not grow with the number of venues. Each feature is a
+point in the "venues" layer with kind ("venue" or "cluster"), pin_type and
+color attributes, plus count on clusters; venue features carry the venue id.
+
+Encoded tiles are kept in the shared cache (settings.TILE_CACHE_ALIAS) with
+a content-hash ETag. Saving, moving, toggling or deleting a venue drops
+only the tiles that contain its old and new position, one per zoom level;
+pin type and colour changes bump a version stamp that retires every tile.
+A tile cut from a stale cluster index (one waiting for a rebuild) is served
+but not cached, so it cannot outlive the rebuild under the new version.
+"""
+import hashlib
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .clusters import MAX_ZOOM, _project, cluster_index, query_clusters
+
+LAYER_NAME = 'venues'
+EXTENT = 4096
+
+MOVE_TO = 1
+POINT = 1
+
+
+def _cache():
+    return caches[settings.TILE_CACHE_ALIAS]
+
+
+# 🎯 Minimal protobuf writer for the parts of the MVT spec a point layer uses
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _uint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _bytes_field(number, payload):
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(number, values):
+    return _bytes_field(number, b''.join(_varint(v) for v in values))
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int) and value >= 0:
+        return _uint_field(5, value)  # uint_value
+    return _bytes_field(1, str(value).encode())  # string_value
+
+
+def encode_tile(features):
+    """features: [(id or None, x, y, {key: value})] in tile pixels -> MVT bytes."""
+    if not features:
+        return b''
+    keys, values, encoded = {}, {}, []
+    for feature_id, x, y, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        feature = _uint_field(1, feature_id) if feature_id is not None else b''
+        feature += _packed_field(2, tags) + _uint_field(3, POINT)
+        feature += _packed_field(4, [MOVE_TO | 1 << 3, _zigzag(x), _zigzag(y)])
+        encoded.append(_bytes_field(2, feature))
+
+    layer = _uint_field(15, 2) + _bytes_field(1, LAYER_NAME.encode()) + b''.join(encoded)
+    layer += b''.join(_bytes_field(3, key.encode()) for key in keys)
+    layer += b''.join(_bytes_field(4, _value(value)) for _, value in values)
+    layer += _uint_field(5, EXTENT)
+    return _bytes_field(3, layer)
+
+
+def tile_bounds(z, x, y):
+    """(min_lng, min_lat, max_lng, max_lat) of a tile."""
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def tile_for(lat, lng, z):
+    px, py = _project(lat, lng)
+    n = 1 << z
+    return int(px * n), int(py * n)
+
+
+def tile_features(z, x, y, index=None):
+    data = query_clusters(z, tile_bounds(z, x, y), index)
+    n = 1 << z
+    features = []
+
+    def place(item):
+        px, py = _project(item['lat'], item['lng'])
+        tx, ty = int((px * n - x) * EXTENT), int((py * n - y) * EXTENT)
+        # The index is queried by box; keep only what falls inside this tile
+        return (tx, ty) if 0 <= tx < EXTENT and 0 <= ty < EXTENT else None
+
+    for cluster in data['clusters']:
+        position = place(cluster)
+        if position:
+            features.append((None, *position, {
+                'kind': 'cluster', 'count': cluster['count'],
+                'pin_type': cluster['pin_type'], 'color': cluster['color'],
+            }))
+    for pin in data['pins']:
+        position = place(pin)
+        if position:
+            features.append((pin['id'], *position, {
+                'kind': 'venue', 'pin_type': pin['pin_type'], 'color': pin['color'],
+            }))
+    return features
+
+
+def _version():
+    cache = _cache()
+    version = cache.get('tiles:version')
+    if version is None:
+        cache.add('tiles:version', uuid.uuid4().hex[:12], None)
+        version = cache.get('tiles:version')
+    return version
+
+
+def _tile_key(version, z, x, y):
+    return f'tiles:{version}:{z}/{x}/{y}'
+
+
+def get_tile(z, x, y):
+    """(etag, bytes) of a tile, encoding and caching it on a miss."""
+    cache = _cache()
+    key = _tile_key(_version(), z, x, y)
+    entry = cache.get(key)
+    if entry is None:
+        index = cluster_index()
+        content = encode_tile(tile_features(z, x, y, index))
+        entry = (f'"{hashlib.sha1(content).hexdigest()[:20]}"', content)
+        if not index.stale:
+            cache.set(key, entry, settings.TILE_CACHE_TIMEOUT)
+    return entry
+
+
+def _drop_tiles(locations):
+    version = _version()
+    keys = {
+        _tile_key(version, z, *tile_for(lat, lng, z))
+        for lat, lng in locations
+        for z in range(MAX_ZOOM + 1)
+    }
+    _cache().delete_many(keys)
+
+
+def locations_changed(locations):
+    """Drop the tiles under these (lat, lng) positions once the transaction commits."""
+    locations = {(lat, lng) for lat, lng in locations if lat is not None and lng is not None}
+    if locations:
+        transaction.on_commit(lambda: _drop_tiles(locations))
+
+
+def venues_moved(venues):
+    """Drop the tiles under these venues' old and new positions once the transaction commits."""
+    locations = []
+    for venue in venues:
+        locations += [getattr(venue, '_saved_location', (None, None)), (venue.latitude, venue.longitude)]
+        venue._saved_location = (venue.latitude, venue.longitude)
+    locations_changed(locations)
+
+
+def invalidate_tiles():
+    transaction.on_commit(lambda: _cache().set('tiles:version', uuid.uuid4().hex[:12], None))
@@ -1,18 +1,32 @@
 from django.urls import path
 from .views import (
     ActivitiesListAPIView,
+    map_pins,
+    activity_changes,
+    map_clusters,
+    venue_tile,
+    activity_events,
+    export_activities,
     toggle_activity_status,
     toggle_activity_live,
-    GenreListAPIView,
+    set_activity_status,
+    bulk_toggle_activities,
     EventTypeListAPIView,
     PriceCategoryListAPIView,
 )
 
 urlpatterns = [
     path('activities/', ActivitiesListAPIView.as_view(), name='activities-list'),
+    path('activities/changes/', activity_changes, name='activities-changes'),
+    path('activities/pins/', map_pins, name='activities-pins'),
+    path('activities/clusters/', map_clusters, name='activities-clusters'),
+    path('activities/events/', activity_events, name='activities-events'),
+    path('activities/export/<str:file_format>/', export_activities, name='activities-export'),
+    path('activities/bulk-toggle/', bulk_toggle_activities, name='bulk-toggle-activities'),
+    path('activities/<int:pk>/status/', set_activity_status, name='set-activity-status'),
     path('activities/<int:pk>/toggle-status/', toggle_activity_status, name='toggle-activity-status'),
     path('activities/<int:pk>/toggle-live/', toggle_activity_live, name='toggle-activity-live'),
-    path('genres/', GenreListAPIView.as_view(), name='genre-list'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', venue_tile, name='venue-tile'),
     path('event-types/', EventTypeListAPIView.as_view(), name='event-type-list'),
     path('price-categories/', PriceCategoryListAPIView.as_view(), name='price-category-list'),
 ]
@@ -1,37 +1,161 @@
-import requests
+import logging
 import re
+import time
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import unquote_plus
+
+import requests
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ShortLinkCache
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters for the short-link cache: hits, negative_hits, misses, errors
+SHORT_LINK_CACHE_STATS = Counter()
+
+COORDINATES_RE = re.compile(r'@(-?\d+\.\d+),(-?\d+\.\d+)')
+PLACE_NAME_RE = re.compile(r'/place/([^/@]+)')
+
+
+def is_short_link(link: str):
+    return 'goo.gl' in link
+
+
+def resolve_short_link(link: str, session=None, timeout=None, retries=None):
+    """Follow a goo.gl redirect chain; raises requests.RequestException after the last retry."""
+    session = session or requests
+    timeout = timeout if timeout is not None else settings.GOOGLE_MAPS_TIMEOUT
+    retries = retries if retries is not None else settings.GOOGLE_MAPS_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(link, allow_redirects=True, timeout=timeout)
+            response.raise_for_status()
+            return response.url
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def parse_google_maps_url(link: str):
+    """Extract what a full Google Maps URL carries, without any network access."""
+    # Extract latitude/longitude
+    match = COORDINATES_RE.search(link)
+    lat, lng = None, None
+    if match:
+        lat = float(match.group(1))
+        lng = float(match.group(2))
+
+    # Extract place name from URL
+    name = None
+    name_match = PLACE_NAME_RE.search(link)
+    if name_match:
+        name = unquote_plus(name_match.group(1))
+
+    # No address and city parsing yet
+    return {
+        'name': name,
+        'address': None,
+        'city': None,
+        'latitude': lat,
+        'longitude': lng
+    }
 
-def get_google_maps_data(link: str):
+
+def fetch_short_link(link: str, session=None, timeout=None, retries=None):
+    """Resolve and parse one short link over the network: (resolved_url, data, error)."""
     try:
-        # Resolve short links
-        if 'goo.gl' in link or 'maps.app.goo.gl' in link:
-            response = requests.get(link, allow_redirects=True)
-            link = response.url
-
-        # Extract latitude/longitude
-        match = re.search(r'@(-?\d+\.\d+),(-?\d+\.\d+)', link)
-        lat, lng = None, None
-        if match:
-            lat = float(match.group(1))
-            lng = float(match.group(2))
-        
-        # Extract place name from URL
-        name = None
-        name_match = re.search(r'/place/([^/@]+)', link)
-        if name_match:
-            name = name_match.group(1).replace('+', ' ').replace('%C4%83', 'ă').replace('%C3%A2', 'â')
-
-        # No address and city parsing yet
-        city = None
-        address = None
-
-        return {
-            'name': name,
-            'address': address,
-            'city': city,
-            'latitude': lat,
-            'longitude': lng
-        }
+        resolved = resolve_short_link(link, session=session, timeout=timeout, retries=retries)
+        return resolved, parse_google_maps_url(resolved), None
     except Exception as e:
-        print(f"Failed to extract Google Maps data: {e}")
-        return None
+        logger.warning("Failed to extract Google Maps data from %s: %s", link, e)
+        return None, None, str(e)
+
+
+def cached_short_links(links):
+    """Fresh cache entries for these links, keyed by link; counts them as hits."""
+    entries = {
+        entry.url: entry
+        for entry in ShortLinkCache.objects.filter(url__in=links, expires_at__gt=timezone.now())
+    }
+    if entries:
+        ShortLinkCache.objects.filter(pk__in=[e.pk for e in entries.values()]).update(hits=F('hits') + 1)
+    return entries
+
+
+def store_short_links(fetched):
+    """Upsert {link: (resolved_url, data, error)}; failures are cached for a shorter time."""
+    now = timezone.now()
+    rows = []
+    for link, (resolved, data, error) in fetched.items():
+        ok = error is None
+        ttl = settings.GOOGLE_MAPS_CACHE_TTL if ok else settings.GOOGLE_MAPS_NEGATIVE_CACHE_TTL
+        data = data or {}
+        rows.append(ShortLinkCache(
+            url=link,
+            resolved_url=resolved,
+            name=data.get('name'),
+            latitude=data.get('latitude'),
+            longitude=data.get('longitude'),
+            ok=ok,
+            error=error,
+            fetched_at=now,
+            expires_at=now + timedelta(seconds=ttl),
+        ))
+    ShortLinkCache.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['url'],
+        update_fields=['resolved_url', 'name', 'latitude', 'longitude', 'ok', 'error', 'fetched_at', 'expires_at'],
+    )
+
+
+def get_google_maps_data_many(links, session=None, timeout=None, retries=None, mapper=map):
+    """
+    {link: data or None} for many links.
+
+    Full URLs are parsed in place. Short links are answered from ShortLinkCache and only
+    the misses go to the network, through ``mapper`` (pass a pool's map to fetch concurrently).
+    """
+    links = list(dict.fromkeys(link for link in links if link))
+    results = {link: parse_google_maps_url(link) for link in links if not is_short_link(link)}
+    short_links = [link for link in links if is_short_link(link)]
+    if not short_links:
+        return results
+
+    cached = cached_short_links(short_links)
+    for link, entry in cached.items():
+        SHORT_LINK_CACHE_STATS['hits' if entry.ok else 'negative_hits'] += 1
+        results[link] = entry.as_data()
+
+    misses = [link for link in short_links if link not in cached]
+    if misses:
+        SHORT_LINK_CACHE_STATS['misses'] += len(misses)
+        fetched = dict(zip(misses, mapper(
+            lambda link: fetch_short_link(link, session=session, timeout=timeout, retries=retries),
+            misses,
+        )))
+        SHORT_LINK_CACHE_STATS['errors'] += sum(1 for _, _, error in fetched.values() if error)
+        store_short_links(fetched)
+        results.update((link, data) for link, (_, data, _) in fetched.items())
+    return results
+
+
+def get_google_maps_data(link: str, session=None, timeout=None, retries=None):
+    return get_google_maps_data_many([link], session=session, timeout=timeout, retries=retries).get(link)
+
+
+def apply_google_maps_data(activity, data):
+    """Fill the venue fields that are still empty; returns the names of the fields set."""
+    changed = []
+    if not data:
+        return changed
+    for field in ('name', 'address', 'city', 'latitude', 'longitude'):
+        if not getattr(activity, field) and data.get(field):
+            setattr(activity, field, data[field])
+            changed.append(field)
+    return changed
@@ -1,52 +1,310 @@
+import base64
+import hashlib
+import json
+import sys
+from array import array
+
 from rest_framework import generics, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from django.views.decorators.vary import vary_on_headers
 
-from .models import Activities, Genre, EventType, PriceCategory
-from .serializers import ActivitiesSerializer, GenreSerializer, EventTypeSerializer, PriceCategorySerializer
+from concert_project.events import event_stream_response
+from concert_project.lookup_cache import cached_lookup
+from .models import Activities, Genre, EventType, PriceCategory, PinType
+from .serializers import (
+    ActivitiesSerializer, GenreSerializer, EventTypeSerializer, PriceCategorySerializer,
+    ActivityStatusSerializer, BulkToggleSerializer,
+)
 from .filters import ActivitiesFilter
+from .clusters import MAX_ZOOM, query_clusters
+from .tiles import get_tile
+from .status import set_status, toggle
+from .sync import ExpiredToken, InvalidToken, changes_since
+from .export import CONTENT_TYPES, astream_export, stream_export, parquet_available
 
 # 🎯 Pagination class
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
 
+# 🎯 Keyset pagination for the activities feed (opt in with ?pagination=cursor)
+class ActivitiesCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    # Served by the activities_feed_idx composite index
+    ordering = ('-created_at', '-id')
+    count_query_param = 'with_count'
+
+    def get_ordering(self, request, queryset, view):
+        # Nearby/bbox queries are paged in distance order, text searches by rank
+        if 'distance_sq' in queryset.query.annotations:
+            return ('distance_sq', 'id')
+        if 'search_rank' in queryset.query.annotations:
+            return ('search_rank', 'id')
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Counting is the expensive part of page-number pagination: only on request
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
+
 # 🎯 Main Activities list with filter & pagination
 class ActivitiesListAPIView(generics.ListAPIView):
-    queryset = Activities.objects.filter(is_active=True, live=True)
+    # Nested serializers read type/color, genre, event_type and price_category:
+    # join them up front so a page costs the same number of queries at any size.
+    queryset = Activities.objects.filter(is_active=True, live=True).select_related(
+        'type__color', 'genre', 'event_type', 'price_category'
+    )
     serializer_class = ActivitiesSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = ActivitiesFilter
     pagination_class = StandardResultsSetPagination
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = ActivitiesCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+# 🎯 Delta sync for offline clients: what changed since the client's last token
+@api_view(['GET'])
+def activity_changes(request):
+    try:
+        changes = changes_since(request.query_params.get('since'))
+    except ExpiredToken as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_410_GONE)
+    except InvalidToken as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    changes['updated'] = ActivitiesSerializer(changes['updated'], many=True, context={'request': request}).data
+    return Response(changes)
+
+# 🎯 Compact map pins: every live venue in one columnar response
+def map_pins_queryset():
+    return (
+        Activities.objects.filter(is_active=True, live=True)
+        .exclude(latitude=None)
+        .exclude(longitude=None)
+    )
+
+def pin_lookups():
+    pin_types = PinType.objects.select_related('color').order_by('id')
+    types = {str(p.id): {'name': p.name, 'color': p.color_id} for p in pin_types}
+    colors = {str(p.color_id): p.color.name for p in pin_types}
+    return types, colors
+
+def map_pins_etag(request):
+    state = map_pins_queryset().aggregate(count=Count('id'), max_id=Max('id'), updated=Max('updated_at'))
+    lookups = pin_lookups()
+    # Each encoding and negotiated renderer is a different representation
+    representation = [request.GET.get('encoding'), request.headers.get('Accept')]
+    raw = json.dumps([state, lookups, representation], default=str, sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def pack(typecode, values):
+    buffer = array(typecode, values)
+    if sys.byteorder == 'big':
+        buffer.byteswap()
+    return base64.b64encode(buffer.tobytes()).decode()
+
+@vary_on_headers('Accept')
+@condition(etag_func=map_pins_etag)
+@cache_control(no_cache=True)
+@api_view(['GET'])
+def map_pins(request):
+    """
+    Parallel arrays id/lat/lng/type plus pin_types/colors lookup tables.
+
+    `?encoding=packed` returns the columns as base64 little-endian buffers instead
+    (uint32 ids, float32 lat/lng pairs, uint32 type ids with 0 for none).
+    """
+    rows = list(map_pins_queryset().order_by('id').values_list('id', 'latitude', 'longitude', 'type_id'))
+    ids, lats, lngs, types = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+    pin_types, colors = pin_lookups()
+    data = {'count': len(rows), 'pin_types': pin_types, 'colors': colors}
+
+    if request.query_params.get('encoding') == 'packed':
+        coords = [value for pair in zip(lats, lngs) for value in pair]
+        data.update({
+            'encoding': 'packed',
+            'id': pack('I', ids),
+            'coords': pack('f', coords),
+            'type': pack('I', [t or 0 for t in types]),
+        })
+    else:
+        data.update({
+            'encoding': 'json',
+            'id': ids,
+            'lat': [round(v, 6) for v in lats],
+            'lng': [round(v, 6) for v in lngs],
+            'type': types,
+        })
+    return Response(data)
+
+# 🎯 Server-side clusters for the map viewport, served from an in-memory index
+WORLD_BBOX = (-180.0, -85.0, 180.0, 85.0)
+
+@api_view(['GET'])
+def map_clusters(request):
+    """
+    `?zoom=<0..22>&bbox=min_lng,min_lat,max_lng,max_lat` returns the clusters
+    (centroid, count, dominant pin type/color) and the lone pins in the box.
+    Past zoom 15 every venue comes back as a pin.
+    """
+    try:
+        zoom = int(request.query_params.get('zoom', 0))
+        raw_bbox = request.query_params.get('bbox')
+        bbox = tuple(float(v) for v in raw_bbox.split(',')) if raw_bbox else WORLD_BBOX
+    except ValueError:
+        return Response({'error': "zoom must be an integer and bbox four numbers."}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= zoom <= MAX_ZOOM:
+        return Response({'error': f"zoom must be between 0 and {MAX_ZOOM}."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        return Response({'error': "bbox must be min_lng,min_lat,max_lng,max_lat."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(query_clusters(zoom, bbox))
+
+# 🗺️ Venue layer as Mapbox Vector Tiles, cached per tile with a content-hash ETag
+@require_GET
+def venue_tile(request, z, x, y):
+    if z > MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+        raise Http404
+    etag, content = get_tile(z, x, y)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/vnd.mapbox-vector-tile')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.TILE_MAX_AGE)
+    return response
+
+# 📡 Live venue state deltas as Server-Sent Events (see clubs.push)
+@require_GET
+def activity_events(request):
+    return event_stream_response(request)
+
+# 🎯 Streaming export for staff (CSV / JSONL / Parquet), flat memory at any table size
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_activities(request, file_format):
+    if file_format not in CONTENT_TYPES:
+        return Response({'error': f"Unsupported format '{file_format}'."}, status=status.HTTP_404_NOT_FOUND)
+    if file_format == 'parquet' and not parquet_available():
+        return Response({'error': "Parquet export needs pyarrow installed."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    chunks = astream_export(file_format) if isinstance(request._request, ASGIRequest) else stream_export(file_format)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="activities.{file_format}"'
+    return response
+
+# ✅ Toggles flip the flag in one UPDATE ... RETURNING (see clubs.status)
+def toggle_response(field, pk):
+    states = toggle(field, [pk])
+    if not states:
+        raise Http404("No Activities matches the given query.")
+    state = states[0]
+    return Response({'status': 'updated', field: state[field], 'version': state['version']}, status=status.HTTP_200_OK)
+
 # ✅ PATCH endpoint to toggle is_active
 @api_view(['PATCH'])
 def toggle_activity_status(request, pk):
-    activity = get_object_or_404(Activities, pk=pk)
-    activity.is_active = not activity.is_active
-    activity.save()
-    return Response({'status': 'updated', 'is_active': activity.is_active}, status=status.HTTP_200_OK)
+    return toggle_response('is_active', pk)
 
 # ✅ PATCH endpoint to toggle live
 @api_view(['PATCH'])
 def toggle_activity_live(request, pk):
-    activity = get_object_or_404(Activities, pk=pk)
-    activity.live = not activity.live
-    activity.save()
-    return Response({'status': 'updated', 'live': activity.live}, status=status.HTTP_200_OK)
+    return toggle_response('live', pk)
+
+# ✅ PATCH endpoint to set live/is_active, conditional on If-Match: "<version>"
+def parse_if_match(request):
+    """The version named by If-Match; None when absent or "*"."""
+    header = request.headers.get('If-Match', '').strip()
+    if not header or header == '*':
+        return None
+    return int(header.removeprefix('W/').strip('"'))
+
+@api_view(['PATCH'])
+@permission_classes([IsAdminUser])
+def set_activity_status(request, pk):
+    serializer = ActivityStatusSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        expected_version = parse_if_match(request)
+    except ValueError:
+        return Response({'error': 'If-Match must be a venue version.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    state = set_status(pk, serializer.validated_data, expected_version)
+    if state is None:
+        current = Activities.objects.filter(pk=pk).values_list('version', flat=True).first()
+        if current is None:
+            raise Http404("No Activities matches the given query.")
+        response = Response({'error': 'Venue changed since it was read.', 'version': current},
+                            status=status.HTTP_412_PRECONDITION_FAILED)
+        response['ETag'] = f'"{current}"'
+        return response
+    response = Response({'status': 'updated', **state}, status=status.HTTP_200_OK)
+    response['ETag'] = f'"{state["version"]}"'
+    return response
+
+# ✅ PATCH endpoint to flip one flag on many venues at once
+@api_view(['PATCH'])
+@permission_classes([IsAdminUser])
+def bulk_toggle_activities(request):
+    serializer = BulkToggleSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    states = toggle(serializer.validated_data['field'], ids)
+    found = {state['id'] for state in states}
+    return Response({
+        'status': 'updated',
+        'updated': states,
+        'missing': [pk for pk in ids if pk not in found],
+    }, status=status.HTTP_200_OK)
 
 # 🎯 Support API endpoints for dropdowns
 class GenreListAPIView(generics.ListAPIView):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
 
+    @cached_lookup(Genre)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 class EventTypeListAPIView(generics.ListAPIView):
     queryset = EventType.objects.all()
     serializer_class = EventTypeSerializer
 
+    @cached_lookup(EventType)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 class PriceCategoryListAPIView(generics.ListAPIView):
     queryset = PriceCategory.objects.all()
     serializer_class = PriceCategorySerializer
+
+    @cached_lookup(PriceCategory)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
@@ -0,0 +1,52 @@
+"""
+Small in-process background runner for work that must not block a request
+(network enrichment, media downloads).
+
+Tasks run on a bounded thread pool shared by the whole process. Queue them
+with ``submit_on_commit`` from inside a request so they only start once the
+rows they read have been committed. ``BACKGROUND_TASKS_EAGER = True`` runs
+tasks inline, which is what tests and management commands want.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='out2nite-bg',
+            )
+        return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, '__name__', func))
+    finally:
+        # Worker threads keep their own DB connection; don't let it go stale
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    if settings.BACKGROUND_TASKS_EAGER:
+        func(*args, **kwargs)
+        return None
+    return _get_executor().submit(_run, func, args, kwargs)
+
+
+def submit_on_commit(func, *args, **kwargs):
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
@@ -0,0 +1,43 @@
+"""
+Read replica routing for SQLite deployments (SQLITE_READ_REPLICA=True).
+
+Reads of the public, read-mostly models (venues and the lookup lists) go to
+the read-only "replica" connection; everything else, and every write, stays
+on "default". Reads made inside a transaction on "default" stay there too,
+so a view that writes and reads back sees its own write even when the
+replica is a snapshot copy.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+REPLICA_MODELS = {
+    'clubs.activities',
+    'clubs.activitytombstone',
+    'clubs.genre',
+    'clubs.eventtype',
+    'clubs.pricecategory',
+    'clubs.pintype',
+    'clubs.pointcolor',
+    'users.genre',
+    'users.mood',
+}
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database (or a copy of it)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
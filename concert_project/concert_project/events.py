@@ -0,0 +1,238 @@
+"""
+Push channel for small state deltas, streamed to clients as Server-Sent Events.
+
+Apps ``publish_on_commit(event, data)``; the events endpoint streams every
+event to every connected client. The broker is pluggable
+(``settings.EVENTS_BROKER``, a dotted path):
+
+- ``LocalBroker`` keeps events in process memory: runserver, tests, a
+  single worker.
+- ``RedisBroker`` appends them to a Redis stream that every worker reads, so
+  an event published by one worker reaches clients connected to any other.
+  Needs the ``redis`` package.
+
+Both keep the last ``EVENTS_HISTORY`` events. A client that reconnects with
+``Last-Event-ID`` gets what it missed; one that has been gone longer gets a
+``reset`` event and should refetch. Streams close after
+``EVENTS_STREAM_MAX_AGE`` seconds and browsers reconnect on their own, so
+no event is lost across deploys.
+
+Under ASGI (concert_project.asgi, which render.yaml runs on gunicorn's
+uvicorn worker) a connected client is a coroutine waiting on the broker.
+Under WSGI (runserver, the test client) it holds a worker thread until the
+stream closes, so never serve this endpoint from sync gunicorn workers.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+RESET = 'reset'
+
+
+class LocalBroker:
+    def __init__(self, history):
+        self._events = deque(maxlen=history)  # (id, event, data)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._waiters = set()  # (loop, asyncio.Event) of waiting coroutines
+
+    def publish(self, event, data):
+        with self._condition:
+            self._seq += 1
+            self._events.append((str(self._seq), event, data))
+            self._condition.notify_all()
+            waiters = list(self._waiters)
+        for loop, ready in waiters:
+            loop.call_soon_threadsafe(ready.set)
+
+    def last_id(self):
+        return str(self._seq)
+
+    def _after(self, last_id):
+        """(events after last_id, whether some of them are no longer kept)."""
+        try:
+            last = int(last_id)
+        except (TypeError, ValueError):
+            return [], True
+        first = int(self._events[0][0]) if self._events else self._seq + 1
+        if last > self._seq or last < first - 1:
+            return [], True
+        return [entry for entry in self._events if int(entry[0]) > last], False
+
+    def read(self, last_id, timeout):
+        with self._condition:
+            events, gap = self._after(last_id)
+            if not events and not gap:
+                self._condition.wait(timeout)
+                events, gap = self._after(last_id)
+            return events, gap
+
+    async def aread(self, last_id, timeout):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._condition:
+            events, gap = self._after(last_id)
+            if events or gap:
+                return events, gap
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                self._waiters.discard(waiter)
+        with self._condition:
+            return self._after(last_id)
+
+
+class RedisBroker:
+    STREAM_KEY = 'out2nite:events'
+
+    def __init__(self, history):
+        import redis
+
+        self.history = history
+        self._client = redis.Redis.from_url(settings.EVENTS_REDIS_URL)
+        # redis.asyncio clients are bound to the event loop that created them
+        self._async_clients = WeakKeyDictionary()
+
+    def _async_client(self):
+        import redis.asyncio
+
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = redis.asyncio.Redis.from_url(settings.EVENTS_REDIS_URL)
+        return self._async_clients[loop]
+
+    def publish(self, event, data):
+        self._client.xadd(
+            self.STREAM_KEY, {'event': event, 'data': json.dumps(data)},
+            maxlen=self.history, approximate=True,
+        )
+
+    def last_id(self):
+        latest = self._client.xrevrange(self.STREAM_KEY, count=1)
+        return latest[0][0].decode() if latest else '0-0'
+
+    @staticmethod
+    def _key(stream_id):
+        try:
+            ms, _, seq = stream_id.partition('-')
+            return int(ms), int(seq or 0)
+        except (AttributeError, ValueError):
+            return None
+
+    def _gap(self, first, last_id):
+        last = self._key(last_id)
+        if last is None:
+            return True
+        # Trimmed past the client's position: whatever came in between is gone
+        return bool(first) and last != (0, 0) and self._key(first[0][0].decode()) > last
+
+    def _events(self, response):
+        return [
+            (entry_id.decode(), fields[b'event'].decode(), json.loads(fields[b'data']))
+            for _, entries in response or [] for entry_id, fields in entries
+        ]
+
+    def read(self, last_id, timeout):
+        if self._gap(self._client.xrange(self.STREAM_KEY, count=1), last_id):
+            return [], True
+        response = self._client.xread({self.STREAM_KEY: last_id}, count=100, block=int(timeout * 1000))
+        return self._events(response), False
+
+    async def aread(self, last_id, timeout):
+        client = self._async_client()
+        if self._gap(await client.xrange(self.STREAM_KEY, count=1), last_id):
+            return [], True
+        response = await client.xread({self.STREAM_KEY: last_id}, count=100, block=int(timeout * 1000))
+        return self._events(response), False
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BROKER)(settings.EVENTS_HISTORY)
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(event, data):
+    # A broker outage must not fail the write that triggered the event
+    try:
+        get_broker().publish(event, data)
+    except Exception:
+        logger.exception("Could not publish %s event", event)
+
+
+def publish_on_commit(event, data):
+    transaction.on_commit(lambda: publish(event, data))
+
+
+def _message(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _messages(broker, events, gap, last_id):
+    """SSE chunks for one read, and the id to resume from."""
+    if gap:
+        last_id = broker.last_id()
+        return [_message(last_id, RESET, {})], last_id
+    if not events:
+        return [': ping\n\n'], last_id
+    return [_message(*event) for event in events], events[-1][0]
+
+
+def stream(broker, last_id):
+    deadline = time.monotonic() + settings.EVENTS_STREAM_MAX_AGE
+    yield f"retry: {settings.EVENTS_RETRY_MS}\n\n"
+    while time.monotonic() < deadline:
+        messages, last_id = _messages(broker, *broker.read(last_id, settings.EVENTS_HEARTBEAT), last_id)
+        yield from messages
+
+
+async def astream(broker, last_id):
+    deadline = time.monotonic() + settings.EVENTS_STREAM_MAX_AGE
+    yield f"retry: {settings.EVENTS_RETRY_MS}\n\n"
+    while time.monotonic() < deadline:
+        messages, last_id = _messages(broker, *await broker.aread(last_id, settings.EVENTS_HEARTBEAT), last_id)
+        for message in messages:
+            yield message
+
+
+def event_stream_response(request):
+    """
+    text/event-stream of everything published from now on, or since the
+    client's Last-Event-ID when it is reconnecting.
+    """
+    from django.core.handlers.asgi import ASGIRequest
+
+    broker = get_broker()
+    last_id = request.headers.get('Last-Event-ID') or broker.last_id()
+    events = astream(broker, last_id) if isinstance(request, ASGIRequest) else stream(broker, last_id)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Nginx and Render's proxy would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,134 @@
+"""
+Resized WebP (optionally AVIF) variants of uploaded images.
+
+Each image field that wants variants has a JSON manifest field next to it
+(e.g. ``profile_picture`` / ``profile_picture_variants``). When a model is
+saved with a new file, ``queue_variants`` renders IMAGE_VARIANT_WIDTHS wide
+copies in IMAGE_VARIANT_FORMATS on the background pool and records them in
+the manifest::
+
+    {"source": "profile_pics/a.png",
+     "variants": {"image/webp": [[64, "variants/profile_pics/a.3f2c9e1d0b7a.64.webp"], ...]}}
+
+Variant names carry a hash of the source bytes, so their URLs never change
+meaning and can be cached forever. Reads (``variant_url``, ``srcset``) only
+look at the manifest, never at the files, and fall back to the original
+until the variants exist. ``generate_image_variants`` backfills old uploads.
+"""
+import hashlib
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from concert_project.background import submit_on_commit
+
+FORMATS = {
+    'image/webp': ('WEBP', '.webp'),
+    'image/avif': ('AVIF', '.avif'),
+}
+
+VARIANTS_DIR = 'variants'
+
+
+def manifest_field(field_name):
+    return f'{field_name}_variants'
+
+
+def _variant_name(source_name, digest, width, extension):
+    stem = os.path.splitext(source_name)[0]
+    return f'{VARIANTS_DIR}/{stem}.{digest}.{width}{extension}'
+
+
+def render_variants(source_name, storage=default_storage):
+    """Write the variants of one stored image; returns its manifest."""
+    with storage.open(source_name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    # Never upscale: sizes wider than the source collapse into one at the source width
+    widths = sorted({min(width, image.width) for width in settings.IMAGE_VARIANT_WIDTHS})
+    variants = {}
+    for content_type in settings.IMAGE_VARIANT_FORMATS:
+        pil_format, extension = FORMATS[content_type]
+        entries = []
+        for width in widths:
+            name = _variant_name(source_name, digest, width, extension)
+            if not storage.exists(name):
+                height = max(1, round(image.height * width / image.width))
+                copy = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                buffer = BytesIO()
+                copy.save(buffer, pil_format, quality=settings.IMAGE_VARIANT_QUALITY)
+                storage.save(name, ContentFile(buffer.getvalue()))
+            entries.append([width, name])
+        variants[content_type] = entries
+    return {'source': source_name, 'variants': variants}
+
+
+def delete_variants(manifest, storage=default_storage):
+    for entries in (manifest or {}).get('variants', {}).values():
+        for _, name in entries:
+            storage.delete(name)
+
+
+def generate_variants(model, pk, field_name):
+    """Background task: (re)build the manifest of one instance's image field."""
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    file = getattr(instance, field_name)
+    old = getattr(instance, manifest_field(field_name)) or {}
+    if not file:
+        manifest = {}
+    elif old.get('source') == file.name:
+        return
+    else:
+        manifest = render_variants(file.name, file.storage)
+    if old:
+        delete_variants(old, file.storage)
+    setattr(instance, manifest_field(field_name), manifest)
+    # auto_now columns too: delta sync (clubs.sync) finds changed rows by updated_at
+    touched = [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+    instance.save(update_fields=[manifest_field(field_name), *touched])
+
+
+def variants_stale(instance, field_name):
+    file = getattr(instance, field_name)
+    manifest = getattr(instance, manifest_field(field_name)) or {}
+    return (file.name or None) != manifest.get('source')
+
+
+def queue_variants(instance, field_name):
+    """Build the variants once the current transaction commits, if the file changed."""
+    if variants_stale(instance, field_name):
+        submit_on_commit(generate_variants, type(instance), instance.pk, field_name)
+
+
+def variant_url(instance, field_name, width=None, content_type='image/webp'):
+    """URL of the smallest variant at least width wide (the largest if none is); the original if none exist."""
+    file = getattr(instance, field_name)
+    if not file:
+        return None
+    manifest = getattr(instance, manifest_field(field_name)) or {}
+    entries = manifest.get('variants', {}).get(content_type) if manifest.get('source') == file.name else None
+    if not entries or width is None:
+        return file.url
+    name = next((name for w, name in entries if w >= width), entries[-1][1])
+    return file.storage.url(name)
+
+
+def srcset(instance, field_name, build_url=str):
+    """{content type: "url 64w, url 256w, ..."}, empty until the variants exist."""
+    file = getattr(instance, field_name)
+    manifest = getattr(instance, manifest_field(field_name)) or {}
+    if not file or manifest.get('source') != file.name:
+        return {}
+    return {
+        content_type: ', '.join(f'{build_url(file.storage.url(name))} {width}w' for width, name in entries)
+        for content_type, entries in manifest['variants'].items()
+    }
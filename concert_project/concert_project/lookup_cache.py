@@ -0,0 +1,123 @@
+"""
+Versioned response cache for small, rarely changing lookup tables
+(genres, event types, price categories, moods).
+
+Every cached table has a version stamp in the shared Django cache
+(``settings.LOOKUP_CACHE_ALIAS``). Rendered responses are stored under that
+version in the shared cache and in a small in-process LRU, so a warm request
+costs one cache read and skips both the ORM and serialization. Saving or
+deleting a row bumps the version (see the post_save/post_delete receivers
+wired in each app's signals module), which invalidates every worker at once
+as long as the cache backend itself is shared (file-based or Redis).
+"""
+import hashlib
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from rest_framework.response import Response
+
+LOCAL_MAX_ENTRIES = 256
+
+_local = OrderedDict()
+_local_lock = Lock()
+
+
+def _cache():
+    return caches[settings.LOOKUP_CACHE_ALIAS]
+
+
+def _version_key(name):
+    return f'lookups:version:{name}'
+
+
+def lookup_version(name):
+    """Current version stamp of a lookup table, creating one on first use."""
+    cache = _cache()
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), uuid.uuid4().hex[:12], None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def invalidate_lookup(name):
+    _cache().set(_version_key(name), uuid.uuid4().hex[:12], None)
+
+
+def invalidate_lookup_model(sender, **kwargs):
+    """post_save/post_delete receiver: bump the version of the sender's table."""
+    invalidate_lookup(sender._meta.label)
+
+
+def _local_get(key):
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is not None:
+            _local.move_to_end(key)
+        return entry
+
+
+def _local_set(key, entry):
+    with _local_lock:
+        _local[key] = entry
+        _local.move_to_end(key)
+        while len(_local) > LOCAL_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+
+def _finish(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.LOOKUP_CACHE_MAX_AGE)
+    return response
+
+
+def cached_lookup(model):
+    """
+    Decorate an APIView ``get`` that lists ``model`` rows.
+
+    Only JSON renderings are cached; the browsable API always goes through the view.
+    """
+    name = model._meta.label
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            renderer_format = request.accepted_renderer.format
+            if renderer_format != 'json':
+                return view_method(self, request, *args, **kwargs)
+
+            version = lookup_version(name)
+            variant = hashlib.sha1(request.GET.urlencode().encode()).hexdigest()[:8]
+            etag = f'"{version}-{variant}"'
+            if etag in request.headers.get('If-None-Match', ''):
+                return _finish(HttpResponseNotModified(), etag)
+
+            key = f'lookups:{name}:{version}:{variant}'
+            entry = _local_get(key)
+            if entry is None:
+                entry = _cache().get(key)
+                if entry is not None:
+                    _local_set(key, entry)
+            if entry is not None:
+                content, content_type = entry
+                return _finish(HttpResponse(content, content_type=content_type), etag)
+
+            response = view_method(self, request, *args, **kwargs)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return response
+            response.accepted_renderer = request.accepted_renderer
+            response.accepted_media_type = request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+            response.render()
+            entry = (response.content, response['Content-Type'])
+            _cache().set(key, entry, settings.LOOKUP_CACHE_TIMEOUT)
+            _local_set(key, entry)
+            return _finish(response, etag)
+        return wrapper
+    return decorator
@@ -0,0 +1,149 @@
+"""
+In-process metrics in the Prometheus text format.
+
+PerformanceMiddleware (concert_project.middleware) records per-route
+histograms here, and apps add their own numbers with ``register_collector``
+from ``AppConfig.ready()``. ``metrics_view`` serves all of it at /metrics.
+
+Everything lives in the memory of one process: with several gunicorn
+workers, each scrape reports the worker that answered it, which Prometheus
+handles fine as long as every scrape lands on some worker.
+"""
+import hmac
+import math
+from threading import Lock
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _labels(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames, buckets):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.series = {}  # label values -> [bucket counts..., sum]
+        self.lock = Lock()
+
+    def observe(self, labelvalues, value):
+        with self.lock:
+            series = self.series.get(labelvalues)
+            if series is None:
+                series = self.series[labelvalues] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((values, list(counts)) for values, counts in self.series.items())
+        for values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le=_number(bound))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.series = {}
+        self.lock = Lock()
+
+    def inc(self, labelvalues, amount=1):
+        with self.lock:
+            self.series[labelvalues] = self.series.get(labelvalues, 0) + amount
+
+    def expose(self):
+        with self.lock:
+            series = sorted(self.series.items())
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter'] + [
+            f'{self.name}{_labels(self.labelnames, values)} {_number(value)}' for values, value in series
+        ]
+
+
+_metrics = []
+_collectors = []
+
+
+def histogram(name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+    metric = Histogram(name, help, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def counter(name, help, labelnames=()):
+    metric = Counter(name, help, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector):
+    """
+    Add a callable that returns, at scrape time, an iterable of
+    ``(name, type, help, [(labels dict, value), ...])``.
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+    return collector
+
+
+def register_stats(name, help, stats, label):
+    """Expose a collections.Counter of event counts as one counter labelled by key."""
+    return register_collector(lambda: [(name, 'counter', help, [({label: key}, value) for key, value in sorted(stats.items())])])
+
+
+def reset():
+    """Forget every recorded sample (tests)."""
+    for metric in _metrics:
+        with metric.lock:
+            metric.series.clear()
+
+
+def expose():
+    lines = []
+    for metric in _metrics:
+        lines += metric.expose()
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+            lines += [f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}' for labels, value in samples]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    /metrics. With METRICS_TOKEN set, scrapers must send it as a bearer token;
+    without one the endpoint only exists in DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(given, token):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
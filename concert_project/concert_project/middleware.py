@@ -0,0 +1,157 @@
+"""
+Request-level performance instrumentation.
+
+For a sampled request (PERF_SAMPLE_RATE, 0 to 1) PerformanceMiddleware
+measures:
+
+- total wall time,
+- SQL: query count and time, through a ``connection.execute_wrapper``,
+- serialization: time spent producing ``serializer.data``, minus the SQL it
+  triggered (lazy querysets), so the parts don't overlap,
+- rendering: the response's template/JSON render,
+- the response size.
+
+They are recorded as per-route histograms, keyed by URL name (e.g.
+``activities-list``), and served at /metrics (concert_project.metrics).
+With PERF_SERVER_TIMING the same breakdown goes back in a ``Server-Timing``
+header, which browser devtools show next to the request. Unsampled requests
+only bump the request counter.
+"""
+import random
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+from . import metrics
+
+ROUTE_LABELS = ('route', 'method')
+
+REQUESTS = metrics.counter(
+    'http_requests_total', 'Requests handled, sampled or not.', ('route', 'method', 'status'),
+)
+DURATION = metrics.histogram('http_request_duration_seconds', 'Wall time of sampled requests.', ROUTE_LABELS)
+SQL_DURATION = metrics.histogram('http_request_sql_duration_seconds', 'SQL time per sampled request.', ROUTE_LABELS)
+SQL_QUERIES = metrics.histogram(
+    'http_request_sql_queries', 'SQL queries per sampled request.', ROUTE_LABELS, metrics.QUERY_BUCKETS,
+)
+SERIALIZE_DURATION = metrics.histogram(
+    'http_request_serialize_duration_seconds', 'Serializer time per sampled request, SQL excluded.', ROUTE_LABELS,
+)
+RENDER_DURATION = metrics.histogram('http_request_render_duration_seconds', 'Response render time.', ROUTE_LABELS)
+RESPONSE_SIZE = metrics.histogram(
+    'http_response_size_bytes', 'Body size of sampled responses.', ROUTE_LABELS, metrics.BYTES_BUCKETS,
+)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = perf_counter()
+        self.total = self.sql = self.serialize = self.render = 0.0
+        self.queries = 0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self):
+        app = max(self.total - self.sql - self.serialize - self.render, 0)
+        parts = [
+            f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'app;dur={app * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ]
+        return ', '.join(parts)
+
+
+def _timed_data(data):
+    def timed(serializer):
+        timings = _current.get()
+        if timings is None or timings.serializing:
+            return data.fget(serializer)
+        timings.serializing = True
+        start, sql_before = perf_counter(), timings.sql
+        try:
+            return data.fget(serializer)
+        finally:
+            timings.serializing = False
+            timings.serialize += perf_counter() - start - (timings.sql - sql_before)
+
+    timed = property(timed)
+    timed.fget.instrumented = True
+    return timed
+
+
+def instrument_serializers():
+    """Time BaseSerializer.data, which Serializer.data and ListSerializer.data both go through."""
+    if not getattr(BaseSerializer.data.fget, 'instrumented', False):
+        BaseSerializer.data = _timed_data(BaseSerializer.data)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class PerformanceMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        rate = settings.PERF_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            response = self.get_response(request)
+            REQUESTS.inc((route_name(request), request.method, str(response.status_code)))
+            return response
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timings.total = perf_counter() - timings.started
+
+        labels = (route_name(request), request.method)
+        REQUESTS.inc((*labels, str(response.status_code)))
+        DURATION.observe(labels, timings.total)
+        SQL_DURATION.observe(labels, timings.sql)
+        SQL_QUERIES.observe(labels, timings.queries)
+        SERIALIZE_DURATION.observe(labels, timings.serialize)
+        RENDER_DURATION.observe(labels, timings.render)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing()
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that separately
+        timings = _current.get()
+        if timings is not None:
+            start = perf_counter()
+
+            def rendered(response):
+                timings.render += perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
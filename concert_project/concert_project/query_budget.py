@@ -0,0 +1,73 @@
+"""
+Per-endpoint SQL query budgets for the API test suites.
+
+Each app's tests list a budget for every named route in its urls module;
+an endpoint that starts issuing more queries (an N+1 sneaking back into a
+serializer, a missing select_related) fails CI instead of production.
+"""
+from importlib import import_module
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class QueryBudgetMixin:
+    """
+    Mix into an APITestCase and set:
+
+    - ``budget_urlconf``: dotted path of the urls module under test.
+    - ``query_budgets``: url name -> dict with ``budget`` (max queries) and optional
+      ``method``, ``kwargs``, ``data``, ``format`` and ``authenticated``. ``kwargs``
+      and ``data`` may be callables taking the test case, for fixture-dependent values.
+    - ``budget_user_factory``: callable taking the test case and returning the user to
+      authenticate as, if any budget is marked ``authenticated``.
+    """
+    budget_urlconf = None
+    query_budgets = {}
+    budget_user_factory = None
+
+    def route_names(self):
+        patterns = import_module(self.budget_urlconf).urlpatterns
+        return {p.name for p in patterns if isinstance(p, URLPattern) and p.name}
+
+    def test_every_route_has_a_budget(self):
+        missing = self.route_names() - set(self.query_budgets)
+        self.assertFalse(missing, f"Routes without a query budget: {sorted(missing)}")
+
+    def test_routes_stay_within_query_budget(self):
+        for name, spec in self.query_budgets.items():
+            with self.subTest(route=name):
+                used, response = self.count_queries(name, spec)
+                self.assertLess(response.status_code, 400, f"{name} returned {response.status_code}")
+                self.assertLessEqual(
+                    used, spec['budget'],
+                    f"{name} ran {used} queries, budget is {spec['budget']}",
+                )
+
+    def count_queries(self, name, spec, **params):
+        kwargs = spec.get('kwargs')
+        if callable(kwargs):
+            kwargs = kwargs(self)
+        url = reverse(name, kwargs=kwargs)
+        # Budgets are for the cold path: start every request with empty caches
+        for cache in caches.all():
+            cache.clear()
+        # Authenticate through the real access cookie so auth queries count too
+        self.client.cookies.clear()
+        if spec.get('authenticated'):
+            self.assertIsNotNone(self.budget_user_factory, f"{name} is authenticated but budget_user_factory is not set")
+            self.client.cookies['access'] = str(AccessToken.for_user(self.budget_user_factory(self)))
+        method = getattr(self.client, spec.get('method', 'get'))
+        data = spec.get('data')
+        if callable(data):
+            data = data(self)
+        if params:
+            data = {**(data or {}), **params}
+        with CaptureQueriesContext(connection) as ctx:
+            response = method(url, data, format=spec.get('format'))
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return len(ctx.captured_queries), response
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
+from urllib.parse import unquote, urlsplit
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,9 +48,11 @@ INSTALLED_APPS = [
     'clubs',
     'import_export',
     'django_filters',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    'concert_project.middleware.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,13 +86,197 @@ WSGI_APPLICATION = 'concert_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DATABASE_BACKEND=sqlite (default) is for development. Production runs on
+# postgres, which needs psycopg ("psycopg[binary,pool]"); when the server has
+# PostGIS, venue map queries use a geography index (see clubs.geo).
+# Connection settings come from DATABASE_URL (as Render provides it) or the
+# POSTGRES_* variables.
+
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "sqlite")
+
+if DATABASE_BACKEND == "postgres":
+    _database_url = urlsplit(os.getenv("DATABASE_URL", ""))
+    _default_database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': unquote(_database_url.path.lstrip('/')) or os.getenv("POSTGRES_DB", "out2nite"),
+        'USER': unquote(_database_url.username or '') or os.getenv("POSTGRES_USER", "out2nite"),
+        'PASSWORD': unquote(_database_url.password or '') or os.getenv("POSTGRES_PASSWORD", ""),
+        'HOST': _database_url.hostname or os.getenv("POSTGRES_HOST", "localhost"),
+        'PORT': _database_url.port or os.getenv("POSTGRES_PORT", "5432"),
+        # Reuse connections across requests, checking them before reuse
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+            'sslmode': os.getenv("DB_SSLMODE", "prefer"),
+        },
+    }
+    if os.getenv("DB_POOL") == "True":
+        # psycopg's pool replaces persistent connections; Django refuses both at once
+        _default_database['CONN_MAX_AGE'] = 0
+        _default_database['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            'timeout': int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+else:
+    _sqlite_path = os.getenv("SQLITE_PATH", BASE_DIR / 'db.sqlite3')
+    _default_database = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH points the project at another file, e.g. a benchmark database
+        'NAME': _sqlite_path,
+        'OPTIONS': {
+            # WAL lets readers run alongside a writer; NORMAL sync is safe under WAL.
+            # Pragmas are per connection, except journal_mode which sticks to the file.
+            'init_command': (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+                f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', 64 * 1024))};"
+                "PRAGMA temp_store=MEMORY;"
+            ),
+            # Seconds a writer waits for the lock before "database is locked"
+            'timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT", "20")),
+            # Take the write lock up front so two transactions can't deadlock upgrading
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
+
+DATABASES = {
+    'default': _default_database,
+}
+
+# SQLITE_READ_REPLICA=True adds a read-only "replica" connection that
+# concert_project.db_router sends the public read traffic to: the same file
+# opened read-only, or a snapshot copy at SQLITE_REPLICA_PATH.
+if DATABASE_BACKEND != "postgres" and os.getenv("SQLITE_READ_REPLICA") == "True":
+    _replica_path = Path(os.getenv("SQLITE_REPLICA_PATH", _sqlite_path)).resolve()
+    DATABASES['replica'] = {
+        **_default_database,
+        'NAME': f"file:{_replica_path}?mode=ro",
+        'OPTIONS': {
+            **_default_database['OPTIONS'],
+            'uri': True,
+            # journal_mode can't be changed on a read-only connection
+            'init_command': _default_database['OPTIONS']['init_command'].replace("PRAGMA journal_mode=WAL;", ""),
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['concert_project.db_router.ReadReplicaRouter']
+
+
+# Cache
+# CACHE_BACKEND=locmem is per process; use file or redis when running several
+# gunicorn workers so lookup invalidations reach every worker.
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+
+if CACHE_BACKEND == "redis":
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv("CACHE_URL", "redis://127.0.0.1:6379/1"),
+    }
+elif CACHE_BACKEND == "file":
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv("CACHE_URL", os.path.join(BASE_DIR, 'django_cache')),
+    }
+else:
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
+CACHES = {
+    'default': _default_cache,
 }
 
+# Genres, event types, price categories and moods (see concert_project.lookup_cache)
+LOOKUP_CACHE_ALIAS = 'default'
+LOOKUP_CACHE_TIMEOUT = 24 * 60 * 60
+LOOKUP_CACHE_MAX_AGE = int(os.getenv("LOOKUP_CACHE_MAX_AGE", "60"))
+
+
+# Authenticated users are cached this long per access token (see users.authentication)
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "60"))
+
+
+# Signup availability checks (see users.availability)
+AVAILABILITY_CACHE_ALIAS = 'default'
+AVAILABILITY_CACHE_TIMEOUT = 10 * 60
+AVAILABILITY_THROTTLE_BURST = 20
+AVAILABILITY_THROTTLE_RATE = 5  # tokens per second
+AVAILABILITY_BLOOM_FILTER = os.getenv("AVAILABILITY_BLOOM_FILTER", "True") == "True"
+AVAILABILITY_BLOOM_ERROR_RATE = 0.01
+AVAILABILITY_BLOOM_MAX_AGE = 5 * 60
+
+
+# Request instrumentation (see concert_project.middleware and concert_project.metrics)
+PERF_SAMPLE_RATE = float(os.getenv("PERF_SAMPLE_RATE", "1.0" if DEBUG else "0.1"))
+PERF_SERVER_TIMING = os.getenv("PERF_SERVER_TIMING", str(DEBUG)) == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+# Server-side map clustering (see clubs.clusters)
+CLUSTER_INDEX_MAX_AGE = 60 * 60
+CLUSTER_CHANGE_LOG_TIMEOUT = 60 * 60
+
+# Vector tiles (see clubs.tiles); max-age lets browsers and a CDN reuse them
+TILE_CACHE_ALIAS = 'default'
+TILE_CACHE_TIMEOUT = 24 * 60 * 60
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", "60"))
+
+# Live venue updates over Server-Sent Events (see concert_project.events).
+# Use concert_project.events.RedisBroker when running more than one worker.
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", "concert_project.events.LocalBroker")
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL", os.getenv("CACHE_URL", "redis://127.0.0.1:6379/1"))
+EVENTS_HISTORY = 1000
+EVENTS_HEARTBEAT = 15
+EVENTS_RETRY_MS = 3000
+EVENTS_STREAM_MAX_AGE = int(os.getenv("EVENTS_STREAM_MAX_AGE", "300"))
+# Bulk writes touching more venues than this push a single reset instead
+EVENTS_BULK_LIMIT = 100
+
+# Most venues PATCH activities/bulk-toggle/ flips in one request
+BULK_TOGGLE_MAX_IDS = 500
+
+# Delta sync for offline clients (see clubs.sync)
+SYNC_PAGE_SIZE = 500
+SYNC_SAFETY_WINDOW = int(os.getenv("SYNC_SAFETY_WINDOW", "60"))
+# Tombstones are kept this long (prune_tombstones); a token whose deletions may be older expires
+SYNC_TOMBSTONE_RETENTION = 30 * 24 * 60 * 60
+
+
+# Scheduled deactivation of expired profiles (see users.expiry)
+PROFILE_EXPIRY_BATCH_SIZE = int(os.getenv("PROFILE_EXPIRY_BATCH_SIZE", "1000"))
+
+
+# Background work (see concert_project.background)
+
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+BACKGROUND_TASKS_EAGER = os.getenv("BACKGROUND_TASKS_EAGER") == "True"
+
+# Google Maps short-link enrichment (see clubs.enrichment)
+GOOGLE_MAPS_TIMEOUT = 5
+GOOGLE_MAPS_RETRIES = 2
+GOOGLE_MAPS_WORKERS = 8
+GOOGLE_MAPS_BATCH_SIZE = 500
+GOOGLE_MAPS_CACHE_TTL = 30 * 24 * 60 * 60
+GOOGLE_MAPS_NEGATIVE_CACHE_TTL = 60 * 60
+
+# Avatars given by URL at registration (see users.avatars)
+AVATAR_FETCH_TIMEOUT = 5
+AVATAR_FETCH_RETRIES = 2
+AVATAR_MAX_BYTES = 5 * 1024 * 1024
+
+# Resized variants of uploaded images (see concert_project.images)
+IMAGE_VARIANT_WIDTHS = [64, 256, 1024]
+IMAGE_VARIANT_FORMATS = os.getenv("IMAGE_VARIANT_FORMATS", "image/webp").split(",")
+IMAGE_VARIANT_QUALITY = 80
+PROFILE_PICTURE_SIZE = 256
+
+# Batch size of ActivitiesBulkResource / the import_activities command
+ACTIVITIES_IMPORT_BATCH_SIZE = 1000
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
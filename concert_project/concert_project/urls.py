@@ -14,13 +14,32 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from django.conf.urls.static import static
 from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from concert_project.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/", include("users.urls")),
-    path('api/', include('clubs.urls'))
-]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('api/', include('clubs.urls')),
+    path('metrics', metrics_view, name='metrics'),
+]
+
+# Image variant names are content-hashed (see concert_project.images): cache them for good
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(
+            rf'^{settings.MEDIA_URL.lstrip("/")}variants/(?P<path>.*)$',
+            cache_control(public=True, max_age=365 * 24 * 60 * 60, immutable=True)(serve),
+            {'document_root': os.path.join(settings.MEDIA_ROOT, 'variants')},
+        ),
+    ]
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -6,4 +6,8 @@ class UsersConfig(AppConfig):
     name = 'users'
 
     def ready(self):
-        import users.signals  # import signals
\ No newline at end of file
+        import users.signals  # import signals
+        from concert_project.metrics import register_collector
+        from .expiry import last_run_metrics
+
+        register_collector(last_run_metrics)
@@ -1,4 +1,99 @@
+"""
+Cookie-based JWT authentication.
+
+The user behind a token is cached for AUTH_USER_CACHE_TIMEOUT seconds under
+its id and the token's jti, together with the profile, so warm authenticated
+requests skip both queries. Each user has a version stamp in the cache:
+saving the user or the profile bumps it (see users.signals), which turns every
+cached entry for that user into a miss; logging out drops the entry of the
+token that logged out.
+
+Entries hold the column values only, never the password hash: a cached user
+comes back with ``password`` deferred, so reading it costs a query.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.fields.files import FieldFile
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def _cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'auth:user-version:{user_id}'
+
+
+def _entry_key(user_id, jti):
+    return f'auth:user:{user_id}:{jti}'
+
+
+def invalidate_user(user_id):
+    """Make every cached entry for this user a miss."""
+    _cache().set(_version_key(user_id), uuid.uuid4().hex[:12], settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def forget_token(token):
+    """Drop the cached user of one token (on logout)."""
+    _cache().delete(_entry_key(token.get(api_settings.USER_ID_CLAIM), token.get(api_settings.JTI_CLAIM)))
+
+
+def profile_is_active(user):
+    """False once the user's profile is deactivated or past activation_expires_at."""
+    try:
+        return user.profile.is_currently_active
+    except ObjectDoesNotExist:
+        return True
+
+
+def _value(instance, name):
+    value = getattr(instance, name)
+    # A FieldFile pickles its instance, and with it every related object
+    return value.name if isinstance(value, FieldFile) else value
+
+
+def _row(instance, exclude=()):
+    if instance is None:
+        return None
+    names = [f.attname for f in instance._meta.concrete_fields if f.attname not in exclude]
+    return names, [_value(instance, name) for name in names]
+
+
+def _load(model, row, using):
+    return None if row is None else model.from_db(using, *row)
+
+
+def _entry(user):
+    """The user, its profile and mood as plain column values, without the password."""
+    try:
+        profile = user.profile
+    except ObjectDoesNotExist:
+        profile = None
+    mood = profile.mood_for_tonight if profile is not None else None
+    return user._state.db, _row(user, exclude={'password'}), _row(profile), _row(mood)
+
+
+def _restore(entry):
+    """Rebuild what _entry cached, with the relations already in place."""
+    using, user_row, profile_row, mood_row = entry
+    user = _load(get_user_model(), user_row, using)
+    if profile_row is None:
+        return user
+    profile = _load(user._meta.get_field('profile').related_model, profile_row, using)
+    profile.mood_for_tonight = _load(profile._meta.get_field('mood_for_tonight').related_model, mood_row, using)
+    profile.user = user
+    user.profile = profile
+    return user
+
 
 class CookieJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
@@ -11,3 +106,44 @@ class CookieJWTAuthentication(JWTAuthentication):
             return self.get_user(validated_token), validated_token
         except Exception:
             return None
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        cache = _cache()
+        version_key = _version_key(user_id)
+        entry_key = _entry_key(user_id, validated_token.get(api_settings.JTI_CLAIM))
+        found = cache.get_many([version_key, entry_key])
+        version, entry = found.get(version_key), found.get(entry_key)
+        if version is not None and entry is not None and entry[0] == version:
+            # The profile may have expired since the entry was cached
+            return self.check_profile(_restore(entry[1]))
+
+        try:
+            # The profile comes along in the same query and is cached with the user
+            user = self.user_model.objects.select_related('profile__mood_for_tonight').get(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        if version is None:
+            cache.add(version_key, uuid.uuid4().hex[:12], settings.AUTH_USER_CACHE_TIMEOUT)
+            version = cache.get(version_key)
+        if version is not None:
+            cache.set(entry_key, (version, _entry(user)), settings.AUTH_USER_CACHE_TIMEOUT)
+        return self.check_profile(user)
+
+    def check_profile(self, user):
+        if not profile_is_active(user):
+            raise AuthenticationFailed(_("Profile is inactive"), code="profile_inactive")
+        return user
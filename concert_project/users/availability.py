@@ -0,0 +1,199 @@
+# availability.py
+"""
+Username/email availability for the signup form, which asks on every keystroke.
+
+An answer goes through up to three layers before the database:
+
+1. An optional in-process Bloom filter of every taken username and email
+   this process knows of. The filter is built in the background on first use,
+   extended when a user save commits, and rebuilt in the background every
+   AVAILABILITY_BLOOM_MAX_AGE seconds. Requests keep using the current filter
+   (or skip this layer until there is one) while a build runs. Accounts
+   created by other processes only reach the filter with the next rebuild, so
+   "not in the filter" means available as of that build, not for certain; it
+   is still the right answer for almost every keystroke.
+2. A shared cache of "taken" answers. Taken names rarely become free again, so
+   these are safe to keep for AVAILABILITY_CACHE_TIMEOUT. Deleting a user
+   clears its entries.
+3. An indexed lookup on auth_user.
+
+The answers only advise. Registration itself relies on the unique constraints.
+"""
+import hashlib
+import math
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.throttling import BaseThrottle
+
+from concert_project.background import submit
+
+def _cache():
+    return caches[settings.AVAILABILITY_CACHE_ALIAS]
+
+
+def _taken_key(field, value):
+    return f'availability:taken:{field}:{hashlib.sha1(value.encode()).hexdigest()}'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        a, b = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((a + i * b) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+_bloom = None
+_bloom_built_at = 0.0
+_bloom_lock = Lock()
+# Members marked taken while a rebuild runs, replayed into the new filter; None when idle
+_marked_during_rebuild = None
+
+
+def _member(field, value):
+    return f'{field}:{value}'
+
+
+def build_taken_filter():
+    """A Bloom filter of every taken username and email, sized with room to grow."""
+    count = User.objects.count()
+    bloom = BloomFilter(int(count * 1.5) + 10_000, settings.AVAILABILITY_BLOOM_ERROR_RATE)
+    for username, email in User.objects.values_list('username', 'email').iterator(chunk_size=5000):
+        bloom.add(_member('username', username))
+        if email:
+            bloom.add(_member('email', email))
+    return bloom
+
+
+def rebuild_taken_filter():
+    """Build a fresh filter and swap it in; requests keep the old one meanwhile."""
+    global _bloom, _bloom_built_at, _marked_during_rebuild
+    with _bloom_lock:
+        if _marked_during_rebuild is None:
+            _marked_during_rebuild = []
+    try:
+        fresh = build_taken_filter()
+        with _bloom_lock:
+            for member in _marked_during_rebuild:
+                fresh.add(member)
+            _bloom, _bloom_built_at = fresh, time.monotonic()
+    finally:
+        with _bloom_lock:
+            _marked_during_rebuild = None
+
+
+def taken_filter():
+    """
+    The process's filter, or None until the first build finishes. A missing or
+    stale (older than AVAILABILITY_BLOOM_MAX_AGE) filter is rebuilt in the background.
+    """
+    global _marked_during_rebuild
+    if not settings.AVAILABILITY_BLOOM_FILTER:
+        return None
+    with _bloom_lock:
+        bloom = _bloom
+        stale = bloom is None or time.monotonic() - _bloom_built_at > settings.AVAILABILITY_BLOOM_MAX_AGE
+        if not stale or _marked_during_rebuild is not None:
+            return bloom
+        # Claim the rebuild here so concurrent requests don't queue another
+        _marked_during_rebuild = []
+    submit(rebuild_taken_filter)
+    return _bloom
+
+
+def reset_taken_filter():
+    global _bloom
+    with _bloom_lock:
+        _bloom = None
+
+
+def mark_taken(user):
+    """
+    post_save: add the user to this process's filter, and to the one being
+    built, once the save commits. Marked earlier, a rebuild starting before the
+    commit would not see the row and would swap the marked filter out.
+    """
+    members = [_member('username', user.username)]
+    if user.email:
+        members.append(_member('email', user.email))
+    transaction.on_commit(lambda: _mark(members))
+
+
+def _mark(members):
+    with _bloom_lock:
+        for member in members:
+            if _bloom is not None:
+                _bloom.add(member)
+            if _marked_during_rebuild is not None:
+                _marked_during_rebuild.append(member)
+
+
+def forget_taken(user):
+    """post_delete: the user's names are free again."""
+    _cache().delete_many([_taken_key('username', user.username), _taken_key('email', user.email)])
+
+
+def is_available(field, value):
+    if field == 'email' and not value:
+        return False
+    bloom = taken_filter()
+    if bloom is not None and _member(field, value) not in bloom:
+        return True
+
+    cache = _cache()
+    key = _taken_key(field, value)
+    if cache.get(key):
+        return False
+    taken = User.objects.filter(**{field: value}).exists()
+    if taken:
+        cache.set(key, True, settings.AVAILABILITY_CACHE_TIMEOUT)
+    return not taken
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Per-IP token bucket kept in the shared cache: AVAILABILITY_THROTTLE_BURST
+    requests at once, refilled at AVAILABILITY_THROTTLE_RATE per second. The
+    read-modify-write is not atomic, so concurrent requests from one IP may
+    occasionally both get the last token.
+    """
+    scope = 'availability'
+
+    def allow_request(self, request, view):
+        burst = settings.AVAILABILITY_THROTTLE_BURST
+        rate = settings.AVAILABILITY_THROTTLE_RATE
+        cache = _cache()
+        key = f'throttle:{self.scope}:{self.get_ident(request)}'
+        now = time.time()
+
+        tokens, updated = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.retry_after = None if allowed else (1 - tokens) / rate
+        # Idle buckets refill to full; no need to keep them longer than that
+        cache.set(key, (tokens, now), math.ceil(burst / rate) + 1)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,102 @@
+# avatars.py
+"""
+Fetch avatars given by URL at registration, off the request path.
+
+Registration only records the URL and queues fetch_avatar() to run once the
+new account has committed (concert_project.background). Until the fetch
+succeeds the profile shows the default avatar. A download is bounded by a
+timeout, a byte limit and an allow-list of image content types, and the body
+must actually decode as an image. Connection errors and 5xx responses are
+retried with backoff; anything else is given up on and logged.
+"""
+import logging
+import os
+import time
+import uuid
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from concert_project.background import submit_on_commit
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+
+class AvatarRejected(Exception):
+    """The URL answered, but not with an acceptable image: not worth retrying."""
+
+
+def download_avatar(url, session=None, timeout=None, max_bytes=None):
+    """(content, extension) of the image at url, raising AvatarRejected or requests errors."""
+    session = session or requests
+    timeout = timeout if timeout is not None else settings.AVATAR_FETCH_TIMEOUT
+    max_bytes = max_bytes or settings.AVATAR_MAX_BYTES
+    if urlsplit(url).scheme not in ('http', 'https'):
+        raise AvatarRejected(f"unsupported URL scheme: {url}")
+
+    with session.get(url, stream=True, timeout=timeout) as response:
+        if 400 <= response.status_code < 500:
+            raise AvatarRejected(f"HTTP {response.status_code}")
+        response.raise_for_status()
+
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        extension = CONTENT_TYPE_EXTENSIONS.get(content_type)
+        if extension is None:
+            raise AvatarRejected(f"unsupported content type {content_type!r}")
+        if int(response.headers.get('Content-Length') or 0) > max_bytes:
+            raise AvatarRejected("image too large")
+
+        chunks, size = [], 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > max_bytes:
+                raise AvatarRejected("image too large")
+            chunks.append(chunk)
+
+    content = b''.join(chunks)
+    try:
+        Image.open(BytesIO(content)).verify()
+    except Exception as e:
+        raise AvatarRejected(f"not a valid image: {e}") from e
+    return content, extension
+
+
+def fetch_avatar(profile_id, url, session=None, retries=None):
+    """Download url into the profile's picture, unless the user has set one meanwhile."""
+    retries = retries if retries is not None else settings.AVATAR_FETCH_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            content, extension = download_avatar(url, session=session)
+            break
+        except AvatarRejected as e:
+            logger.warning("Avatar %s for profile %s rejected: %s", url, profile_id, e)
+            return False
+        except requests.RequestException as e:
+            if attempt == retries:
+                logger.warning("Avatar %s for profile %s failed: %s", url, profile_id, e)
+                return False
+            time.sleep(0.5 * 2 ** attempt)
+
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or profile.profile_picture:
+        return False
+    profile.profile_picture.save(f"{uuid.uuid4()}{extension}", ContentFile(content), save=False)
+    profile.save(update_fields=['profile_picture'])
+    return True
+
+
+def queue_avatar_fetch(profile, url):
+    """Fetch the avatar in the background once the current transaction commits."""
+    submit_on_commit(fetch_avatar, profile.pk, url)
@@ -0,0 +1,81 @@
+# expiry.py
+"""
+Deactivation of profiles whose activation_expires_at has passed.
+
+The expire_profiles command flips them in batches of PROFILE_EXPIRY_BATCH_SIZE,
+one UPDATE per batch driven by the partial index on active profiles. Schedule
+it wherever the web service's database is reachable (same DATABASE_BACKEND and
+DATABASE_URL); a job with its own local SQLite file would sweep nothing.
+Reads never write: authentication and the profile serializer go through
+UserProfile.is_currently_active, which already treats an expired profile as
+inactive, so between runs nothing depends on the flag having been flipped.
+
+Each run is counted in EXPIRY_STATS (this process) and its summary is kept
+in the default cache under LAST_RUN_KEY, so a web process can report what
+the last scheduled run did at /metrics (with a shared cache backend).
+"""
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import UserProfile
+
+EXPIRY_STATS = Counter()
+
+LAST_RUN_KEY = 'profiles:expiry:last-run'
+
+
+def expired_profiles(now=None):
+    return UserProfile.objects.filter(is_active=True, activation_expires_at__lt=now or timezone.now())
+
+
+def expire_profiles(batch_size=None, now=None):
+    """Deactivate every expired profile; returns a summary of the run."""
+    batch_size = batch_size or settings.PROFILE_EXPIRY_BATCH_SIZE
+    now = now or timezone.now()
+    started = time.monotonic()
+    deactivated = batches = 0
+    while True:
+        # UPDATE ... WHERE id IN (SELECT id ... LIMIT n): one short statement per batch
+        batch = expired_profiles(now).order_by('activation_expires_at').values('pk')[:batch_size]
+        count = UserProfile.objects.filter(pk__in=batch).update(is_active=False)
+        if not count:
+            break
+        deactivated += count
+        batches += 1
+
+    summary = {
+        'deactivated': deactivated,
+        'batches': batches,
+        'duration_ms': round((time.monotonic() - started) * 1000, 1),
+        'finished_at': timezone.now().isoformat(),
+    }
+    EXPIRY_STATS['runs'] += 1
+    EXPIRY_STATS['deactivated'] += deactivated
+    EXPIRY_STATS['batches'] += batches
+    cache.set(LAST_RUN_KEY, summary, None)
+    return summary
+
+
+def last_run():
+    """Summary of the most recent run in any process, if the cache is shared."""
+    return cache.get(LAST_RUN_KEY)
+
+
+def last_run_metrics():
+    """/metrics collector: the expire_profiles command runs in its own process, so report its cached summary."""
+    summary = last_run()
+    if summary is None:
+        return []
+    return [
+        ('profile_expiry_last_run_deactivated', 'gauge', 'Profiles deactivated by the last expiry run.',
+         [({}, summary['deactivated'])]),
+        ('profile_expiry_last_run_duration_seconds', 'gauge', 'Duration of the last expiry run.',
+         [({}, summary['duration_ms'] / 1000)]),
+        ('profile_expiry_last_run_timestamp_seconds', 'gauge', 'When the last expiry run finished.',
+         [({}, datetime.fromisoformat(summary['finished_at']).timestamp())]),
+    ]
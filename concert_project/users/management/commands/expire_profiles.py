@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.expiry import expire_profiles
+
+
+class Command(BaseCommand):
+    help = "Deactivate every profile whose activation has expired, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        summary = expire_profiles(batch_size=options['batch_size'])
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
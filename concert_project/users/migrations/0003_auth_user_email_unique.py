@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """Fail with the offending addresses instead of an opaque index error."""
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias).exclude(email='')
+        .values('email').annotate(n=Count('id')).filter(n__gt=1)
+        .order_by('email').values_list('email', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "auth_user has accounts sharing an email address, so the unique email index "
+            f"cannot be created. Give these accounts distinct emails and migrate again: {', '.join(duplicates)}"
+        )
+
+
+class Migration(migrations.Migration):
+    """
+    auth_user.email is not unique in the stock model. Registration relies on this
+    index instead of an existence query; blank emails (e.g. createsuperuser) are exempt.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_userprofile_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX users_auth_user_email_uniq ON auth_user (email) WHERE email <> ''",
+            "DROP INDEX users_auth_user_email_uniq",
+        ),
+    ]
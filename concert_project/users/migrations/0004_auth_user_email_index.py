@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Plain index for the availability check's auth_user.email lookups: the partial
+    unique index from 0003 can't serve "email = %s" on SQLite.
+    """
+
+    dependencies = [
+        ('users', '0003_auth_user_email_unique'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX users_auth_user_email_idx ON auth_user (email)",
+            "DROP INDEX users_auth_user_email_idx",
+        ),
+    ]
@@ -4,6 +4,7 @@ import uuid
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
+from concert_project.images import variant_url
 
 
 class Genre(models.Model):
@@ -28,23 +29,43 @@ class UserProfile(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     nickname = models.CharField(max_length=100, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Resized WebP copies of profile_picture (see concert_project.images)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     favorite_genres = models.ManyToManyField(Genre, blank=True)
     mood_for_tonight = models.ForeignKey(Mood, on_delete=models.SET_NULL, null=True, blank=True)
     birth_date = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     activation_expires_at = models.DateTimeField(default=get_expiry_date)
 
+    class Meta:
+        indexes = [
+            # Expired-profile sweeps (users.expiry) only visit active profiles, so leave the rest out
+            models.Index(
+                fields=['activation_expires_at'],
+                condition=models.Q(is_active=True),
+                name='profile_active_expiry_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.nickname if self.nickname else self.user.username
 
-    def get_profile_picture_url(self):
+    def get_profile_picture_url(self, size=None):
+        # The smallest variant covering size, or the original until variants exist
         if self.profile_picture:
-            return f"{settings.SITE_DOMAIN}{self.profile_picture.url}"
+            url = variant_url(self, 'profile_picture', size or settings.PROFILE_PICTURE_SIZE)
+            return f"{settings.SITE_DOMAIN}{url}"
         return 'https://cdn.quasar.dev/img/avatar1.jpg'  # use a static default image
 
+    @property
+    def is_currently_active(self):
+        # Read-only: profiles past their expiry count as inactive before expire_profiles flips them
+        return self.is_active and not (self.activation_expires_at and timezone.now() > self.activation_expires_at)
+
     def deactivate_if_expired(self):
-        if self.is_active and self.activation_expires_at and timezone.now() > self.activation_expires_at:
+        # Deprecated: users.expiry.expire_profiles deactivates every expired profile in bulk
+        if self.is_active and not self.is_currently_active:
+            UserProfile.objects.filter(pk=self.pk).update(is_active=False)
             self.is_active = False
-            self.save()
 
     
\ No newline at end of file
@@ -1,15 +1,14 @@
-import os
-import uuid
+from django.conf import settings
 from django.contrib.auth.models import User
-import requests
 from rest_framework import serializers
 from .models import Genre, Mood, UserProfile
+from .avatars import queue_avatar_fetch
+from concert_project.images import srcset
 from urllib.request import urlopen, urlretrieve
-from django.core.files.base import ContentFile
 from datetime import date
 from django.db import transaction, IntegrityError
+from django.db.models import prefetch_related_objects
 from urllib.request import urlopen
-from django.db import IntegrityError
 
 # Genre Serializer
 class GenreSerializer(serializers.ModelSerializer):
@@ -30,8 +29,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     favorite_genres = GenreSerializer(many=True, read_only=True)
     mood_for_tonight = MoodSerializer(read_only=True)
     profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_srcset = serializers.SerializerMethodField()
     birth_date = serializers.DateField()
     uuid = serializers.UUIDField(read_only=True)
+    # Expired profiles read as inactive before expire_profiles flips the column
+    is_active = serializers.BooleanField(source='is_currently_active', read_only=True)
 
     class Meta:
         model = UserProfile
@@ -39,15 +41,20 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'id',
             'nickname',
             'profile_picture_url',
+            'profile_picture_srcset',
             'favorite_genres',
             'mood_for_tonight',
             'birth_date',
             'uuid',
+            'is_active',
         ]
 
     def get_profile_picture_url(self, obj):
         return obj.get_profile_picture_url()
 
+    def get_profile_picture_srcset(self, obj):
+        return srcset(obj, 'profile_picture', lambda url: f"{settings.SITE_DOMAIN}{url}")
+
 
 # Extended Register Serializer
 
@@ -66,16 +73,6 @@ class RegisterSerializer(serializers.Serializer):
     profile_picture = serializers.ImageField(required=False, allow_null=True)
     profile_picture_url = serializers.URLField(required=False, allow_blank=True)
 
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Email is already in use.")
-        return value
-
-    def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError("Username already taken.")
-        return value
-
     def validate_birth_date(self, value):
         today = date.today()
         age = today.year - value.year - ((today.month, today.day) < (value.month, value.day))
@@ -89,54 +86,70 @@ class RegisterSerializer(serializers.Serializer):
             raise serializers.ValidationError("Password too weak.")
         return value
 
+    # Mood and genres are validated by loading them, so the response can reuse the rows
     def validate_mood_for_tonight(self, value):
-        if not Mood.objects.filter(pk=value).exists():
+        mood = Mood.objects.filter(pk=value).first()
+        if mood is None:
             raise serializers.ValidationError("Invalid mood ID.")
-        return value
+        return mood
 
     def validate_favorite_genres(self, value):
-        genres = Genre.objects.filter(pk__in=value)
-        if genres.count() != len(value):
+        ids = list(dict.fromkeys(value))
+        genres = {genre.pk: genre for genre in Genre.objects.filter(pk__in=ids)}
+        if len(genres) != len(ids):
             raise serializers.ValidationError("One or more genre IDs are invalid.")
-        return value
+        return [genres[pk] for pk in ids]
 
     def create(self, validated_data):
-        # extragere câmpuri speciale
+        """
+        One transaction, one INSERT per table. Username and email uniqueness are left
+        to the database (auth_user's unique username and users_auth_user_email_uniq);
+        a violation comes back as the same validation error the pre-checks gave.
+        """
         profile_picture = validated_data.pop("profile_picture", None)
         profile_picture_url = validated_data.pop("profile_picture_url", None)
         favorite_genres = validated_data.pop("favorite_genres", [])
-        mood_id = validated_data.pop("mood_for_tonight", None)
-
-        # creare user
-        user = User.objects.create_user(
-            username=validated_data["username"],
-            email=validated_data["email"],
-            password=validated_data["password"]
-        )
-
-        # profilul este deja creat de semnal → doar îl completăm
-        profile = user.profile
-        profile.nickname = validated_data.get("nickname", "")
-        profile.birth_date = validated_data["birth_date"]
-        if mood_id:
-            profile.mood_for_tonight_id = mood_id
-
-        if profile_picture:
-            profile.profile_picture = profile_picture
-        elif profile_picture_url:
-            try:
-                response = requests.get(profile_picture_url)
-                response.raise_for_status()
-                ext = os.path.splitext(profile_picture_url)[-1] or ".jpg"
-                filename = f"{uuid.uuid4()}{ext}"
-                profile.profile_picture.save(filename, ContentFile(response.content))
-            except Exception as e:
-                print("⚠️ Failed to download avatar:", e)
-
-        profile.favorite_genres.set(favorite_genres)
-        profile.save()
+
+        try:
+            with transaction.atomic():
+                user = User(username=validated_data["username"], email=validated_data["email"])
+                user.set_password(validated_data["password"])
+                # The profile is inserted below with all its fields, not empty by the signal
+                user.skip_profile_signal = True
+                user.save()
+
+                profile = UserProfile.objects.create(
+                    user=user,
+                    nickname=validated_data.get("nickname", ""),
+                    birth_date=validated_data["birth_date"],
+                    mood_for_tonight=validated_data.get("mood_for_tonight"),
+                    profile_picture=profile_picture,
+                )
+                Through = UserProfile.favorite_genres.through
+                Through.objects.bulk_create([
+                    Through(userprofile_id=profile.pk, genre_id=genre.pk) for genre in favorite_genres
+                ])
+        except IntegrityError as e:
+            raise serializers.ValidationError(unique_violation(e)) from e
+
+        # Load favorite_genres once for the response, as UserProfileSerializer reads it
+        prefetch_related_objects([profile], 'favorite_genres')
+
+        if profile_picture_url and not profile_picture:
+            # Downloaded in the background; the default avatar shows until then
+            queue_avatar_fetch(profile, profile_picture_url)
         return user
-    
+
+
+def unique_violation(error):
+    """Field errors for a unique constraint failure on auth_user."""
+    message = str(error)
+    if 'email' in message:
+        return {'email': ["Email is already in use."]}
+    if 'username' in message:
+        return {'username': ["Username already taken."]}
+    return {'non_field_errors': ["Registration failed, please try again."]}
+
 # User Serializer (basic)
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer()
@@ -1,9 +1,49 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from concert_project.images import queue_variants
+from concert_project.lookup_cache import invalidate_lookup_model
+from .authentication import invalidate_user
+from .availability import mark_taken, forget_taken
+from .models import Genre, Mood, UserProfile
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+    # RegisterSerializer creates the profile itself, fully populated
+    if created and not getattr(instance, 'skip_profile_signal', False):
         UserProfile.objects.create(user=instance)
+
+
+# Bump the cached lookup versions served by GenreListView/MoodListView
+for model in (Genre, Mood):
+    post_save.connect(invalidate_lookup_model, sender=model, dispatch_uid=f'lookup-save-{model._meta.label}')
+    post_delete.connect(invalidate_lookup_model, sender=model, dispatch_uid=f'lookup-delete-{model._meta.label}')
+
+
+# Cached authenticated users (see users.authentication) carry their profile
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def build_profile_picture_variants(sender, instance, **kwargs):
+    queue_variants(instance, 'profile_picture')
+
+
+# Availability answers (see users.availability)
+@receiver(post_save, sender=User)
+def mark_username_taken(sender, instance, **kwargs):
+    mark_taken(instance)
+
+
+@receiver(post_delete, sender=User)
+def forget_username_taken(sender, instance, **kwargs):
+    forget_taken(instance)
@@ -1,3 +1,400 @@
-from django.test import TestCase
+import pickle
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import timedelta
+from io import BytesIO, StringIO
+from operator import attrgetter
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from concert_project.query_budget import QueryBudgetMixin
+from .authentication import CookieJWTAuthentication
+from .availability import BloomFilter, rebuild_taken_filter, reset_taken_filter, taken_filter
+from .avatars import fetch_avatar
+from .expiry import EXPIRY_STATS, expire_profiles, last_run
+from .serializers import UserProfileSerializer
+from .models import Genre, Mood, UserProfile
+
+
+def register_payload(test):
+    return {
+        'email': 'new@example.com',
+        'username': 'newcomer',
+        'password': 'Secret123!',
+        'nickname': 'New',
+        'birth_date': '1990-01-01',
+        'mood_for_tonight': test.mood.pk,
+        'favorite_genres': [genre.pk for genre in test.genres],
+    }
+
+
+class UsersQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    budget_urlconf = 'users.urls'
+    budget_user_factory = attrgetter('user')
+    query_budgets = {
+        'register': {'method': 'post', 'data': register_payload, 'budget': 8},
+        'login': {'method': 'post', 'data': {'username': 'budget', 'password': 'Secret123!'}, 'budget': 2},
+        'logout': {'method': 'post', 'authenticated': True, 'budget': 1},
+        'user-me': {'authenticated': True, 'budget': 2},
+        'profile-me': {'authenticated': True, 'budget': 2},
+        'check-email': {'method': 'post', 'data': {'email': 'budget@example.com'}, 'budget': 1},
+        'check-username': {'method': 'post', 'data': {'username': 'budget'}, 'budget': 1},
+        'check-availability': {'method': 'post', 'data': {'username': 'budget', 'email': 'free@example.com'}, 'budget': 1},
+        'genres': {'budget': 1},
+        'moods': {'budget': 1},
+        'profile': {'authenticated': True, 'budget': 2},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'Secret123!')
+        cls.mood = Mood.objects.create(name='Chill')
+        cls.genres = [Genre.objects.create(name=name) for name in ('House', 'Jazz', 'Rock')]
+        cls.user.profile.favorite_genres.set(cls.genres)
+
+    def setUp(self):
+        # Steady state: the per-process Bloom filter is built once, not per request
+        rebuild_taken_filter()
+
+
+class RegistrationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mood = Mood.objects.create(name='Chill')
+        cls.genres = [Genre.objects.create(name=f'Genre {i}') for i in range(10)]
+        User.objects.create_user('taken', 'taken@example.com', 'Secret123!')
+
+    def register(self, **overrides):
+        return self.client.post('/api/auth/register/', {**register_payload(self), **overrides})
+
+    def test_query_count_does_not_grow_with_genres(self):
+        counts = []
+        for i, genres in enumerate((self.genres[:1], self.genres)):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.register(
+                    username=f'user{i}', email=f'user{i}@example.com', favorite_genres=[g.pk for g in genres],
+                )
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(ctx.captured_queries))
+            # Registration logs the client in; start the next one anonymous again
+            self.client.cookies.clear()
+        # mood + genres lookups, one INSERT per table (plus the test's savepoint pair),
+        # then the genres read back for the response
+        self.assertEqual(counts, [8, 8])
+
+        profile = User.objects.get(username='user1').profile
+        self.assertEqual(profile.mood_for_tonight, self.mood)
+        self.assertEqual(set(profile.favorite_genres.all()), set(self.genres))
+        self.assertEqual(len(response.json()['user']['profile']['favorite_genres']), 10)
+
+    def test_duplicates_are_rejected_by_the_database(self):
+        for field, value, message in (
+            ('username', 'taken', "Username already taken."),
+            ('email', 'taken@example.com', "Email is already in use."),
+        ):
+            response = self.register(**{field: value})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {field: [message]})
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.count(), 1)
+
+
+class CachedAuthenticationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cached', 'cached@example.com', 'Secret123!')
+
+    def setUp(self):
+        cache.clear()
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.client.cookies['access'] = str(self.token)
+
+    def test_warm_requests_skip_the_user_and_profile_queries(self):
+        self.client.get('/api/auth/me/')
+        # Only the serializer's favorite_genres query is left
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/me/')
+        self.assertEqual(response.json()['username'], 'cached')
+        with self.assertNumQueries(1):
+            self.client.get('/api/auth/profile-me/')
+
+    def test_saving_user_or_profile_invalidates(self):
+        self.client.get('/api/auth/me/')
+        self.user.email = 'changed@example.com'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/me/').json()['email'], 'changed@example.com')
+
+        profile = self.user.profile
+        profile.nickname = 'Night owl'
+        profile.save()
+        self.assertEqual(self.client.get('/api/auth/profile-me/').json()['nickname'], 'Night owl')
+
+    def test_logout_drops_the_cached_entry(self):
+        self.client.get('/api/auth/me/')
+        auth = CookieJWTAuthentication()
+        self.client.post('/api/auth/logout/')
+        with self.assertNumQueries(1):
+            auth.get_user(self.token)
+
+    def test_cached_entries_leave_the_password_out(self):
+        self.client.get('/api/auth/me/')
+        cached = pickle.dumps(cache.get(f'auth:user:{self.user.pk}:{self.token["jti"]}'))
+        self.assertNotIn(self.user.password.encode(), cached)
+
+        user = CookieJWTAuthentication().get_user(self.token)
+        self.assertEqual((user.pk, user.username, user.profile.user), (self.user.pk, 'cached', user))
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('Secret123!'))
+
+
+def png_bytes(size=(8, 8)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class StubAvatarHandler(BaseHTTPRequestHandler):
+    """/avatar.png is an image, /page is HTML, /huge is too big, /flaky fails until its third hit."""
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path == '/flaky' and self.hits.count('/flaky') < 3:
+            return self.reply(503, 'text/plain', b'busy')
+        if self.path in ('/avatar.png', '/flaky'):
+            return self.reply(200, 'image/png', png_bytes())
+        if self.path == '/huge':
+            return self.reply(200, 'image/png', b'0' * 4096)
+        if self.path == '/page':
+            return self.reply(200, 'text/html', b'<html></html>')
+        self.reply(404, 'text/plain', b'')
+
+    def reply(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, AVATAR_FETCH_TIMEOUT=2, AVATAR_MAX_BYTES=1024)
+class AvatarFetchTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubAvatarHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.media = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+        cls.media.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('avatar', 'avatar@example.com', 'Secret123!')
+        cls.mood = Mood.objects.create(name='Chill')
+        cls.genres = [Genre.objects.create(name='House')]
+
+    def setUp(self):
+        StubAvatarHandler.hits.clear()
+
+    def test_registration_responds_before_the_avatar_is_fetched(self):
+        data = {**register_payload(self), 'profile_picture_url': f'{self.base_url}/avatar.png'}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/register/', data)
+            self.assertEqual(StubAvatarHandler.hits, [])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['user']['profile']['profile_picture_url'], 'https://cdn.quasar.dev/img/avatar1.jpg')
+
+        profile = User.objects.get(username='newcomer').profile
+        self.assertTrue(profile.profile_picture.name.endswith('.png'))
+
+    def test_rejected_downloads_keep_the_default_avatar(self):
+        profile = self.user.profile
+        for path in ('/page', '/huge', '/missing'):
+            self.assertFalse(fetch_avatar(profile.pk, f'{self.base_url}{path}'))
+        self.assertFalse(fetch_avatar(profile.pk, 'file:///etc/passwd'))
+        profile.refresh_from_db()
+        self.assertFalse(profile.profile_picture)
+        # 4xx, bad content type and oversize answers are not retried
+        self.assertEqual(StubAvatarHandler.hits, ['/page', '/huge', '/missing'])
+
+    @override_settings(AVATAR_FETCH_RETRIES=2)
+    def test_server_errors_are_retried(self):
+        self.assertTrue(fetch_avatar(self.user.profile.pk, f'{self.base_url}/flaky'))
+        self.assertEqual(StubAvatarHandler.hits, ['/flaky'] * 3)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ImageVariantTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.cleanup()
+
+    def upload(self, profile, size):
+        profile.profile_picture = SimpleUploadedFile('me.png', png_bytes(size), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        profile.refresh_from_db()
+
+    def test_variants_are_built_on_upload_and_replaced_with_the_picture(self):
+        profile = User.objects.create_user('pictured', 'pictured@example.com', 'Secret123!').profile
+        self.upload(profile, (600, 300))
+
+        webp = profile.profile_picture_variants['variants']['image/webp']
+        self.assertEqual([width for width, _ in webp], [64, 256, 600])
+        with default_storage.open(webp[0][1]) as variant:
+            self.assertEqual(Image.open(variant).size, (64, 32))
+        self.assertRegex(profile.get_profile_picture_url(48), r'/media/variants/profile_pics/me\.[0-9a-f]{12}\.64\.webp$')
+        self.assertTrue(profile.get_profile_picture_url().endswith('.256.webp'))
+        srcset = UserProfileSerializer(profile).data['profile_picture_srcset']['image/webp']
+        self.assertEqual(srcset.count('w, '), 2)
+
+        self.upload(profile, (100, 100))
+        self.assertFalse(default_storage.exists(webp[0][1]))
+        self.assertEqual([w for w, _ in profile.profile_picture_variants['variants']['image/webp']], [64, 100])
+
+
+@override_settings(AVAILABILITY_THROTTLE_BURST=5, AVAILABILITY_THROTTLE_RATE=1)
+class AvailabilityTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('taken', 'taken@example.com', 'Secret123!')
+
+    def setUp(self):
+        cache.clear()
+        reset_taken_filter()
+        rebuild_taken_filter()
+
+    def check(self, **data):
+        return self.client.post('/api/auth/check-availability/', data)
+
+    def test_free_names_are_answered_by_the_bloom_filter(self):
+        with self.assertNumQueries(0):
+            response = self.check(username='fresh', email='fresh@example.com')
+        self.assertEqual(response.json(), {'available': {'username': True, 'email': True}})
+
+    def test_taken_answers_are_cached_until_the_user_is_deleted(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.check(username='taken').json(), {'available': {'username': False}})
+        with self.assertNumQueries(0):
+            self.assertFalse(self.client.post('/api/auth/check-username/', {'username': 'taken'}).json()['available'])
+
+        User.objects.get(username='taken').delete()
+        self.assertTrue(self.check(username='taken').json()['available']['username'])
+
+    def test_new_users_are_added_to_the_filter_on_commit(self):
+        self.assertTrue(self.check(email='late@example.com').json()['available']['email'])
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('late', 'late@example.com', 'Secret123!')
+            self.assertNotIn('email:late@example.com', taken_filter())
+        self.assertFalse(self.check(email='late@example.com').json()['available']['email'])
+
+    def test_stale_filter_is_served_while_it_rebuilds(self):
+        queued = []
+        with mock.patch('users.availability.submit', side_effect=queued.append):
+            with override_settings(AVAILABILITY_BLOOM_MAX_AGE=0), self.assertNumQueries(0):
+                old = taken_filter()
+                self.assertIs(taken_filter(), old)
+            # One rebuild is queued, however many requests find the filter stale
+            self.assertEqual(queued, [rebuild_taken_filter])
+            User.objects.create_user('midway', 'midway@example.com', 'Secret123!')
+            queued[0]()
+        fresh = taken_filter()
+        self.assertIsNot(fresh, old)
+        self.assertIn('email:midway@example.com', fresh)
+
+    def test_token_bucket_throttles_per_ip(self):
+        statuses = [self.check(username=f'u{i}').status_code for i in range(7)]
+        self.assertEqual(statuses, [200] * 5 + [429] * 2)
+        response = self.check(username='x')
+        self.assertGreater(int(response['Retry-After']), 0)
+        other = self.client.post('/api/auth/check-availability/', {'username': 'x'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 200)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        members = [f'user{i}' for i in range(1000)]
+        for member in members:
+            bloom.add(member)
+        self.assertTrue(all(member in bloom for member in members))
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class ProfileExpiryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        past = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            user = User.objects.create_user(f'old{i}', f'old{i}@example.com', 'Secret123!')
+            UserProfile.objects.filter(user=user).update(activation_expires_at=past)
+        self.current = User.objects.create_user('current', 'current@example.com', 'Secret123!')
+
+    def test_expired_profiles_are_deactivated_in_batches(self):
+        before = EXPIRY_STATS.copy()
+        # Two full batches and a short one, then one UPDATE that finds nothing
+        with self.assertNumQueries(4):
+            summary = expire_profiles(batch_size=2)
+        self.assertEqual((summary['deactivated'], summary['batches']), (5, 3))
+        self.assertEqual(UserProfile.objects.filter(is_active=False).count(), 5)
+        self.assertTrue(UserProfile.objects.get(user=self.current).is_active)
+        self.assertEqual(EXPIRY_STATS['deactivated'] - before['deactivated'], 5)
+        self.assertEqual(last_run()['deactivated'], 5)
+
+        self.assertEqual(expire_profiles()['deactivated'], 0)
+
+    def test_command_reports_the_run(self):
+        out = StringIO()
+        call_command('expire_profiles', stdout=out)
+        self.assertIn('deactivated: 5', out.getvalue())
+
+    def test_expired_profile_reads_as_inactive_without_writing(self):
+        profile = UserProfile.objects.get(user__username='old0')
+        with self.assertNumQueries(0):
+            self.assertFalse(profile.is_currently_active)
+        self.assertTrue(UserProfile.objects.get(pk=profile.pk).is_active)
+        self.assertTrue(self.current.profile.is_currently_active)
+        self.assertFalse(UserProfileSerializer(profile).data['is_active'])
+
+    def test_expired_profiles_cannot_authenticate(self):
+        response = self.client.post('/api/auth/login/', {'username': 'old0', 'password': 'Secret123!'})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.cookies['access'] = str(RefreshToken.for_user(self.current).access_token)
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 200)
+        # The cached user is re-checked on every request, so expiry needs no write to take effect
+        later = self.current.profile.activation_expires_at + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later), self.assertNumQueries(0):
+            response = self.client.get('/api/auth/me/')
+        self.assertIn(response.status_code, (401, 403))
@@ -3,6 +3,7 @@ from .views import (
     RegisterView,
     CheckEmailView,
     CheckUsernameView,
+    CheckAvailabilityView,
     GenreListView,
     MoodListView,
     UserProfileDetailView,
@@ -20,6 +21,7 @@ urlpatterns = [
     path('auth/profile-me/', UserProfileMeView.as_view(), name='profile-me'),
     path('auth/check-email/', CheckEmailView.as_view(), name='check-email'),
     path('auth/check-username/', CheckUsernameView.as_view(), name='check-username'),
+    path('auth/check-availability/', CheckAvailabilityView.as_view(), name='check-availability'),
     path('genres/', GenreListView.as_view(), name='genres'),
     path('moods/', MoodListView.as_view(), name='moods'),
     path('profile/', UserProfileDetailView.as_view(), name='profile'),
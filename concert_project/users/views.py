@@ -9,6 +9,9 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from .models import Genre, Mood
 from .serializers import GenreSerializer, MoodSerializer, UserSerializer, UserProfileSerializer
 from rest_framework import status
+from concert_project.lookup_cache import cached_lookup
+from .authentication import forget_token, profile_is_active
+from .availability import is_available, TokenBucketThrottle
 from .serializers import RegisterSerializer, UserSerializer
 
 
@@ -19,6 +22,8 @@ class CookieLoginView(APIView):
         username = request.data.get("username")
         password = request.data.get("password")
         user = authenticate(username=username, password=password)
+        if user is not None and not profile_is_active(user):
+            return Response({"error": "Profile is inactive"}, status=403)
         if user is not None:
             refresh = RefreshToken.for_user(user)
             res = Response({"message": "Login successful"})
@@ -46,6 +51,8 @@ class CookieLoginView(APIView):
 
 class LogoutView(APIView):
     def post(self, request):
+        if request.auth is not None:
+            forget_token(request.auth)
         res = Response({"message": "Logged out"})
         res.delete_cookie('access')
         res.delete_cookie('refresh')
@@ -104,27 +111,44 @@ class RegisterView(APIView):
     
 class CheckEmailView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
 
     def post(self, request):
-        email = request.data.get("email")
-        exists = User.objects.filter(email=email).exists()
-        return Response({"available": not exists})
+        email = request.data.get("email") or ""
+        return Response({"available": is_available('email', email)})
 
 
 
 class CheckUsernameView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
 
     def post(self, request):
-        username = request.data.get("username")
-        exists = User.objects.filter(username=username).exists()
-        return Response({"available": not exists})
+        username = request.data.get("username") or ""
+        return Response({"available": is_available('username', username)})
+
+
+# Both checks in one round trip: {"available": {"username": true, "email": false}}
+class CheckAvailabilityView(APIView):
+    permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+
+    def post(self, request):
+        answers = {
+            field: is_available(field, str(request.data[field]))
+            for field in ('username', 'email')
+            if request.data.get(field) is not None
+        }
+        if not answers:
+            return Response({"error": "Give a username and/or an email."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"available": answers})
 
 
 
 class GenreListView(APIView):
     permission_classes = [AllowAny]
 
+    @cached_lookup(Genre)
     def get(self, request):
         genres = Genre.objects.all()
         serializer = GenreSerializer(genres, many=True)
@@ -134,6 +158,7 @@ class GenreListView(APIView):
 class MoodListView(APIView):
     permission_classes = [AllowAny]
 
+    @cached_lookup(Mood)
     def get(self, request):
         moods = Mood.objects.all()
         serializer = MoodSerializer(moods, many=True)